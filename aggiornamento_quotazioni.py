@@ -0,0 +1,407 @@
+#aggiornamento periodico delle quotazioni per la tabella degli investimenti
+#una centrale sola per tutte le viste: le quotazioni si chiedono a lotti, senza duplicati, fuori dal thread di Tk;
+#alle tabelle arrivano solo le righe cambiate
+#uso (prova offline con prezzi finti):  python aggiornamento_quotazioni.py simula [giri]
+
+import sys
+import threading
+import time
+from datetime import datetime, time as ora_del_giorno
+
+from cambi import VALUTA_BASE, cambi as tassi_cambio, formatta_importo, simbolo
+from quotazioni import recupera_quotazioni_fresche
+
+INTERVALLO = 30  # secondi tra un aggiornamento e l'altro a mercato aperto
+INTERVALLO_CHIUSO = 600  # a mercato chiuso si controlla solo quando riapre
+
+# i titoli in portafoglio sono quotati a New York
+FUSO_MERCATO = "America/New_York"
+APERTURA = ora_del_giorno(9, 30)
+CHIUSURA = ora_del_giorno(16, 0)
+
+
+class OrariMercato:
+    """Giorni e orari di contrattazione, nel fuso orario della borsa (festività escluse)."""
+
+    def __init__(self, fuso=FUSO_MERCATO, apertura=APERTURA, chiusura=CHIUSURA, giorni=(0, 1, 2, 3, 4)):
+        try:
+            from zoneinfo import ZoneInfo
+            self.fuso = ZoneInfo(fuso) if fuso else None
+        except Exception:
+            # senza il database dei fusi (tzdata su Windows) si usa l'ora locale
+            print(f"Fuso orario {fuso} non disponibile, uso l'ora locale")
+            self.fuso = None
+        self.apertura = apertura
+        self.chiusura = chiusura
+        self.giorni = frozenset(giorni)
+
+    def aperto(self, adesso=None):
+        adesso = adesso or datetime.now(self.fuso)
+        if self.fuso is not None and adesso.tzinfo is not None:
+            adesso = adesso.astimezone(self.fuso)
+        return adesso.weekday() in self.giorni and self.apertura <= adesso.time() < self.chiusura
+
+
+class SempreAperto(OrariMercato):
+    """Per le prove: il mercato non chiude mai."""
+
+    def __init__(self):
+        super().__init__(fuso=None)
+
+    def aperto(self, adesso=None):
+        return True
+
+
+def formatta_riga(ticker, quantita, quotazione, valore=None):
+    """Valori della riga in tabella (Ticker, Quantità, Valore, Variazione 1D) e valore nella valuta base.
+
+    valore è il controvalore già convertito (NaN se manca il cambio: la riga resta nella valuta del
+    titolo e non entra nel totale); se non dato si usa prezzo * quantità. Il secondo elemento è None
+    se la riga non va sommata.
+    """
+    if quotazione is None or quotazione.get("prezzo") is None:
+        return (ticker, f"{quantita}", "Errore", "N/D"), None
+    prezzo = quotazione["prezzo"]
+    precedente = quotazione.get("precedente")
+    variazione = (prezzo - precedente) / precedente * 100 if precedente else 0
+    locale = quantita * prezzo
+    if valore is None:
+        valore = locale
+    if valore != valore:  # NaN
+        return (ticker, f"{quantita}", formatta_importo(locale, quotazione.get("valuta")), f"{variazione:+.2f}%"), None
+    return (ticker, f"{quantita}", formatta_importo(valore), f"{variazione:+.2f}%"), valore
+
+def formatta_totale(totale):
+    return f"Valore Totale: {simbolo(VALUTA_BASE)}{totale:,.2f}"
+
+
+class Differenze:
+    """Cosa cambiare in tabella dopo un giro: righe nuove o cambiate, righe da togliere, totale (None se uguale)."""
+
+    def __init__(self, righe=None, rimosse=None, totale=None, aperto=True, istante=None):
+        self.righe = righe or {}  # ticker -> valori della riga
+        self.rimosse = rimosse or []
+        self.totale = totale
+        self.aperto = aperto
+        self.istante = istante  # None se in questo giro non si è chiesto nulla al fornitore
+
+    def vuota(self):
+        return not self.righe and not self.rimosse and self.totale is None
+
+
+class ConfrontoRighe:
+    """Ricorda le righe e il totale come sono in tabella e ritorna solo quelle da cambiare."""
+
+    def __init__(self):
+        self._mostrate = {}  # ticker -> valori della riga come sono in tabella
+        self._totale_mostrato = None
+
+    def confronta(self, righe, totale=None, aperto=True, istante=None):
+        cambiate = {t: v for t, v in righe.items() if self._mostrate.get(t) != v}
+        rimosse = [t for t in self._mostrate if t not in righe]
+        for ticker in rimosse:
+            del self._mostrate[ticker]
+        self._mostrate.update(cambiate)
+        if totale == self._totale_mostrato:
+            totale = None
+        else:
+            self._totale_mostrato = totale
+        return Differenze(cambiate, rimosse, totale, aperto, istante)
+
+
+class Iscrizione:
+    def __init__(self, tickers, ricevi, in_errore=None):
+        self.tickers = tickers  # funzione: ticker da seguire, richiamata a ogni giro
+        self.ricevi = ricevi  # ricevi(quotazioni, aperto, istante) sul thread di Tk
+        self.in_errore = in_errore
+
+
+class CentraleQuotazioni:
+    """Un solo ciclo di aggiornamento per tutte le viste aperte (investimenti, watchlist, avvisi).
+
+    Ogni vista si iscrive con i suoi ticker; a ogni giro si chiede al fornitore l'unione senza
+    duplicati (è il fornitore a dividerla in lotti) e ogni vista riceve le quotazioni. Un ticker
+    posseduto e osservato insieme si chiede quindi una volta sola per giro. Il ciclo si ferma
+    quando non resta nessun iscritto.
+    """
+
+    def __init__(self, recupera=recupera_quotazioni_fresche, intervallo=INTERVALLO,
+                 intervallo_chiuso=INTERVALLO_CHIUSO, orari=None, cambi=None):
+        self.recupera = recupera
+        self.cambi = cambi or tassi_cambio
+        self.intervallo = intervallo
+        self.intervallo_chiuso = intervallo_chiuso
+        self.orari = orari or OrariMercato()
+
+        self._lock = threading.Lock()  # protegge _quotazioni e _aperto_prima
+        self._quotazioni = {}  # ultima quotazione valida per ticker: un errore temporaneo non svuota la riga
+        self._aperto_prima = None  # None: nessun giro ancora fatto
+        self._iscrizioni = []
+        self._radice = None
+        self._timer = None
+        self._in_corso = False
+        self._ripeti = False  # nuovi iscritti arrivati durante un giro
+
+    # --- iscrizioni ---
+
+    def iscrivi(self, widget, tickers, ricevi, in_errore=None):
+        """Iscrive una vista legata a `widget`: alla sua distruzione l'iscrizione si toglie da sola."""
+        iscrizione = Iscrizione(tickers, ricevi, in_errore)
+        self._iscrizioni.append(iscrizione)
+
+        def distrutto(event):
+            if event.widget is widget:
+                self.disiscrivi(iscrizione)
+
+        widget.bind("<Destroy>", distrutto, add="+")
+        if self._radice is None:
+            self._radice = widget.nametowidget(".")  # la finestra principale vive quanto l'app
+
+        if self._timer is None and not self._in_corso:
+            iscrizione.ricevi(self._istantanea(), self.orari.aperto(), None)
+            self._prossimo()
+        else:
+            self.richiedi(iscrizione)
+        return iscrizione
+
+    def richiedi(self, iscrizione):
+        """Da chiamare quando i ticker di un iscritto cambiano: riceve subito i prezzi già noti,
+        quelli mai visti si chiedono con un giro anticipato."""
+        quotazioni = self._istantanea()
+        iscrizione.ricevi(quotazioni, self.orari.aperto(), None)
+        if any(t.upper() not in quotazioni for t in iscrizione.tickers()):
+            self._anticipa()
+
+    def _istantanea(self):
+        with self._lock:
+            return dict(self._quotazioni)
+
+    def precarica(self, quotazioni):
+        """Quotazioni già in mano (es. quelle in cache all'apertura) da mostrare prima del primo giro."""
+        with self._lock:
+            for ticker, quotazione in quotazioni.items():
+                if quotazione is not None:
+                    self._quotazioni.setdefault(ticker.upper(), quotazione)
+
+    def disiscrivi(self, iscrizione):
+        if iscrizione in self._iscrizioni:
+            self._iscrizioni.remove(iscrizione)
+        if not self._iscrizioni:
+            self.ferma()
+
+    def tickers(self):
+        """Unione senza duplicati dei ticker di tutti gli iscritti."""
+        tickers = {}
+        for iscrizione in self._iscrizioni:
+            tickers.update(dict.fromkeys(t.upper() for t in iscrizione.tickers()))
+        return list(tickers)
+
+    # --- giro ---
+
+    def giro(self, tickers, adesso=None):
+        """Chiede al fornitore ciò che serve per `tickers`; ritorna (quotazioni, aperto, istante).
+
+        Gira fuori dal thread di Tk. A mercato chiuso i prezzi non si muovono: si chiede tutto
+        solo al primo giro e subito dopo la chiusura (per avere la chiusura del giorno), poi
+        solo i ticker mai visti.
+        """
+        # il lock protegge solo la memoria delle quotazioni: la rete si chiama senza tenerlo,
+        # così precarica() e richiedi() (thread di Tk) non aspettano mai un fornitore lento
+        aperto = self.orari.aperto(adesso)
+        with self._lock:
+            if aperto or self._aperto_prima in (None, True):
+                da_chiedere = list(tickers)
+            else:
+                da_chiedere = [t for t in tickers if t not in self._quotazioni]
+        istante = None
+        ricevute = {}
+        if da_chiedere:
+            ricevute = self.recupera(da_chiedere)
+            istante = time.time()
+        with self._lock:
+            self._aperto_prima = aperto  # solo dopo un recupero riuscito
+            for ticker, quotazione in ricevute.items():
+                if quotazione is not None:
+                    self._quotazioni[ticker] = quotazione
+            # i ticker che nessuno segue più escono dalla memoria
+            for ticker in set(self._quotazioni) - set(tickers):
+                del self._quotazioni[ticker]
+            quotazioni = dict(self._quotazioni)
+        if istante is not None:
+            # i tassi scaduti si aggiornano qui, fuori dal thread di Tk, che poi li legge senza rete
+            try:
+                self.cambi.tassi({q.get("valuta") for q in quotazioni.values()})
+            except Exception as e:
+                print(f"Errore nell'aggiornamento dei cambi: {e}")
+        return quotazioni, aperto, istante
+
+    def consegna(self, risultato):
+        """Passa il risultato di un giro a tutti gli iscritti (thread di Tk)."""
+        quotazioni, aperto, istante = risultato
+        for iscrizione in list(self._iscrizioni):
+            try:
+                iscrizione.ricevi(quotazioni, aperto, istante)
+            except Exception as e:
+                print(f"Errore nell'aggiornare una vista delle quotazioni: {e}")
+
+    def giro_completo(self, adesso=None):
+        """giro() e consegna() di seguito, senza Tk: per le prove e gli script."""
+        self.consegna(self.giro(self.tickers(), adesso))
+
+    def prossima_attesa(self, adesso=None):
+        """Secondi fino al prossimo giro."""
+        return self.intervallo if self.orari.aperto(adesso) else self.intervallo_chiuso
+
+    # --- ciclo sul thread di Tk ---
+
+    def _prossimo(self):
+        from utils.attivita import esegui
+
+        self._timer = None
+        if not self._iscrizioni or self._radice is None:
+            return
+        self._in_corso = True
+        esegui(self._radice, self.giro, self.tickers(), al_termine=self._terminato, in_errore=self._fallito)
+
+    def _terminato(self, risultato):
+        self._in_corso = False
+        self.consegna(risultato)
+        self._pianifica()
+
+    def _fallito(self, errore):
+        self._in_corso = False
+        for iscrizione in list(self._iscrizioni):
+            if iscrizione.in_errore is not None:
+                iscrizione.in_errore(errore)
+        print(f"Aggiornamento quotazioni non riuscito: {errore}")
+        self._pianifica()
+
+    def _pianifica(self):
+        if not self._iscrizioni or self._radice is None:
+            return
+        if self._ripeti:
+            self._ripeti = False
+            self._prossimo()
+            return
+        self._timer = self._radice.after(int(self.prossima_attesa() * 1000), self._prossimo)
+
+    def _anticipa(self):
+        # ticker mai visti: il giro parte subito invece di aspettare
+        if self._in_corso:
+            self._ripeti = True
+            return
+        if self._timer is not None:
+            self._radice.after_cancel(self._timer)
+            self._timer = None
+        self._prossimo()
+
+    def ferma(self):
+        if self._timer is not None and self._radice is not None:
+            try:
+                self._radice.after_cancel(self._timer)
+            except Exception:
+                pass  # applicazione già chiusa
+        self._timer = None
+
+
+class AggiornatoreQuotazioni:
+    """Righe della tabella investimenti (Ticker, Quantità, Valore, Variazione 1D) a ogni giro della centrale.
+
+    posizioni() ritorna {ticker: quantità} e si richiama a ogni giro, così acquisti e vendite
+    fatti con la finestra aperta entrano al giro successivo.
+    """
+
+    def __init__(self, posizioni, centrale=None, cambi=None):
+        self.posizioni = posizioni
+        self.centrale = centrale
+        self.cambi = cambi
+        self._confronto = ConfrontoRighe()
+
+    def tickers(self):
+        return [t.upper() for t in self.posizioni()]
+
+    def ricevi(self, quotazioni, aperto=True, istante=None):
+        """Differenze rispetto alla tabella per le quotazioni ricevute.
+
+        I controvalori di tutta la tabella si convertono nella valuta base in un colpo solo,
+        con i tassi già in memoria (li aggiorna la centrale fuori dal thread di Tk).
+        """
+        posizioni = {t.upper(): q for t, q in self.posizioni().items()}
+        quotate = [t for t in posizioni if quotazioni.get(t) and quotazioni[t].get("prezzo") is not None]
+        convertiti = (self.cambi or tassi_cambio).converti(
+            [posizioni[t] * quotazioni[t]["prezzo"] for t in quotate],
+            [quotazioni[t].get("valuta") for t in quotate], rete=False)
+        valori = dict(zip(quotate, convertiti.tolist()))
+
+        righe, totale = {}, 0.0
+        for ticker, quantita in posizioni.items():
+            righe[ticker], valore = formatta_riga(ticker, quantita, quotazioni.get(ticker), valori.get(ticker))
+            if valore is not None:
+                totale += valore
+        return self._confronto.confronta(righe, formatta_totale(totale), aperto, istante)
+
+    def avvia(self, widget, applica, in_errore=None):
+        """Iscrive la tabella alla centrale; applica(differenze) gira sul thread di Tk.
+
+        Si ferma da solo quando il widget viene distrutto.
+        """
+        return (self.centrale or centrale).iscrivi(widget, self.tickers, lambda q, a, i: applica(self.ricevi(q, a, i)), in_errore)
+
+
+centrale = CentraleQuotazioni()
+
+
+def applica_a_tabella(tabella, etichetta_totale, differenze):
+    """Porta in un Treeview (iid = ticker) e nell'etichetta del totale (se c'è) solo ciò che è cambiato."""
+    for ticker in differenze.rimosse:
+        if tabella.exists(ticker):
+            tabella.delete(ticker)
+    for ticker, valori in differenze.righe.items():
+        if tabella.exists(ticker):
+            tabella.item(ticker, values=valori)
+        else:
+            tabella.insert("", "end", iid=ticker, values=valori)
+    if differenze.totale is not None and etichetta_totale is not None:
+        etichetta_totale.config(text=differenze.totale)
+
+
+def simula(giri=6):
+    """Giri di aggiornamento con prezzi finti, stampando cosa cambierebbe in tabella."""
+    from cambi import TassiCambio
+    from quotazioni import FornitoreScriptato
+
+    fornitore = FornitoreScriptato({
+        "AAA": [100.0, 101.5, 101.5, 99.0, 99.0, 99.0],
+        "BBB": [20.0, 20.0, 20.0, 20.0, 21.0, 21.0],
+        "CCC": [5.0, None, 5.25, 5.25, 5.25, 5.25],  # None: il fornitore non risponde
+    }, valute={"CCC": "USD"}, dimensione_lotto=2)
+    cambi = TassiCambio(percorso=None)  # tabella dei tassi solo in memoria, niente rete
+    cambi.memorizza({"USD": 0.9}, istante=None)
+    prova = CentraleQuotazioni(fornitore.recupera_quotazioni, orari=SempreAperto(), cambi=cambi)
+    posizioni = {"AAA": 10, "BBB": 3, "CCC": 40}
+    aggiornatore = AggiornatoreQuotazioni(lambda: posizioni, cambi=cambi)
+    risultati = []
+    prova._iscrizioni.append(Iscrizione(aggiornatore.tickers,
+                                        lambda q, a, i: risultati.append(aggiornatore.ricevi(q, a, i))))
+    for n in range(giri):
+        if n == 3:
+            posizioni.pop("BBB")  # venduto con la finestra aperta
+        prova.giro_completo()
+        differenze = risultati.pop()
+        print(f"giro {n + 1}:")
+        if differenze.vuota():
+            print("  nessuna modifica")
+        for valori in differenze.righe.values():
+            print("  riga   ", " | ".join(valori))
+        for ticker in differenze.rimosse:
+            print("  rimossa", ticker)
+        if differenze.totale is not None:
+            print("  totale ", differenze.totale)
+    print(f"{fornitore.richieste} richieste al fornitore")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "simula":
+        simula(int(sys.argv[2]) if len(sys.argv) > 2 else 6)
+    else:
+        print("Uso: python aggiornamento_quotazioni.py simula [giri]")
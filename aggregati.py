@@ -0,0 +1,181 @@
+#totali per mese x conto x categoria, aggiornati a ogni transazione registrata
+#verifica/ricostruzione dal ledger:  python aggregati.py verifica | ricostruisci
+
+import json
+import os
+import sys
+import threading
+
+from blocchi_file import aggiorna, blocca, incrementa_versione, leggi_versione
+from cambi import VALUTA_BASE, cambi, valute_conti
+from denaro import centesimi
+from storage import carica_transazioni
+
+FILE_AGGREGATI = "data/aggregati.json"
+
+_lock = threading.Lock()
+_aggregati = None  # copia in memoria di FILE_AGGREGATI
+_versione = None  # leggi_versione(FILE_AGGREGATI) quando è stata letta
+
+
+def _vuoti():
+    # somme in centesimi interi: sommando migliaia di importi non si accumulano errori
+    return {"transazioni": 0, "mesi": {}}
+
+def _aggiungi(aggregati, transazioni):
+    mesi = aggregati["mesi"]
+    for tr in transazioni:
+        mese = tr["data"][:7]
+        categoria = tr.get("categoria") or ""
+        voce = mesi.setdefault(mese, {}).setdefault(tr["conto"], {}).setdefault(categoria, [0, 0])
+        voce[0] += centesimi(tr["importo"])
+        voce[1] += 1
+        aggregati["transazioni"] += 1
+
+def _salva(aggregati):
+    tmp = f"{FILE_AGGREGATI}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(aggregati, f)
+    os.replace(tmp, FILE_AGGREGATI)
+
+def calcola(transazioni):
+    aggregati = _vuoti()
+    _aggiungi(aggregati, transazioni)
+    return aggregati
+
+def _leggi():
+    try:
+        with open(FILE_AGGREGATI, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def carica_aggregati():
+    """Totali correnti; si rileggono dal file solo se un altro processo l'ha riscritto."""
+    global _aggregati, _versione
+    with _lock:
+        versione = leggi_versione(FILE_AGGREGATI)
+        if _aggregati is None or versione != _versione:
+            _aggregati = _leggi()
+            _versione = versione
+        if _aggregati is None:
+            _ricostruisci_sotto_lock(controlla_file=True)
+        return _aggregati
+
+def _ricostruisci_sotto_lock(controlla_file=False):
+    # da chiamare con _lock tenuto: ricalcola i totali dal ledger e li salva
+    global _aggregati, _versione
+    with blocca(FILE_AGGREGATI):
+        if controlla_file:
+            # un altro processo potrebbe averlo appena creato
+            _aggregati = _leggi()
+            _versione = leggi_versione(FILE_AGGREGATI)
+            if _aggregati is not None:
+                return
+        _aggregati = calcola(carica_transazioni())
+        _salva(_aggregati)
+        _versione = incrementa_versione(FILE_AGGREGATI)
+
+
+class _FileMancante(Exception):
+    pass
+
+
+def registra(transazioni):
+    """Aggiunge ai totali le transazioni appena scritte nel ledger (chiamato da transazione_atomica)."""
+    if not transazioni:
+        return
+    global _aggregati, _versione
+    carica_aggregati()
+
+    def aggiungi(aggregati):
+        if aggregati is None:
+            raise _FileMancante()
+        _aggiungi(aggregati, transazioni)
+        return aggregati
+
+    # si riparte dal file, non dalla copia in memoria: altri processi possono aver registrato
+    # le loro transazioni nel frattempo (e in caso di conflitto aggiungi() viene ripetuta)
+    with _lock:
+        try:
+            _aggregati = aggiorna(FILE_AGGREGATI, _leggi, aggiungi, _salva)
+            _versione = leggi_versione(FILE_AGGREGATI)
+        except _FileMancante:
+            # file sparito o corrotto: il ledger contiene già queste transazioni, si ricalcola da lì
+            _ricostruisci_sotto_lock()
+
+def ricostruisci():
+    with _lock:
+        _ricostruisci_sotto_lock()
+        return _aggregati
+
+def verifica():
+    """Confronta i totali salvati con quelli ricalcolati dal ledger; ritorna la lista delle differenze."""
+    salvati = carica_aggregati()
+    attesi = calcola(carica_transazioni())
+    differenze = []
+    if salvati["transazioni"] != attesi["transazioni"]:
+        differenze.append(("transazioni", salvati["transazioni"], attesi["transazioni"]))
+    for mese in sorted(set(salvati["mesi"]) | set(attesi["mesi"])):
+        s_mese, a_mese = salvati["mesi"].get(mese, {}), attesi["mesi"].get(mese, {})
+        for conto in sorted(set(s_mese) | set(a_mese)):
+            s_conto, a_conto = s_mese.get(conto, {}), a_mese.get(conto, {})
+            for categoria in sorted(set(s_conto) | set(a_conto)):
+                s_voce, a_voce = s_conto.get(categoria), a_conto.get(categoria)
+                if s_voce != a_voce:
+                    differenze.append((f"{mese} / {conto} / {categoria}", s_voce, a_voce))
+    return differenze
+
+
+# --- letture per i report ---
+
+def totali_per_categoria(mese_da=None, mese_a=None, conto=None):
+    """[(mese, categoria, totale, numero)] sommando i conti (o solo `conto`), mesi "YYYY-MM" inclusi.
+
+    Con `conto` i totali sono nella valuta del conto; sommando tutti i conti ognuno è convertito
+    nella valuta base ai tassi salvati (NaN se per una valuta non c'è un tasso).
+    """
+    mesi = carica_aggregati()["mesi"]
+    tassi = {}
+    if not conto:
+        valute = valute_conti({c for per_conto in mesi.values() for c in per_conto})
+        per_valuta = cambi.tassi(set(valute.values()), rete=False)
+        tassi = {c: per_valuta[v] for c, v in valute.items() if v != VALUTA_BASE}
+    righe = []
+    for mese, per_conto in sorted(mesi.items()):
+        if (mese_da and mese < mese_da) or (mese_a and mese > mese_a):
+            continue
+        totali = {}
+        for nome_conto, per_categoria in per_conto.items():
+            if conto and nome_conto != conto:
+                continue
+            tasso = tassi.get(nome_conto, 1.0)
+            for categoria, (importo_cent, numero) in per_categoria.items():
+                voce = totali.setdefault(categoria, [0, 0])
+                # in centesimi interi finché i conti sono tutti nella valuta base
+                if nome_conto in tassi:
+                    importo_cent = importo_cent * (float("nan") if tasso is None else tasso)
+                voce[0] += importo_cent
+                voce[1] += numero
+        for categoria, (importo_cent, numero) in sorted(totali.items()):
+            righe.append((mese, categoria, importo_cent / 100, numero))
+    return righe
+
+def conti_presenti():
+    return sorted({c for per_conto in carica_aggregati()["mesi"].values() for c in per_conto})
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else "verifica"
+    if comando == "ricostruisci":
+        aggregati = ricostruisci()
+        print(f"Aggregati ricostruiti da {aggregati['transazioni']} transazioni.")
+    elif comando == "verifica":
+        differenze = verifica()
+        if not differenze:
+            print("Aggregati coerenti con il ledger.")
+        for chiave, salvato, atteso in differenze:
+            print(f"{chiave}: salvato {salvato}, atteso {atteso}")
+        sys.exit(1 if differenze else 0)
+    else:
+        print("Uso: python aggregati.py [verifica|ricostruisci]")
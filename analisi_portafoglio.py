@@ -0,0 +1,205 @@
+#analisi del portafoglio con numpy/pandas: costo di carico, P&L, rendimenti e drawdown
+#tutto per colonne: niente cicli python sulle singole operazioni
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from posizioni import EPSILON_QUANTITA
+
+FILE_INVESTIMENTI = "data/investimenti.json"
+FILE_STORICO = "data/storico_portafoglio.json"
+
+
+def _leggi_json(percorso, default):
+    try:
+        with open(percorso, "r") as f:
+            contenuto = f.read().strip()
+        return json.loads(contenuto) if contenuto else default
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+def operazioni_dataframe(investimenti=None):
+    """Tutte le operazioni in un DataFrame (ticker, tipo, data, quantita, prezzo_unitario), in ordine per ticker."""
+    if investimenti is None:
+        investimenti = _leggi_json(FILE_INVESTIMENTI, {})
+    righe = [
+        (ticker, op.get("tipo", "acquisto"), op["data"], op["quantita"], op["prezzo_unitario"])
+        for ticker, operazioni in investimenti.items()
+        for op in operazioni
+    ]
+    df = pd.DataFrame(righe, columns=["ticker", "tipo", "data", "quantita", "prezzo_unitario"])
+    df["data"] = pd.to_datetime(df["data"].str.slice(0, 10))
+    df["quantita"] = df["quantita"].astype(float)
+    df["prezzo_unitario"] = df["prezzo_unitario"].astype(float)
+    # dentro al ticker per giorno e, nello stesso giorno, per registrazione: come posizioni.in_ordine
+    df["ordine"] = np.arange(len(df))
+    return df.sort_values(["ticker", "data", "ordine"], kind="stable").reset_index(drop=True)
+
+def storico_serie(storico=None):
+    """storico_portafoglio.json come Serie valore indicizzata per data."""
+    if storico is None:
+        storico = _leggi_json(FILE_STORICO, [])
+    if isinstance(storico, dict):
+        storico = [{"data": d, "valore": v} for d, v in storico.items()]
+    if not storico:
+        return pd.Series(dtype=float)
+    df = pd.DataFrame(storico)
+    serie = pd.Series(df["valore"].astype(float).values, index=pd.to_datetime(df["data"].str.slice(0, 10)))
+    return serie.groupby(level=0).last().sort_index()
+
+
+def costo_di_carico(df):
+    """Aggiunge a df le colonne quantita_cum, costo_cum e realizzato (costo medio ponderato).
+
+    Il costo segue la ricorrenza C_k = C_{k-1} * a_k + b_k: un acquisto somma b_k = q * p,
+    una vendita scala il costo in proporzione alle quote rimaste (a_k = Q_k / Q_{k-1}).
+    La ricorrenza si risolve con prodotti e somme cumulate per "episodio" (tratto tra due
+    azzeramenti della posizione), così non serve scorrere le operazioni una a una.
+    """
+    df = df.copy()
+    acquisto = (df["tipo"] == "acquisto").to_numpy()
+    q = df["quantita"].to_numpy()
+    p = df["prezzo_unitario"].to_numpy()
+
+    segno = np.where(acquisto, 1.0, -1.0)
+    df["quantita_cum"] = (df["quantita"] * segno).groupby(df["ticker"]).cumsum()
+    df.loc[df["quantita_cum"].abs() < EPSILON_QUANTITA, "quantita_cum"] = 0.0
+    q_cum = df["quantita_cum"].to_numpy()
+    q_prec = df.groupby("ticker")["quantita_cum"].shift(1, fill_value=0.0).to_numpy()
+
+    # nuovo episodio quando la posizione riparte da zero
+    inizio = (q_prec == 0) | (df["ticker"] != df["ticker"].shift(1)).to_numpy()
+    episodio = np.cumsum(inizio)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = np.where(acquisto, 1.0, np.where(q_prec > 0, q_cum / q_prec, 0.0))
+    b = np.where(acquisto, q * p, 0.0)
+
+    # A_k = prodotto cumulato di a dentro l'episodio; C_k = A_k * somma_j (b_j / A_j)
+    A = pd.Series(a).groupby(episodio).cumprod().to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        termini = np.where(A > 0, b / A, 0.0)
+    S = pd.Series(termini).groupby(episodio).cumsum().to_numpy()
+    costo = np.where(q_cum > 0, A * S, 0.0)
+    df["costo_cum"] = costo
+
+    costo_prec = pd.Series(costo).groupby(df["ticker"].to_numpy()).shift(1, fill_value=0.0).to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pmu_prec = np.where(q_prec > 0, costo_prec / q_prec, 0.0)
+    df["realizzato"] = np.where(acquisto, 0.0, (p - pmu_prec) * q)
+    return df
+
+def riepilogo_per_ticker(df, prezzi):
+    """Quantità, costo, valore e P&L per ticker. prezzi: {ticker: prezzo corrente}."""
+    if df.empty:
+        return pd.DataFrame(columns=["quantita", "costo", "pmu", "prezzo", "valore",
+                                     "realizzato", "non_realizzato"])
+    df = costo_di_carico(df)
+    ultimo = df.groupby("ticker").tail(1).set_index("ticker")
+    riepilogo = pd.DataFrame({
+        "quantita": ultimo["quantita_cum"],
+        "costo": ultimo["costo_cum"],
+        "realizzato": df.groupby("ticker")["realizzato"].sum(),
+    })
+    riepilogo["pmu"] = np.where(riepilogo["quantita"] > 0, riepilogo["costo"] / riepilogo["quantita"].where(riepilogo["quantita"] > 0, 1), 0.0)
+    riepilogo["prezzo"] = pd.Series(prezzi, dtype=float).reindex(riepilogo.index)
+    riepilogo["valore"] = riepilogo["quantita"] * riepilogo["prezzo"]
+    riepilogo["non_realizzato"] = riepilogo["valore"] - riepilogo["costo"]
+    return riepilogo[["quantita", "costo", "pmu", "prezzo", "valore", "realizzato", "non_realizzato"]]
+
+def flussi_giornalieri(df):
+    """Denaro entrato (+) o uscito (-) dal portafoglio per giorno: acquisti positivi, vendite negative."""
+    if df.empty:
+        return pd.Series(dtype=float)
+    segno = np.where(df["tipo"] == "acquisto", 1.0, -1.0)
+    return pd.Series(segno * df["quantita"].to_numpy() * df["prezzo_unitario"].to_numpy(),
+                     index=df["data"]).groupby(level=0).sum().sort_index()
+
+def rendimento_time_weighted(valori, flussi):
+    """TWR: prodotto dei rendimenti tra due valutazioni, al netto dei flussi del giorno."""
+    if len(valori) < 2:
+        return float("nan")
+    v = valori.to_numpy()
+    # ogni flusso conta nella prima valutazione dalla sua data in poi
+    posizione = np.searchsorted(valori.index.to_numpy(), flussi.index.to_numpy(), side="left")
+    dentro = posizione < len(v)
+    f = np.bincount(posizione[dentro], weights=flussi.to_numpy()[dentro], minlength=len(v))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = (v[1:] - f[1:]) / v[:-1] - 1
+    r = r[np.isfinite(r)]
+    return float(np.prod(1 + r) - 1) if len(r) else float("nan")
+
+def rendimento_money_weighted(flussi, valore_finale, data_finale, iterazioni=100):
+    """MWR annualizzato (XIRR): tasso che azzera il valore attuale dei flussi, con Newton."""
+    if flussi.empty or not valore_finale:
+        return float("nan")
+    # dal punto di vista dell'investitore gli acquisti sono uscite di cassa
+    importi = np.append(-flussi.to_numpy(), valore_finale)
+    date = np.append(flussi.index.to_numpy(), np.datetime64(pd.Timestamp(data_finale)))
+    anni = (date - date[0]) / np.timedelta64(1, "D") / 365.0
+
+    tasso = 0.1
+    for _ in range(iterazioni):
+        sconto = (1 + tasso) ** -anni
+        f = np.sum(importi * sconto)
+        derivata = np.sum(-anni * importi * sconto / (1 + tasso))
+        if derivata == 0:
+            break
+        nuovo = tasso - f / derivata
+        if nuovo <= -0.9999:
+            nuovo = (tasso - 0.9999) / 2  # a metà strada verso -100%, senza superarlo
+        if abs(nuovo - tasso) < 1e-10:
+            return float(nuovo)
+        tasso = nuovo
+    return float(tasso) if np.isfinite(tasso) else float("nan")
+
+def massimo_drawdown(valori):
+    """Massima perdita percentuale da un picco precedente (numero negativo, 0 se mai in perdita)."""
+    if valori.empty:
+        return 0.0
+    v = valori.to_numpy()
+    picchi = np.maximum.accumulate(v)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = np.where(picchi > 0, v / picchi - 1, 0.0)
+    return float(drawdown.min())
+
+
+def converti_valuta_base(df, prezzi, valute, cambi):
+    """Operazioni e prezzi nella valuta base: ogni operazione al cambio del suo giorno, i prezzi
+    correnti al cambio attuale. valute: {ticker: valuta}; cambi: un cambi.TassiCambio."""
+    if df.empty:
+        return df, prezzi
+    df = df.copy()
+    giorni = (df["data"].to_numpy().astype("datetime64[D]").astype(np.int64) + 719163).astype(np.int32)  # ordinali
+    valute_op = df["ticker"].map(lambda t: valute.get(t)).to_numpy()
+    df["prezzo_unitario"] = cambi.converti_storico(df["prezzo_unitario"].to_numpy(), valute_op, giorni)
+    tickers = list(prezzi)
+    convertiti = cambi.converti([prezzi[t] for t in tickers], [valute.get(t) for t in tickers])
+    return df, dict(zip(tickers, convertiti.tolist()))
+
+def analizza(investimenti, prezzi, storico=None, valute=None, cambi=None):
+    """Tutto quello che serve alla finestra "Dettagli avanzati".
+
+    Con valute ({ticker: valuta}) e cambi gli importi sono nella valuta base; altrimenti ognuno
+    resta nella valuta del suo titolo.
+    """
+    df = operazioni_dataframe(investimenti)
+    if valute and cambi is not None:
+        df, prezzi = converti_valuta_base(df, prezzi, valute, cambi)
+    riepilogo = riepilogo_per_ticker(df, prezzi)
+    valori = storico_serie(storico)
+    flussi = flussi_giornalieri(df)
+
+    valore_attuale = float(riepilogo["valore"].sum(skipna=True)) if not riepilogo.empty else 0.0
+    return {
+        "per_ticker": riepilogo,
+        "costo": float(riepilogo["costo"].sum()) if not riepilogo.empty else 0.0,
+        "valore": valore_attuale,
+        "realizzato": float(riepilogo["realizzato"].sum()) if not riepilogo.empty else 0.0,
+        "non_realizzato": float(riepilogo["non_realizzato"].sum(skipna=True)) if not riepilogo.empty else 0.0,
+        "twr": rendimento_time_weighted(valori, flussi),
+        "mwr": rendimento_money_weighted(flussi, valore_attuale, pd.Timestamp.today().normalize()),
+        "max_drawdown": massimo_drawdown(valori),
+    }
@@ -0,0 +1,80 @@
+#misura il tempo di avvio: import di main e comparsa della prima finestra
+#uso:  python benchmark_avvio.py [ripetizioni]
+
+import os
+import subprocess
+import sys
+import time
+
+RIPETIZIONI = 5
+MODULI_MOSTRATI = 15
+PESANTI = ("matplotlib", "pandas", "numpy", "yfinance")
+
+# main() gira davvero, ma mainloop viene sostituito: disegna la finestra, stampa il tempo ed esce
+CODICE_FINESTRA = """
+import time
+t0 = time.perf_counter()
+import tkinter as tk
+
+def _prima_finestra(self, n=0):
+    self.update()
+    print(f"PRIMA_FINESTRA {time.perf_counter() - t0:.4f}")
+    self.destroy()
+
+tk.Tk.mainloop = _prima_finestra
+import main
+print(f"IMPORT_MAIN {time.perf_counter() - t0:.4f}")
+main.main()
+"""
+
+
+def _esegui(argomenti):
+    return subprocess.run([sys.executable] + argomenti, capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def tempo_prima_finestra():
+    """(secondi dal lancio del processo, secondi dentro python, secondi per import main)."""
+    inizio = time.perf_counter()
+    risultato = _esegui(["-c", CODICE_FINESTRA])
+    totale = time.perf_counter() - inizio
+    tempi = {}
+    for riga in risultato.stdout.splitlines():
+        nome, _, valore = riga.partition(" ")
+        if nome in ("PRIMA_FINESTRA", "IMPORT_MAIN"):
+            tempi[nome] = float(valore)
+    if "PRIMA_FINESTRA" not in tempi:
+        raise RuntimeError(risultato.stderr.strip().splitlines()[-1] if risultato.stderr.strip() else "finestra non aperta")
+    return totale, tempi["PRIMA_FINESTRA"], tempi["IMPORT_MAIN"]
+
+def dettaglio_import():
+    """Righe di -X importtime per `import main`: [(modulo, proprio_us, cumulato_us)]."""
+    risultato = _esegui(["-X", "importtime", "-c", "import main"])
+    righe = []
+    for riga in risultato.stderr.splitlines():
+        if not riga.startswith("import time:") or "self [us]" in riga:
+            continue
+        proprio, cumulato, modulo = riga[len("import time:"):].split("|")
+        righe.append((modulo.rstrip(), int(proprio), int(cumulato)))
+    return righe
+
+
+if __name__ == "__main__":
+    ripetizioni = int(sys.argv[1]) if len(sys.argv) > 1 else RIPETIZIONI
+
+    righe = dettaglio_import()
+    print("Import più lenti (-X importtime, import main):")
+    for modulo, proprio, cumulato in sorted(righe, key=lambda r: -r[2])[:MODULI_MOSTRATI]:
+        print(f"  {cumulato / 1000:8.1f} ms  (proprio {proprio / 1000:6.1f} ms)  {modulo}")
+    caricati = {modulo.strip().split(".")[0] for modulo, _, _ in righe}
+    pesanti = [p for p in PESANTI if p in caricati]
+    print(f"Moduli pesanti caricati all'avvio: {', '.join(pesanti) if pesanti else 'nessuno'}")
+
+    try:
+        misure = [tempo_prima_finestra() for _ in range(ripetizioni)]
+    except RuntimeError as e:
+        print(f"Impossibile aprire la finestra (serve un display): {e}")
+        sys.exit(1)
+    misure.sort()
+    totale, finestra, importazione = misure[len(misure) // 2]
+    print(f"Prima finestra (mediana su {ripetizioni}): {totale * 1000:.0f} ms dal lancio, "
+          f"{finestra * 1000:.0f} ms dentro python, di cui import main {importazione * 1000:.0f} ms")
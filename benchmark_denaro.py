@@ -0,0 +1,58 @@
+#confronta somme di importi: float contro centesimi interi (denaro.py, TabellaTransazioni)
+#uso:  python benchmark_denaro.py [numero_importi]
+
+import random
+import sys
+import time
+
+import denaro
+from tabella_transazioni import TabellaTransazioni
+
+N_PREDEFINITO = 1_000_000
+RIPETIZIONI = 5
+
+
+def _misura(funzione):
+    migliore = float("inf")
+    for _ in range(RIPETIZIONI):
+        inizio = time.perf_counter()
+        risultato = funzione()
+        migliore = min(migliore, time.perf_counter() - inizio)
+    return migliore, risultato
+
+def saldo_float(importi):
+    # come facevano aggiorna_saldo e applica_batch: un += per ogni transazione
+    saldo = 0.0
+    for x in importi:
+        saldo += x
+    return saldo
+
+def saldo_centesimi(importi):
+    saldo = 0
+    for x in importi:
+        saldo += denaro.centesimi(x)
+    return denaro.euro(saldo)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_PREDEFINITO
+    random.seed(0)
+    centesimi_esatti = [random.randint(-50_000, 50_000) for _ in range(n)]
+    importi = [c / 100 for c in centesimi_esatti]
+    atteso = sum(centesimi_esatti)
+
+    tabella = TabellaTransazioni({"data": "2025-01-01", "conto": "C", "categoria": "x",
+                                  "importo": x, "descrizione": ""} for x in importi)
+
+    prove = [
+        ("float, ciclo +=", lambda: saldo_float(importi)),
+        ("float, sum()", lambda: sum(importi)),
+        ("centesimi, ciclo +=", lambda: saldo_centesimi(importi)),
+        ("centesimi, somma() su lista", lambda: denaro.somma(importi)),
+        ("centesimi, colonna della tabella", lambda: tabella.totale()),
+    ]
+    print(f"{n} importi, somma esatta {atteso / 100:.2f} €")
+    for nome, funzione in prove:
+        secondi, risultato = _misura(funzione)
+        print(f"  {nome:34s} {secondi * 1000:8.1f} ms   risultato {risultato:.10f}   "
+              f"scarto {abs(risultato - atteso / 100):.2e} €")
@@ -0,0 +1,120 @@
+#lock tra processi sui file di data/ e numero di versione per file (concorrenza ottimistica)
+#la GUI e gli script di import possono scrivere sugli stessi file nello stesso momento
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+TENTATIVI = 50
+ATTESA_INIZIALE = 0.002  # secondi, raddoppia a ogni conflitto fino ad ATTESA_MASSIMA
+ATTESA_MASSIMA = 0.2
+
+
+class ConflittoVersione(Exception):
+    """Il file è stato modificato da un altro processo più volte di quante se ne potessero riprovare."""
+
+
+_lock_interno = threading.Lock()
+_per_file = {}  # percorso -> [RLock del processo, descrittore del .lock, profondità]
+
+
+def _voce(percorso):
+    with _lock_interno:
+        return _per_file.setdefault(os.path.abspath(percorso), [threading.RLock(), None, 0])
+
+def _acquisisci(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    else:
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue  # LK_LOCK rinuncia dopo 10 secondi: si riprova
+
+def _rilascia(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def blocca(percorso):
+    """Lock esclusivo su `percorso` tra processi (advisory, sul file percorso.lock) e tra thread.
+
+    Rientrante nello stesso thread: flock su un secondo descrittore dello stesso
+    processo resterebbe bloccato su se stesso, quindi il descrittore si riusa.
+    """
+    voce = _voce(percorso)
+    with voce[0]:
+        if voce[2] == 0:
+            fd = os.open(percorso + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _acquisisci(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+            voce[1] = fd
+        voce[2] += 1
+        try:
+            yield
+        finally:
+            voce[2] -= 1
+            if voce[2] == 0:
+                fd, voce[1] = voce[1], None
+                try:
+                    _rilascia(fd)
+                finally:
+                    os.close(fd)
+
+
+# --- versioni ---
+
+def leggi_versione(percorso):
+    """Numero di scritture registrate per `percorso` (0 se mai scritto con questo modulo)."""
+    try:
+        with open(percorso + ".versione", "r") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def incrementa_versione(percorso):
+    # da chiamare con il lock tenuto, dopo aver scritto il file
+    versione = leggi_versione(percorso) + 1
+    tmp = f"{percorso}.versione.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(versione))
+    os.replace(tmp, percorso + ".versione")
+    return versione
+
+
+def aggiorna(percorso, leggi, modifica, scrivi, tentativi=TENTATIVI):
+    """Lettura-modifica-scrittura di `percorso` senza perdere aggiornamenti concorrenti.
+
+    leggi() e modifica(dati) girano senza lock; al momento di scrivere, sotto lock, si
+    controlla che la versione sia ancora quella letta. Se un altro processo ha scritto nel
+    frattempo si riparte da capo (con un'attesa casuale crescente). Ritorna i dati scritti.
+    """
+    attesa = ATTESA_INIZIALE
+    for _ in range(tentativi):
+        versione = leggi_versione(percorso)
+        nuovi = modifica(leggi())
+        with blocca(percorso):
+            if leggi_versione(percorso) == versione:
+                scrivi(nuovi)
+                incrementa_versione(percorso)
+                return nuovi
+        time.sleep(random.uniform(0, attesa))
+        attesa = min(attesa * 2, ATTESA_MASSIMA)
+    raise ConflittoVersione(f"{percorso}: troppe scritture concorrenti, aggiornamento non riuscito")
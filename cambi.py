@@ -0,0 +1,294 @@
+#tassi di cambio: valori in valute diverse riportati alla valuta base (EUR)
+#tassi attuali in data/cambi.json (validi TTL_CAMBI secondi, ma usati anche scaduti se non c'è rete),
+#tassi giornalieri nell'archivio di prezzi_storici.py (ticker "USDEUR=X"), conversioni per colonne con numpy
+#(importato solo quando si converte: le etichette con la valuta non lo caricano all'avvio)
+#uso:  python cambi.py aggiorna VALUTA... | imposta VALUTA TASSO | mostra
+
+import json
+import os
+import sys
+import threading
+import time
+
+from blocchi_file import aggiorna
+
+VALUTA_BASE = "EUR"
+FILE_CAMBI = "data/cambi.json"
+FILE_VALUTE_CONTI = "data/valute_conti.json"
+TTL_CAMBI = 900  # secondi
+SIMBOLI = {"EUR": "€", "USD": "$", "GBP": "£", "JPY": "¥", "CHF": "CHF"}
+VALUTE_COMUNI = ("EUR", "USD", "GBP", "CHF", "JPY")
+
+
+# quotazioni in unità minori (Londra in pence, Johannesburg in cent, Tel Aviv in agorot):
+# codice come lo scrive Yahoo -> (valuta, divisore). Vanno riconosciute prima di passare in
+# maiuscolo, altrimenti "GBp" diventa "GBP" e il prezzo risulta cento volte più alto.
+UNITA_MINORI = {"GBp": ("GBP", 100), "ZAc": ("ZAR", 100), "ILA": ("ILS", 100)}
+_ALIAS_UNITA_MINORI = {"GBX": "GBp", "ZAC": "ZAc", "ILX": "ILA"}
+
+
+def normalizza_valuta(valuta, base=VALUTA_BASE):
+    # None o "" = valuta base; le unità minori restano distinte (vedi valuta_principale)
+    if not valuta:
+        return base
+    if valuta in UNITA_MINORI:
+        return valuta
+    return _ALIAS_UNITA_MINORI.get(valuta.upper(), valuta.upper())
+
+def valuta_principale(valuta, base=VALUTA_BASE):
+    """(valuta, fattore): "GBp" -> ("GBP", 0.01); le valute normali hanno fattore 1."""
+    valuta = normalizza_valuta(valuta, base)
+    if valuta in UNITA_MINORI:
+        principale, divisore = UNITA_MINORI[valuta]
+        return principale, 1 / divisore
+    return valuta, 1.0
+
+def ticker_cambio(valuta, base=VALUTA_BASE):
+    """Simbolo Yahoo del cambio: quanti `base` vale 1 `valuta`."""
+    return f"{valuta}{base}=X"
+
+def simbolo(valuta=VALUTA_BASE):
+    return SIMBOLI.get(valuta, valuta or "")
+
+def formatta_importo(importo, valuta=VALUTA_BASE):
+    return f"{importo:,.2f} {simbolo(valuta)}"
+
+
+class TassiCambio:
+    """Tassi verso la valuta base: attuali (con TTL, salvati su disco) e storici giornalieri.
+
+    Senza rete si usano i tassi salvati anche se scaduti, poi l'ultima chiusura in archivio:
+    basta una tabella dei tassi su disco (python cambi.py imposta USD 0.92) per lavorare offline.
+    """
+
+    def __init__(self, base=VALUTA_BASE, percorso=FILE_CAMBI, ttl=TTL_CAMBI, archivio=None, fornitore=None):
+        self.base = base
+        self.percorso = percorso
+        self.ttl = ttl
+        self._archivio = archivio
+        self._fornitore = fornitore
+        self._lock = threading.Lock()
+        self._tassi = None  # valuta -> {"tasso", "istante"}; istante None = fissato a mano, non scade
+
+    def archivio(self):
+        if self._archivio is None:
+            from prezzi_storici import archivio
+            self._archivio = archivio
+        return self._archivio
+
+    def fornitore(self):
+        if self._fornitore is not None:
+            return self._fornitore
+        from quotazioni import fornitore_predefinito
+        return fornitore_predefinito()
+
+    # --- tabella dei tassi attuali ---
+
+    def _leggi(self):
+        if not self.percorso:
+            return {}
+        try:
+            with open(self.percorso, "r") as f:
+                contenuto = f.read().strip()
+            return json.loads(contenuto) if contenuto else {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _scrivi(self, dati):
+        os.makedirs(os.path.dirname(self.percorso) or ".", exist_ok=True)
+        tmp = f"{self.percorso}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(dati, f, indent=4)
+        os.replace(tmp, self.percorso)
+
+    def _tabella(self):
+        with self._lock:
+            if self._tassi is None:
+                self._tassi = self._leggi()
+            return self._tassi
+
+    def memorizza(self, tassi, istante=...):
+        """Salva {valuta: tasso}; istante None li fissa (non scadono), di default è adesso."""
+        if not tassi:
+            return
+        istante = time.time() if istante is ... else istante
+        nuovi = {v: {"tasso": float(t), "istante": istante} for v, t in tassi.items()}
+
+        def modifica(dati):
+            dati.update(nuovi)
+            return dati
+
+        if self.percorso:
+            try:
+                scritti = aggiorna(self.percorso, self._leggi, modifica, self._scrivi)
+            except OSError as e:
+                print(f"Impossibile salvare i tassi di cambio: {e}")
+                scritti = modifica(dict(self._tabella()))
+        else:
+            scritti = modifica(dict(self._tabella()))
+        with self._lock:
+            self._tassi = scritti
+
+    def tassi(self, valute, rete=True):
+        """{valuta: tasso verso la base o None}. Con rete=True i tassi mancanti o scaduti si
+        chiedono al fornitore in una sola richiesta; con rete=False si usa solo ciò che è salvato."""
+        valute = list(dict.fromkeys(normalizza_valuta(v, self.base) for v in valute))
+        principali = {v: valuta_principale(v, self.base) for v in valute}
+        tabella = self._tabella()
+        adesso = time.time()
+        risultati, da_chiedere = {}, []
+        for valuta in dict.fromkeys(p for p, _ in principali.values()):
+            if valuta == self.base:
+                risultati[valuta] = 1.0
+                continue
+            voce = tabella.get(valuta)
+            if voce is not None:
+                risultati[valuta] = voce["tasso"]
+            if voce is None or (voce["istante"] is not None and adesso - voce["istante"] > self.ttl):
+                da_chiedere.append(valuta)
+
+        if da_chiedere and rete:
+            try:
+                quotazioni = self.fornitore().recupera_quotazioni([ticker_cambio(v, self.base) for v in da_chiedere])
+            except Exception as e:
+                print(f"Errore nel recupero dei tassi di cambio: {e}")
+                quotazioni = {}
+            nuovi = {}
+            for valuta in da_chiedere:
+                quotazione = quotazioni.get(ticker_cambio(valuta, self.base))
+                if quotazione is not None and quotazione.get("prezzo"):
+                    nuovi[valuta] = quotazione["prezzo"]
+            self.memorizza(nuovi)
+            risultati.update(nuovi)
+
+        for valuta, _ in principali.values():
+            if valuta not in risultati:
+                # mai visto: l'ultima chiusura in archivio, se c'è
+                serie = self.archivio().serie(ticker_cambio(valuta, self.base))
+                if len(serie.chiusure):
+                    risultati[valuta] = float(serie.chiusure[-1])
+        return {v: None if risultati.get(p) is None else risultati[p] * fattore
+                for v, (p, fattore) in principali.items()}
+
+    def tasso(self, valuta, rete=True):
+        return self.tassi([valuta], rete)[normalizza_valuta(valuta, self.base)]
+
+    # --- conversioni ---
+
+    def converti(self, importi, valute, rete=True):
+        """Importi (array) nelle rispettive valute -> array nella valuta base; NaN dove il tasso manca.
+
+        I tassi si cercano una volta per valuta distinta, poi la conversione è una moltiplicazione sola.
+        """
+        import numpy as np
+
+        importi = np.asarray(importi, dtype=np.float64)
+        if importi.size == 0:
+            return importi
+        valute = np.array([normalizza_valuta(v, self.base) for v in valute], dtype=object)
+        distinte, indici = np.unique(valute, return_inverse=True)
+        tassi = self.tassi(distinte, rete)
+        vettore = np.array([np.nan if tassi[v] is None else tassi[v] for v in distinte], dtype=np.float64)
+        return importi * vettore[indici]
+
+    def tassi_storici(self, valuta, giorni):
+        """Tasso di `valuta` a ogni giorno (ordinali): l'ultima chiusura nota a quella data.
+
+        Prima della prima chiusura in archivio vale la prima; senza archivio il tasso attuale salvato.
+        """
+        import numpy as np
+
+        valuta, fattore = valuta_principale(valuta, self.base)
+        giorni = np.asarray(giorni, dtype=np.int32)
+        if valuta == self.base:
+            return np.full(len(giorni), fattore)
+        serie = self.archivio().serie(ticker_cambio(valuta, self.base))
+        if not len(serie.giorni):
+            tasso = self.tasso(valuta, rete=False)
+            return np.full(len(giorni), np.nan if tasso is None else tasso * fattore)
+        j = np.searchsorted(serie.giorni, giorni, side="right") - 1
+        return serie.chiusure[np.maximum(j, 0)] * fattore
+
+    def converti_storico(self, importi, valute, giorni):
+        """Come converti, ma ogni importo al tasso del suo giorno (ordinali)."""
+        import numpy as np
+
+        importi = np.asarray(importi, dtype=np.float64)
+        giorni = np.asarray(giorni, dtype=np.int32)
+        valute = np.array([normalizza_valuta(v, self.base) for v in valute], dtype=object)
+        risultato = np.empty(len(importi))
+        for valuta in np.unique(valute) if len(valute) else []:
+            scelti = valute == valuta
+            risultato[scelti] = importi[scelti] * self.tassi_storici(valuta, giorni[scelti])
+        return risultato
+
+    def intervalli_storici(self, intervalli, valute):
+        """Intervalli da scaricare per i cambi: {ticker cambio: (inizio, fine)} che coprono i ticker
+        di `intervalli` ({ticker: (inizio, fine)}) nelle rispettive `valute` ({ticker: valuta})."""
+        per_valuta = {}
+        for ticker, (inizio, fine) in intervalli.items():
+            valuta, _ = valuta_principale(valute.get(ticker), self.base)
+            if valuta == self.base:
+                continue
+            prima = per_valuta.get(valuta, (inizio, fine))
+            per_valuta[valuta] = (min(prima[0], inizio), max(prima[1], fine))
+        return {ticker_cambio(v, self.base): intervallo for v, intervallo in per_valuta.items()}
+
+
+cambi = TassiCambio()
+
+
+# --- valute dei conti ---
+
+def _leggi_valute_conti():
+    try:
+        with open(FILE_VALUTE_CONTI, "r") as f:
+            contenuto = f.read().strip()
+        return json.loads(contenuto) if contenuto else {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def valute_conti(conti=None):
+    """{conto: valuta}; i conti senza valuta impostata sono nella valuta base."""
+    valute = _leggi_valute_conti()
+    nomi = valute if conti is None else conti
+    return {nome: valute.get(nome, VALUTA_BASE) for nome in nomi}
+
+def imposta_valuta_conto(nome, valuta):
+    def modifica(valute):
+        if normalizza_valuta(valuta) == VALUTA_BASE:
+            valute.pop(nome, None)
+        else:
+            valute[nome] = normalizza_valuta(valuta)
+        return valute
+
+    def scrivi(valute):
+        tmp = f"{FILE_VALUTE_CONTI}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(valute, f, indent=4)
+        os.replace(tmp, FILE_VALUTE_CONTI)
+
+    return aggiorna(FILE_VALUTE_CONTI, _leggi_valute_conti, modifica, scrivi)
+
+def totale_conti(conti, rete=True):
+    """Somma dei saldi {conto: saldo} nella valuta base (NaN se manca un tasso)."""
+    import numpy as np
+
+    valute = valute_conti(conti)
+    return float(np.sum(cambi.converti(list(conti.values()), [valute[n] for n in conti], rete)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "aggiorna":
+        cambi.ttl = 0  # richiesti comunque, anche se ancora validi
+        for valuta, tasso in cambi.tassi(sys.argv[2:]).items():
+            print(f"1 {valuta} = {tasso} {VALUTA_BASE}" if tasso is not None else f"{valuta}: tasso non disponibile")
+    elif len(sys.argv) == 4 and sys.argv[1] == "imposta":
+        cambi.memorizza({normalizza_valuta(sys.argv[2]): float(sys.argv[3].replace(",", "."))}, istante=None)
+        print(f"1 {normalizza_valuta(sys.argv[2])} = {sys.argv[3]} {VALUTA_BASE} (fisso, non scade)")
+    elif len(sys.argv) == 2 and sys.argv[1] == "mostra":
+        for valuta, voce in sorted(cambi._tabella().items()):
+            quando = "fisso" if voce["istante"] is None else time.strftime("%Y-%m-%d %H:%M", time.localtime(voce["istante"]))
+            print(f"1 {valuta} = {voce['tasso']} {VALUTA_BASE}   ({quando})")
+    else:
+        print("Uso: python cambi.py aggiorna VALUTA... | imposta VALUTA TASSO | mostra")
@@ -0,0 +1,39 @@
+#cartella data/ temporanea per le prove: ledger, conti e indici partono vuoti
+#uso (nelle prove):  with cartella_dati(): ...
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import aggregati
+import saldi_storici
+import storage
+
+
+def azzera_cache():
+    """Dimentica tutto quello che i moduli tengono in memoria, come un processo appena avviato."""
+    storage.repository = storage.Repository()
+    storage._righe_journal = None
+    aggregati._aggregati = None
+    aggregati._versione = None
+    saldi_storici._indice = None
+    saldi_storici._versione_indice = None
+
+
+@contextmanager
+def cartella_dati(conti=None):
+    """Lavora in una cartella temporanea con data/ (e conti.json, se `conti` è dato), poi torna indietro."""
+    precedente = os.getcwd()
+    with tempfile.TemporaryDirectory() as cartella:
+        os.chdir(cartella)
+        try:
+            os.makedirs("data")
+            if conti is not None:
+                with open(storage.FILE_CONTI, "w") as f:
+                    json.dump(conti, f)
+            azzera_cache()
+            yield cartella
+        finally:
+            azzera_cache()
+            os.chdir(precedente)
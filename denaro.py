@@ -0,0 +1,77 @@
+#importi in centesimi interi: sommando migliaia di float si accumulano errori (e poi servono "correzioni")
+#i file continuano a salvare euro con due decimali: centesimi(euro(c)) == c, quindi il giro è senza perdite
+#le quantità di titoli possono essere frazionarie: per quelle si usa Decimal
+
+from decimal import Decimal, ROUND_HALF_UP
+
+SOGLIA_NUMPY = 5000  # sotto questo numero di importi la somma in python puro è già la più veloce
+_CENTESIMO = Decimal(1)
+
+
+def centesimi(importo):
+    """Euro (float, int, str o Decimal) -> centesimi interi, arrotondati al centesimo più vicino.
+
+    A metà strada (0.125) si arrotonda lontano da zero per ogni tipo di input, come ROUND_HALF_UP.
+    """
+    if isinstance(importo, float):
+        # un importo con due decimali, moltiplicato per 100, dista da un intero molto meno di 0.5;
+        # round() a metà strada va sul pari, si corregge solo quel caso
+        valore = importo * 100
+        cent = round(valore)
+        if abs(valore - cent) == 0.5:
+            return int(valore + 0.5) if valore > 0 else int(valore - 0.5)
+        return cent
+    if isinstance(importo, int):
+        return importo * 100
+    valore = Decimal(str(importo).strip().replace(",", "."))
+    return int(valore.scaleb(2).quantize(_CENTESIMO, rounding=ROUND_HALF_UP))
+
+def euro(cent):
+    """Centesimi -> euro come float, il formato salvato in conti.json e nel ledger."""
+    return cent / 100
+
+def normalizza(importo):
+    """Importo arrotondato al centesimo, come float."""
+    return euro(centesimi(importo))
+
+def somma_centesimi(importi):
+    """Somma esatta, in centesimi, di una sequenza di importi in euro."""
+    importi = importi if isinstance(importi, (list, tuple)) else list(importi)
+    if len(importi) >= SOGLIA_NUMPY:
+        try:
+            import numpy as np
+        except ImportError:
+            pass
+        else:
+            valori = np.asarray(importi, dtype=np.float64) * 100
+            cent = np.rint(valori)
+            # come centesimi(): a metà strada lontano da zero
+            cent = np.where(np.abs(valori - cent) == 0.5, valori + np.copysign(0.5, valori), cent)
+            return int(cent.astype(np.int64).sum())
+    return sum(map(centesimi, importi))
+
+def somma(importi):
+    return euro(somma_centesimi(importi))
+
+def somma_saldo(saldo, importo):
+    """saldo + importo, in euro, senza deriva."""
+    return euro(centesimi(saldo) + centesimi(importo))
+
+def differenza(a, b):
+    """a - b, in euro, senza deriva."""
+    return euro(centesimi(a) - centesimi(b))
+
+
+# --- quantità e controvalori (titoli) ---
+
+def quantita(q):
+    """Quantità di titoli come Decimal esatto (str() evita di portarsi dietro l'errore binario del float)."""
+    return q if isinstance(q, Decimal) else Decimal(str(q))
+
+def controvalore(q, prezzo):
+    """quantità x prezzo unitario, in centesimi."""
+    return int((quantita(q) * Decimal(str(prezzo))).scaleb(2).quantize(_CENTESIMO, rounding=ROUND_HALF_UP))
+
+def quota_centesimi(cent, parte, totale):
+    """cent * parte / totale arrotondato al centesimo (costo di carico della parte venduta)."""
+    return int((Decimal(cent) * quantita(parte) / quantita(totale)).quantize(_CENTESIMO, rounding=ROUND_HALF_UP))
@@ -1,22 +1,42 @@
 #GUI conti
 
 import tkinter as tk
+from datetime import datetime
 from tkinter import messagebox, ttk
 import logica_transazioni
-
-def aggiungi_conto(nome_conto, saldo_iniziale=0.0):
+import saldi_storici
+import storage
+import denaro
+from cambi import VALUTA_BASE, VALUTE_COMUNI, formatta_importo, imposta_valuta_conto, totale_conti, valute_conti
+from utils.attivita import esegui
+
+def aggiungi_conto(nome_conto, saldo_iniziale=0.0, valuta=VALUTA_BASE):
+    # il saldo è nella valuta del conto; i totali lo convertono nella valuta base
     conti = logica_transazioni.carica_conti()
     if nome_conto in conti:
         raise ValueError("Conto già esistente.")
-    conti[nome_conto] = saldo_iniziale
-    logica_transazioni.salva_conti(conti)
+    imposta_valuta_conto(nome_conto, valuta)
+    with logica_transazioni.transazione_atomica() as batch:
+        if saldo_iniziale:
+            # il saldo iniziale entra nel ledger, così i saldi storici partono dal valore giusto
+            batch.registra(saldo_iniziale, nome_conto, "saldo iniziale", "Saldo iniziale")
+        else:
+            batch.aggiorna_saldo(nome_conto, 0.0)
+
+def registra_correzione(nome_conto, descrizione, importo, categoria):
+    # firma attesa da modifica_saldo per aggiungi_transazione
+    data = datetime.now().strftime("%Y-%m-%d")  # solo il giorno, come il resto del ledger
+    logica_transazioni.registra_transazione(importo, nome_conto, categoria, descrizione, data)
 
 def rimuovi_conto(nome_conto):
-    conti = logica_transazioni.carica_conti()
-    if nome_conto not in conti:
-        raise ValueError("Conto inesistente.")
-    del conti[nome_conto]
-    logica_transazioni.salva_conti(conti)
+    def togli(conti):
+        if nome_conto not in conti:
+            raise ValueError("Conto inesistente.")
+        del conti[nome_conto]
+        return conti
+
+    storage.aggiorna_conti(togli)
+    imposta_valuta_conto(nome_conto, VALUTA_BASE)
 
 def modifica_saldo(nome_conto, nuovo_saldo, aggiungi_transazione):
     #dependency injection per aggiungi_transazione bc im a lazy ass
@@ -24,7 +44,7 @@ def modifica_saldo(nome_conto, nuovo_saldo, aggiungi_transazione):
     if nome_conto not in conti:
         raise ValueError("Conto inesistente.")
     saldo_attuale = conti[nome_conto]
-    differenza = nuovo_saldo - saldo_attuale
+    differenza = denaro.differenza(nuovo_saldo, saldo_attuale)
     if differenza == 0:
         return  # niente da modificare
     # NON aggiornare conti[nome_conto] qui, ma solo tramite aggiungi_transazione
@@ -52,7 +72,7 @@ def apri_popup_modifica_saldo(root, aggiorna_saldi_callback):
             return
 
         try:
-            modifica_saldo(nome_conto, nuovo_saldo, logica_transazioni.aggiungi_transazione)
+            modifica_saldo(nome_conto, nuovo_saldo, registra_correzione)
         except Exception as e:
             messagebox.showerror("Errore", str(e))
             return
@@ -71,7 +91,7 @@ def apri_popup_modifica_saldo(root, aggiorna_saldi_callback):
 
         for conto in conti:
             try:
-                modifica_saldo(conto, 0.0, logica_transazioni.aggiungi_transazione)
+                modifica_saldo(conto, 0.0, registra_correzione)
             except Exception as e:
                 messagebox.showerror("Errore", f"Errore con il conto '{conto}': {str(e)}")
 
@@ -86,6 +106,18 @@ def apri_popup_modifica_saldo(root, aggiorna_saldi_callback):
         fg="white", bg="#cc4c4c", activebackground="#b33c3c"
     ).grid(row=3, column=0, columnspan=2, pady=(0, 10), ipadx=10)
 
+def mostra_riconciliazione():
+    differenze = saldi_storici.riconcilia()
+    if not differenze:
+        messagebox.showinfo("Riconciliazione", "Tutti i conti tornano con il ledger.")
+        return
+    valute = valute_conti([conto for conto, *_ in differenze])
+    testo = "Saldi diversi dalla somma delle transazioni:\n\n"
+    for conto, saldo_conti, saldo_ledger, differenza in differenze:
+        testo += (f"{conto}: saldo {formatta_importo(saldo_conti, valute[conto])}, "
+                  f"ledger {formatta_importo(saldo_ledger, valute[conto])} ({differenza:+.2f})\n")
+    messagebox.showwarning("Riconciliazione", testo)
+
 def apri_finestra_gestione_conti(root=None, aggiorna_saldi_callback=None):
 
     finestra = tk.Toplevel()
@@ -98,18 +130,28 @@ def apri_finestra_gestione_conti(root=None, aggiorna_saldi_callback=None):
         aggiorna_saldi_callback()
 
     def aggiorna_saldi():
-        conti = logica_transazioni.carica_conti()
-        testo = "Saldi attuali:\n"
-        for nome, saldo in conti.items():
-            testo += f"{nome}: {saldo:.2f} €\n"
-        etichetta_saldi.config(text=testo)
+        def leggi():
+            conti = logica_transazioni.carica_conti()
+            return conti, valute_conti(conti), totale_conti(conti)
+
+        def mostra(risultato):
+            conti, valute, totale = risultato
+            testo = "Saldi attuali:\n"
+            for nome, saldo in conti.items():
+                testo += f"{nome}: {formatta_importo(saldo, valute[nome])}\n"
+            if any(v != VALUTA_BASE for v in valute.values()):
+                testo += f"\nTotale: {'N/D (cambio non disponibile)' if totale != totale else formatta_importo(totale)}\n"
+            etichetta_saldi.config(text=testo)
+
+        # lettura dei conti (e dei cambi) in background, la finestra intanto resta reattiva
+        esegui(finestra, leggi, al_termine=mostra, indicatore=etichetta_saldi)
 
     def aggiungi():
         def conferma():
             nome = entry_nome.get()
             try:
                 saldo = float(entry_saldo.get())
-                aggiungi_conto(nome, saldo)
+                aggiungi_conto(nome, saldo, entry_valuta.get() or VALUTA_BASE)
                 aggiorna_saldi()
                 popup.destroy()
             except Exception as e:
@@ -125,7 +167,12 @@ def apri_finestra_gestione_conti(root=None, aggiorna_saldi_callback=None):
         entry_saldo = tk.Entry(popup)
         entry_saldo.grid(row=1, column=1)
 
-        tk.Button(popup, text="Conferma", command=conferma).grid(row=2, columnspan=2, pady=10)
+        tk.Label(popup, text="Valuta:").grid(row=2, column=0)
+        entry_valuta = ttk.Combobox(popup, values=VALUTE_COMUNI)
+        entry_valuta.set(VALUTA_BASE)
+        entry_valuta.grid(row=2, column=1)
+
+        tk.Button(popup, text="Conferma", command=conferma).grid(row=3, columnspan=2, pady=10)
 
     def rimuovi():
         def conferma():
@@ -153,6 +200,7 @@ def apri_finestra_gestione_conti(root=None, aggiorna_saldi_callback=None):
     tk.Button(frame_pulsanti, text="➕ Aggiungi Conto", command=aggiungi).pack(side=tk.LEFT, padx=5)
     tk.Button(frame_pulsanti, text="🗑️ Rimuovi Conto", command=rimuovi).pack(side=tk.LEFT, padx=5)
     tk.Button(frame_pulsanti, text="💰 Modifica Saldo", command=lambda: apri_popup_modifica_saldo(finestra, aggiorna_saldi)).pack(side=tk.LEFT, padx=5)
+    tk.Button(frame_pulsanti, text="🔍 Riconcilia", command=mostra_riconciliazione).pack(side=tk.LEFT, padx=5)
 
     aggiorna_saldi()
 
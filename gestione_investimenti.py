@@ -3,41 +3,126 @@ from tkinter import ttk
 from tkinter import messagebox
 import json
 from datetime import datetime
-import yfinance as yf
 import os
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import queue
+import threading
+import time
+from quotazioni import recupera_quotazioni, fornitore_predefinito
+from posizioni import MotorePosizioni, Posizione, EPSILON_QUANTITA, in_ordine
+from utils.attivita import esegui
+from aggiornamento_quotazioni import AggiornatoreQuotazioni, applica_a_tabella, centrale, formatta_totale
+from gestione_watchlist import apri_finestra_watchlist
+from blocchi_file import aggiorna, leggi_versione
+from cambi import cambi, normalizza_valuta, formatta_importo, simbolo
 
 percorso_file = "data/investimenti.json"
 
-if os.path.exists(percorso_file):
+def _leggi_investimenti():
+    if not os.path.exists(percorso_file):
+        return {}
     try:
         with open(percorso_file, "r") as f:
             contenuto = f.read().strip()
-            if contenuto:
-                investimenti = json.loads(contenuto)
-            else:
-                investimenti = {}
+            return json.loads(contenuto) if contenuto else {}
     except json.JSONDecodeError:
         print("Errore nel parsing del file JSON. Il file potrebbe essere corrotto.")
-        investimenti = {}
-else:
-    investimenti = {}
+        return {}
 
-def calcola_valore_portafoglio(investimenti):
-    valore_totale = 0.0
+def _scrivi_json(percorso, dati, indent):
+    tmp = f"{percorso}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(dati, f, indent=indent)
+    os.replace(tmp, percorso)
 
-    for ticker, dati in investimenti.items():
-        try:
-            info = yf.Ticker(ticker).info
-            prezzo_attuale = info.get("regularMarketPrice")
+investimenti = _leggi_investimenti()
+_versione_investimenti = leggi_versione(percorso_file)
 
-            if prezzo_attuale is not None:
-                valore_totale += prezzo_attuale * dati["quantita"]
-        except Exception as e:
-            print(f"Errore nel recupero del prezzo per {ticker}: {e}")
+# posizioni correnti: lo storico si scorre solo qui, poi si aggiorna a ogni operazione
+motore_posizioni = MotorePosizioni(investimenti)
 
-    return valore_totale
+def calcola_valore_portafoglio(investimenti):
+    return valuta_quantita(MotorePosizioni(investimenti).quantita_posseduta())
+
+def valuta_quantita(quantita):
+    # quantita: {ticker: quantità posseduta}; il valore è nella valuta base
+    quotazioni = recupera_quotazioni(quantita)
+    quotati = [t for t in quantita if quotazioni.get(t) is not None]
+
+    # controvalori nelle valute dei titoli, convertiti tutti insieme
+    valori = cambi.converti([quotazioni[t]["prezzo"] * quantita[t] for t in quotati],
+                            [quotazioni[t].get("valuta") or valuta_ticker(t) for t in quotati])
+    return float(sum(v for v in valori.tolist() if v == v))  # senza cambio (NaN) non si somma
+
+def valuta_ticker(ticker, rete=False):
+    """Valuta in cui è quotato `ticker`: quella salvata con le operazioni, altrimenti quella
+    dell'ultima quotazione nota (chiesta al fornitore con rete=True); None se ancora ignota."""
+    return valute_titoli([ticker], rete)[ticker.upper()]
+
+def valute_titoli(tickers=None, rete=False):
+    """{ticker: valuta o None}; con rete=True quelle ignote si chiedono al fornitore in una richiesta."""
+    valute, ignote = {}, []
+    fornitore = fornitore_predefinito()
+    for ticker in (investimenti if tickers is None else tickers):
+        ticker = ticker.upper()
+        valute[ticker] = next((op["valuta"] for op in reversed(investimenti.get(ticker, [])) if op.get("valuta")), None)
+        if valute[ticker] is None and hasattr(fornitore, "ultima_quotazione"):
+            quotazione = fornitore.ultima_quotazione(ticker)
+            valute[ticker] = quotazione.get("valuta") if quotazione else None
+        if valute[ticker] is None:
+            ignote.append(ticker)
+    if ignote and rete:
+        for ticker, quotazione in recupera_quotazioni(ignote).items():
+            if quotazione and quotazione.get("valuta"):
+                valute[ticker] = quotazione["valuta"]
+    # una quotazione senza valuta (non dovrebbe capitare) resta ignota: non si presume la valuta base
+    return {t: normalizza_valuta(v) if v else None for t, v in valute.items()}
+
+def completa_valute(operazioni=None, rete=True):
+    """Scrive la valuta nelle operazioni salvate prima che la si registrasse con ogni operazione.
+
+    Serve una volta sola: poi ogni operazione ha la sua valuta e questa funzione non fa niente.
+    I ticker di cui il fornitore non conosce la valuta si riprovano alla prossima chiamata.
+    Può girare fuori dal thread di Tk: tocca solo il file (operazioni è una copia di investimenti)
+    e ritorna (valute, dati, versione) da passare ad applica_valute, None se non ha scritto nulla.
+    """
+    operazioni = investimenti if operazioni is None else operazioni
+    mancanti = [t for t, ops in operazioni.items() if any(not op.get("valuta") for op in ops)]
+    if not mancanti:
+        return None
+    valute = {t: v for t, v in valute_titoli(mancanti, rete).items() if v is not None}
+    if not valute:
+        return None
+    versione_scritta = None
+
+    def completa(dati):
+        for ticker, valuta in valute.items():
+            for op in dati.get(ticker, []):
+                if not op.get("valuta"):
+                    op["valuta"] = valuta
+        return dati
+
+    def scrivi(dati):
+        nonlocal versione_scritta
+        _scrivi_json(percorso_file, dati, 4)
+        versione_scritta = leggi_versione(percorso_file) + 1  # aggiorna() la incrementa subito dopo
+
+    dati = aggiorna(percorso_file, _leggi_investimenti, completa, scrivi)
+    return valute, dati, versione_scritta
+
+def applica_valute(completate):
+    """Porta in memoria le operazioni scritte da completa_valute (sul thread di Tk)."""
+    global _versione_investimenti
+    if not completate:
+        return
+    _, dati, versione = completate
+    if leggi_versione(percorso_file) != versione:
+        # nel frattempo è stata registrata un'altra operazione: si riparte dal file
+        versione = leggi_versione(percorso_file)
+        dati = _leggi_investimenti()
+    investimenti.clear()
+    investimenti.update(dati)
+    motore_posizioni.ricostruisci(investimenti)
+    _versione_investimenti = versione
 
 def carica_storico():
     percorso_storico = "data/storico_portafoglio.json"
@@ -46,99 +131,246 @@ def carica_storico():
             storico = json.load(f)
             # Lista di tuple (data stringa, valore)
             return [(item["data"], item["valore"]) for item in storico]
-    except FileNotFoundError:
+    except (FileNotFoundError, json.JSONDecodeError):
         return []
 
 def salva_valore_portafoglio(valore_totale):
     percorso_storico = "data/storico_portafoglio.json"
 
-    try:
-        with open(percorso_storico, "r") as f:
-            storico = json.load(f)
-    except FileNotFoundError:
-        storico = []
+    def leggi():
+        try:
+            with open(percorso_storico, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
 
     oggi = datetime.now().strftime("%Y-%m-%d")
 
-    # se più movimenti nella stessa data
-    if storico and storico[-1]["data"] == oggi:
-        storico[-1]["valore"] = valore_totale
-    else:
-        storico.append({"data": oggi, "valore": valore_totale})
+    def aggiungi(storico):
+        # se più movimenti nella stessa data
+        if storico and storico[-1]["data"] == oggi:
+            storico[-1]["valore"] = valore_totale
+        else:
+            storico.append({"data": oggi, "valore": valore_totale})
+        return storico
 
-    with open(percorso_storico, "w") as f:
-        json.dump(storico, f, indent=2)
+    aggiorna(percorso_storico, leggi, aggiungi, lambda storico: _scrivi_json(percorso_storico, storico, 2))
 
-def mostra_grafico_andamento(frame_genitore, percorso_storico="data/storico_portafoglio.json"):
-    # Pulisce eventuali grafici o widget precedenti
-    for widget in frame_genitore.winfo_children():
-        widget.destroy()
+def _quotazioni_note(tickers):
+    # ultime quotazioni in cache, anche scadute, senza andare in rete
+    fornitore = fornitore_predefinito()
+    if not hasattr(fornitore, "ultima_quotazione"):
+        return {}
+    quotazioni = {t: fornitore.ultima_quotazione(t) for t in tickers}
+    return {t: q for t, q in quotazioni.items() if q}
 
+def _prezzi_noti():
+    return {t: q["prezzo"] for t, q in _quotazioni_note(investimenti).items()}
+
+def serie_andamento(percorso_storico="data/storico_portafoglio.json"):
+    """{data: valore} giorno per giorno, ricostruito dalle operazioni e dall'archivio prezzi.
+
+    Senza operazioni si usano i punti salvati in storico_portafoglio.json.
+    """
+    from prezzi_storici import archivio, serie_valore_dict
+
+    if any(investimenti.values()):
+        # ogni giorno al cambio di quel giorno: la serie è nella valuta base
+        return serie_valore_dict(investimenti, archivio, _prezzi_noti(), valute=valute_titoli(), cambi=cambi)
     try:
         with open(percorso_storico, "r") as f:
             storico = json.load(f)
     except (json.JSONDecodeError, FileNotFoundError):
-        tk.Label(frame_genitore, text="Nessun dato disponibile per il grafico.", bg="lightgray", height=5).pack(fill="x")
-        return
+        return {}
+    # storico_portafoglio.json è una lista di {"data", "valore"}
+    return {item["data"]: item["valore"] for item in storico}
+
+def mostra_grafico_andamento(frame_genitore, percorso_storico="data/storico_portafoglio.json", completa_archivio=True):
+    # il grafico (una Figure per finestra) si riusa: si tolgono solo i messaggi precedenti
+    grafico = getattr(frame_genitore, "grafico", None)
+    for widget in frame_genitore.winfo_children():
+        if grafico is None or widget is not grafico.widget:
+            widget.destroy()
+
+    storico = serie_andamento(percorso_storico)
+
+    if completa_archivio and any(investimenti.values()):
+        # scarica in background solo le chiusure che mancano, poi ridisegna
+        from prezzi_storici import archivio, intervalli_da_coprire
+
+        def ridisegna(risultato):
+            scaricati, completate = risultato
+            applica_valute(completate)  # qui, sul thread di Tk: il worker non tocca investimenti
+            if scaricati or completate:
+                mostra_grafico_andamento(frame_genitore, percorso_storico, completa_archivio=False)
+
+        istantanea = {t: list(ops) for t, ops in investimenti.items()}
+
+        def completa():
+            # prima le valute delle operazioni vecchie (servono a scegliere i cambi da scaricare)
+            completate = completa_valute(istantanea)
+            valute = valute_titoli(istantanea)
+            if completate:
+                valute.update(completate[0])
+            intervalli = intervalli_da_coprire(istantanea)
+            intervalli.update(cambi.intervalli_storici(intervalli, valute))  # e i cambi degli stessi giorni
+            return archivio.completa_tutti(intervalli, fornitore_predefinito()), completate
+
+        esegui(frame_genitore, completa, al_termine=ridisegna)
 
     if not storico or len(storico) < 2:
-        tk.Label(frame_genitore, text="Dati insufficienti per generare un grafico, torna domani :P", bg="lightgray", height=5).pack(fill="x")
+        if grafico is not None:
+            grafico.widget.pack_forget()
+        testo = "Nessun dato disponibile per il grafico." if not storico else "Dati insufficienti per generare un grafico, torna domani :P"
+        tk.Label(frame_genitore, text=testo, bg="lightgray", height=5).pack(fill="x")
         return
 
     try:
-        date = [datetime.strptime(d, "%Y-%m-%d") for d in storico.keys()]
-        valori = list(storico.values())
-
-        fig, ax = plt.subplots(figsize=(5, 2.5))
-        ax.plot(date, valori, marker='o', color='green')
-        ax.set_title("Valore portafoglio nel tempo")
-        ax.set_xlabel("Data")
-        ax.set_ylabel("Valore (€)")
-        ax.grid(True)
-
-        canvas = FigureCanvasTkAgg(fig, master=frame_genitore)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill="x", padx=20, pady=5)
+        if grafico is None:
+            # matplotlib pesa da solo quasi quanto tutto il resto: si importa solo qui
+            from utils.grafici import GraficoSerie
+            grafico = frame_genitore.grafico = GraficoSerie(frame_genitore, "Valore portafoglio nel tempo",
+                                                                 f"Valore ({simbolo()})")
+        grafico.widget.pack(fill="x", padx=20, pady=5)
+        # i punti vengono ridotti alla larghezza del grafico: anni di storico si disegnano subito
+        grafico.mostra(list(storico.keys()), list(storico.values()))
     except Exception as e:
         print(f"Errore nella generazione del grafico: {e}")
         tk.Label(frame_genitore, text="Errore nella visualizzazione del grafico.", bg="lightgray", height=5).pack(fill="x")
 
-def calcola_pmu(storico):
-    totale_costo = 0
-    totale_quantita = 0
-
-    for op in storico:
-        if op["tipo"] == "acquisto":
-            totale_costo += op["quantita"] * op["prezzo_unitario"]
-            totale_quantita += op["quantita"]
-        elif op["tipo"] == "vendita":
-            totale_quantita -= op["quantita"]
+class SchedulerValutazione:
+    """Ricalcola e salva il valore del portafoglio su un thread di lavoro.
+
+    Le richieste che arrivano mentre una valutazione è in attesa vengono fuse in una sola
+    (un acquisto e una vendita di fila = una valutazione). Il risultato torna a Tk con after():
+    il thread di lavoro non tocca mai i widget.
+    """
+
+    def __init__(self, attesa=0.5):
+        self.attesa = attesa  # secondi per raccogliere una raffica di operazioni
+        self._evento = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._risultati = queue.Queue()
+        self._in_attesa = []  # (widget, callback) da avvisare alla prossima valutazione
+        self._da_consegnare = 0  # callback registrate e non ancora chiamate
+
+    def richiedi(self, widget=None, al_termine=None):
+        """Accoda una valutazione; se dato, al_termine(valore) viene chiamato sul thread di Tk."""
+        with self._lock:
+            if widget is not None and al_termine is not None:
+                self._in_attesa.append((widget, al_termine))
+                self._da_consegnare += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._ciclo, daemon=True)
+                self._thread.start()
+        self._evento.set()
+        if widget is not None and al_termine is not None:
+            widget.after(100, self._consegna, widget)
+
+    def _ciclo(self):
+        while True:
+            self._evento.wait()
+            time.sleep(self.attesa)
+            self._evento.clear()
+            with self._lock:
+                destinatari, self._in_attesa = self._in_attesa, []
+            try:
+                valore = valuta_quantita(motore_posizioni.quantita_posseduta())
+                salva_valore_portafoglio(valore)
+            except Exception as e:
+                print(f"Errore nella valutazione del portafoglio: {e}")
+                valore = None
+            for destinatario in destinatari:
+                self._risultati.put((destinatario, valore))
+
+    def _consegna(self, widget):
+        # gira sul thread di Tk: chiama le callback dei risultati pronti, poi riprova finché ne mancano
+        while True:
+            try:
+                (destinatario, al_termine), valore = self._risultati.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._da_consegnare -= 1
+            # valore None = valutazione fallita, non c'è niente da mostrare
+            if valore is None:
+                continue
+            try:
+                if destinatario.winfo_exists():
+                    al_termine(valore)
+            except tk.TclError:
+                pass  # finestra chiusa nel frattempo
+        with self._lock:
+            ancora = self._da_consegnare > 0
+        if ancora:
+            try:
+                widget.after(100, self._consegna, widget)
+            except tk.TclError:
+                pass
+
+
+scheduler_valutazione = SchedulerValutazione()
+# (finestra investimenti aperta, callback che ne aggiorna il totale): dopo un acquisto o una vendita
+# il valore ricalcolato arriva lì senza aspettare il giro successivo delle quotazioni
+_vista_valore = (None, None)
+
+def registra_operazione(ticker, operazione):
+    """Aggiunge l'operazione a investimenti.json senza perdere quelle scritte da altri processi.
+
+    Il file si rilegge e si riscrive sotto lock con controllo di versione (blocchi_file.aggiorna).
+    Se nel frattempo un altro processo lo aveva modificato, dati in memoria e posizioni si
+    riallineano al file; altrimenti basta aggiornare la posizione del ticker.
+    """
+    global _versione_investimenti
+    versione_scritta = None
+
+    def aggiungi(dati):
+        dati.setdefault(ticker, []).append(operazione)
+        return dati
+
+    def scrivi(dati):
+        nonlocal versione_scritta
+        _scrivi_json(percorso_file, dati, 4)
+        versione_scritta = leggi_versione(percorso_file) + 1  # aggiorna() la incrementa subito dopo
+
+    dati = aggiorna(percorso_file, _leggi_investimenti, aggiungi, scrivi)
+    if versione_scritta == _versione_investimenti + 1:
+        investimenti.setdefault(ticker, []).append(operazione)
+        motore_posizioni.registra(ticker, operazione)
+    else:
+        investimenti.clear()
+        investimenti.update(dati)
+        motore_posizioni.ricostruisci(investimenti)
+    _versione_investimenti = versione_scritta
 
-    if totale_quantita == 0:
-        return 0
+# calcola_pmu e calcola_quantita_posseduta scorrono tutto lo storico passato:
+# per i ticker in portafoglio usare motore_posizioni, che è già aggiornato
 
-    return totale_costo / totale_quantita
+def calcola_pmu(storico):
+    posizione = Posizione()
+    for op in in_ordine(storico):
+        posizione.applica(op)
+    return posizione.pmu
 
 def calcola_quantita_posseduta(storico):
-    return sum(
-        op["quantita"] if op.get("tipo", "acquisto") == "acquisto" else -op["quantita"]
-        for op in storico
-    )
+    posizione = Posizione()
+    for op in in_ordine(storico):
+        posizione.applica(op)
+    return posizione.quantita
 
 def recupera_info_ticker(ticker):
-    try:
-        stock = yf.Ticker(ticker)
-        info = stock.info
-        if "shortName" not in info or info["regularMarketPrice"] is None:
-            return None
-        return {
-            "nome": info["shortName"],
-            "prezzo": info["regularMarketPrice"]
-        }
-    except Exception:
+    quotazione = recupera_quotazioni([ticker]).get(ticker.upper())
+    if quotazione is None:
         return None
+    return {
+        "nome": quotazione["nome"],
+        "prezzo": quotazione["prezzo"],
+        "valuta": normalizza_valuta(quotazione.get("valuta"))
+    }
 
 def acquista_azione(ticker, quantita, prezzo=None, data=None):
+    # prezzo nella valuta del titolo, che resta salvata con l'operazione
     ticker = ticker.upper()
 
     if prezzo is None:
@@ -146,6 +378,9 @@ def acquista_azione(ticker, quantita, prezzo=None, data=None):
         if not info:
             return {"successo": False, "errore": "Ticker non valido o dati non disponibili."}
         prezzo = info["prezzo"]
+        valuta = info["valuta"]
+    else:
+        valuta = valuta_ticker(ticker, rete=True)
 
     if data is None:
         data = datetime.now().strftime("%Y-%m-%d")
@@ -164,19 +399,14 @@ def acquista_azione(ticker, quantita, prezzo=None, data=None):
         "tipo": "acquisto",
         "data": data,
         "quantita": quantita,
-        "prezzo_unitario": prezzo
+        "prezzo_unitario": prezzo,
+        "valuta": valuta
     }
 
-    if ticker not in investimenti:
-        investimenti[ticker] = []
-
-    investimenti[ticker].append(operazione)
+    registra_operazione(ticker, operazione)
 
-    with open(percorso_file, "w") as f:
-        json.dump(investimenti, f, indent=4)
-
-    valore = calcola_valore_portafoglio(investimenti)
-    salva_valore_portafoglio(valore)
+    # la valutazione (prezzi di tutti i titoli) avviene in background
+    scheduler_valutazione.richiedi(*_vista_valore)
 
     return {"successo": True, "dati": operazione}
 
@@ -204,7 +434,8 @@ def apri_popup_acquisto():
     check_prezzo_attuale.grid(row=2, column=0, columnspan=2, pady=5)
 
     # Campi per prezzo e data manuali
-    tk.Label(popup, text="Prezzo (€):").grid(row=3, column=0, padx=10, pady=5, sticky="e")
+    lbl_prezzo = tk.Label(popup, text="Prezzo (valuta del titolo):")
+    lbl_prezzo.grid(row=3, column=0, padx=10, pady=5, sticky="e")
     entry_prezzo = tk.Entry(popup)
     entry_prezzo.grid(row=3, column=1, padx=10, pady=5)
 
@@ -220,6 +451,14 @@ def apri_popup_acquisto():
 
     toggle_campi_manual_price()  # inizializza lo stato corretto
 
+    def aggiorna_valuta(event=None):
+        # il prezzo manuale è nella valuta in cui è quotato il titolo (se già nota, senza rete)
+        ticker = entry_ticker.get().strip().upper()
+        if ticker:
+            lbl_prezzo.config(text=f"Prezzo ({valuta_ticker(ticker) or 'valuta del titolo'}):")
+
+    entry_ticker.bind("<FocusOut>", aggiorna_valuta)
+
     def conferma_acquisto():
         ticker = entry_ticker.get().strip().upper()
         try:
@@ -242,7 +481,8 @@ def apri_popup_acquisto():
             risultato = acquista_azione(ticker, quantita, prezzo=prezzo, data=data)
 
         if risultato["successo"]:
-            messagebox.showinfo("Successo", f"Acquistate {quantita} azioni di {ticker} a {risultato['dati']['prezzo_unitario']} €.")
+            dati = risultato["dati"]
+            messagebox.showinfo("Successo", f"Acquistate {quantita} azioni di {ticker} a {dati['prezzo_unitario']} {simbolo(dati['valuta'])}.")
             popup.destroy()
         else:
             messagebox.showerror("Errore", risultato["errore"])
@@ -260,6 +500,7 @@ def vendi_azione(ticker, quantita, prezzo=None, data=None):
         if not info:
             return {"successo": False, "errore": "Impossibile recuperare il prezzo corrente."}
         prezzo = info["prezzo"]
+    valuta = valuta_ticker(ticker, rete=True)  # la stessa degli acquisti: PMU e guadagno sono in questa valuta
 
     if data is None:
         data = datetime.now().strftime("%Y-%m-%d")
@@ -273,32 +514,29 @@ def vendi_azione(ticker, quantita, prezzo=None, data=None):
         else:
             return {"successo": False, "errore": "Formato data non valido."}
 
-    # Calcolo quantità posseduta
-    storico = investimenti[ticker]
-    quantita_posseduta = calcola_quantita_posseduta(storico)
-    if quantita > quantita_posseduta:
+    # Quantità posseduta e PMU (prezzo medio unitario) dalla posizione corrente
+    posizione = motore_posizioni.posizione(ticker)
+    if quantita > posizione.quantita + EPSILON_QUANTITA:
         return {"successo": False, "errore": "Quantità non disponibile per la vendita."}
 
-    # Calcolo PMU (prezzo medio unitario)
-    pmu = calcola_pmu(storico)
+    pmu = posizione.pmu
 
     guadagno_per_azione = prezzo - pmu
-    guadagno_totale = guadagno_per_azione * quantita
+    # in centesimi, con lo stesso calcolo che la posizione usa per il realizzato
+    guadagno_totale = posizione.guadagno_vendita(quantita, prezzo)
 
     operazione = {
         "tipo": "vendita",
         "data": data,
         "quantita": quantita,
-        "prezzo_unitario": prezzo
+        "prezzo_unitario": prezzo,
+        "valuta": valuta
     }
 
-    investimenti[ticker].append(operazione)
-
-    with open(percorso_file, "w") as f:
-        json.dump(investimenti, f, indent=4)
+    registra_operazione(ticker, operazione)
 
-    valore = calcola_valore_portafoglio(investimenti)
-    salva_valore_portafoglio(valore)
+    # la valutazione (prezzi di tutti i titoli) avviene in background
+    scheduler_valutazione.richiedi(*_vista_valore)
 
     return {
         "successo": True,
@@ -308,7 +546,8 @@ def vendi_azione(ticker, quantita, prezzo=None, data=None):
             "prezzo_vendita": prezzo,
             "pmu": pmu,
             "guadagno_per_azione": guadagno_per_azione,
-            "guadagno_totale": guadagno_totale
+            "guadagno_totale": guadagno_totale,
+            "valuta": valuta
         }
     }
 
@@ -325,7 +564,7 @@ def apri_popup_vendita():
 
     # Etichetta e combobox per il ticker
     tk.Label(popup, text="Ticker:").grid(row=0, column=0, padx=10, pady=(15, 5), sticky="e")
-    ticker_posseduti = sorted([t for t in investimenti if calcola_quantita_posseduta(investimenti[t]) > 0])
+    ticker_posseduti = motore_posizioni.tickers_posseduti()
     entry_ticker = ttk.Combobox(popup, values=ticker_posseduti, state="readonly", width=18)
     entry_ticker.grid(row=0, column=1, padx=10, pady=(15, 5))
 
@@ -343,8 +582,9 @@ def apri_popup_vendita():
     def aggiorna_quantita_posseduta():
         ticker = entry_ticker.get().upper()
         if ticker in investimenti:
-            quantita = calcola_quantita_posseduta(investimenti[ticker])
+            quantita = motore_posizioni.quantita(ticker)
             lbl_quantita_posseduta.config(text=f"Quantità posseduta: {quantita}")
+            lbl_prezzo.config(text=f"Prezzo unitario ({valuta_ticker(ticker) or 'valuta del titolo'}):")
         else:
             lbl_quantita_posseduta.config(text="Ticker non trovato.")
 
@@ -363,7 +603,8 @@ def apri_popup_vendita():
     entry_data = tk.Entry(popup, width=20)
     entry_data.grid(row=4, column=1, padx=10, pady=5)
 
-    tk.Label(popup, text="Prezzo unitario (€):").grid(row=5, column=0, padx=10, pady=5, sticky="e")
+    lbl_prezzo = tk.Label(popup, text="Prezzo unitario:")
+    lbl_prezzo.grid(row=5, column=0, padx=10, pady=5, sticky="e")
     entry_prezzo = tk.Entry(popup, width=20)
     entry_prezzo.grid(row=5, column=1, padx=10, pady=5)
 
@@ -398,12 +639,13 @@ def apri_popup_vendita():
 
         if risultato["successo"]:
             dati = risultato["dati"]
+            valuta = simbolo(dati["valuta"])
             messagebox.showinfo(
                 "Vendita completata",
-                f"Hai venduto {dati['quantita_venduta']} azioni di {dati['ticker']} a {dati['prezzo_vendita']:.2f} €\n"
-                f"PMU: {dati['pmu']:.2f} €\n"
-                f"Guadagno per azione: {dati['guadagno_per_azione']:.2f} €\n"
-                f"Totale: {dati['guadagno_totale']:.2f} €"
+                f"Hai venduto {dati['quantita_venduta']} azioni di {dati['ticker']} a {dati['prezzo_vendita']:.2f} {valuta}\n"
+                f"PMU: {dati['pmu']:.2f} {valuta}\n"
+                f"Guadagno per azione: {dati['guadagno_per_azione']:.2f} {valuta}\n"
+                f"Totale: {dati['guadagno_totale']:.2f} {valuta}"
             )
             popup.destroy()
         else:
@@ -411,6 +653,62 @@ def apri_popup_vendita():
 
     tk.Button(popup, text="Conferma", command=conferma_vendita).grid(row=6, column=0, columnspan=2, pady=10)
 
+def calcola_dettagli():
+    """Dati della finestra "Dettagli avanzati" (quotazioni, serie e cambi: gira in background)."""
+    # pandas/numpy servono solo qui: si importano all'apertura della finestra
+    from analisi_portafoglio import analizza
+
+    prezzi = {t: q["prezzo"] for t, q in recupera_quotazioni(investimenti, accetta_scadute=True).items() if q}
+    # serie giornaliera ricostruita: rendimenti e drawdown non dipendono da quando si è operato;
+    # operazioni e prezzi convertiti nella valuta base (ogni operazione al cambio del suo giorno)
+    return analizza(investimenti, prezzi, storico=serie_andamento(), valute=valute_titoli(rete=True), cambi=cambi)
+
+def apri_finestra_dettagli():
+    finestra = tk.Toplevel()
+    finestra.title("Dettagli avanzati")
+    finestra.geometry("820x420")
+
+    lbl_riepilogo = tk.Label(finestra, text="", justify="left", font=("Helvetica", 11))
+    lbl_riepilogo.pack(padx=20, pady=10, anchor="w")
+
+    colonne = ("Ticker", "Quantità", "PMU", "Prezzo", "Valore", "Realizzato", "Non realizzato")
+    tabella = ttk.Treeview(finestra, columns=colonne, show="headings")
+    for col in colonne:
+        tabella.heading(col, text=col)
+        tabella.column(col, anchor="center", width=110)
+    tabella.pack(fill="both", expand=True, padx=20, pady=(0, 10))
+
+    def percentuale(x):
+        return "N/D" if x != x else f"{x * 100:+.2f}%"  # x != x: NaN
+
+    def euro(x):
+        return "N/D" if x != x else formatta_importo(x)
+
+    def mostra(risultato):
+        lbl_riepilogo.config(text=(
+            f"Costo di carico: {formatta_importo(risultato['costo'])}    Valore: {formatta_importo(risultato['valore'])}\n"
+            f"P&L realizzato: {risultato['realizzato']:+,.2f} {simbolo()}    "
+            f"P&L non realizzato: {risultato['non_realizzato']:+,.2f} {simbolo()}\n"
+            f"Rendimento time-weighted: {percentuale(risultato['twr'])}    "
+            f"Money-weighted (annuo): {percentuale(risultato['mwr'])}    "
+            f"Max drawdown: {percentuale(risultato['max_drawdown'])}"
+        ))
+        for ticker, riga in risultato["per_ticker"].iterrows():
+            tabella.insert("", "end", values=(
+                ticker,
+                f"{riga['quantita']:g}",
+                euro(riga["pmu"]),
+                euro(riga["prezzo"]),
+                euro(riga["valore"]),
+                euro(riga["realizzato"]),
+                euro(riga["non_realizzato"])
+            ))
+
+    def fallito(e):
+        lbl_riepilogo.config(text=f"Analisi non disponibile: {e}")
+
+    esegui(finestra, calcola_dettagli, al_termine=mostra, in_errore=fallito, indicatore=lbl_riepilogo)
+
 def apri_finestra_investimenti():
     finestra = tk.Toplevel()
     finestra.title("Gestione Investimenti")
@@ -421,7 +719,7 @@ def apri_finestra_investimenti():
     finestra.geometry(f"{larghezza}x{altezza}+{x}+{y}")
 
     # Valore totale portafoglio (inizialmente 0, verrà aggiornato dopo)
-    lbl_valore_totale = tk.Label(finestra, text="Valore Totale: €0.00", font=("Helvetica", 14, "bold"))
+    lbl_valore_totale = tk.Label(finestra, text=formatta_totale(0), font=("Helvetica", 14, "bold"))
     lbl_valore_totale.pack(pady=10)
 
     # Frame per il grafico
@@ -443,45 +741,41 @@ def apri_finestra_investimenti():
 
     tabella.pack(fill="both", expand=True)
 
-    valore_totale_portafoglio = 0.0
+    lbl_stato = tk.Label(finestra, text="", fg="gray")
+    lbl_stato.pack()
 
-    for ticker, operazioni in investimenti.items():
-        quantita_totale = calcola_quantita_posseduta(operazioni)
+    # tabella aggiornata a ogni giro della centrale: all'apertura gli ultimi prezzi noti, poi solo le righe che cambiano
+    # (quantita_posseduta salta i titoli completamente venduti)
+    aggiornatore = AggiornatoreQuotazioni(motore_posizioni.quantita_posseduta)
 
-        if quantita_totale <= 0:
-            continue  # Salta i titoli completamente venduti
+    def valore_aggiornato(valore):
+        lbl_valore_totale.config(text=formatta_totale(valore))
 
-        try:
-            yf_ticker = yf.Ticker(ticker)
-            info = yf_ticker.info
-            prezzo_corrente = info.get("regularMarketPrice")
-            prezzo_precedente = info.get("previousClose", prezzo_corrente)
+    global _vista_valore
+    _vista_valore = (finestra, valore_aggiornato)
 
-            if prezzo_corrente is None:
-                raise ValueError("Prezzo non disponibile")
+    def chiusa(event):
+        global _vista_valore
+        if event.widget is finestra and _vista_valore[0] is finestra:
+            _vista_valore = (None, None)
 
-            variazione = prezzo_corrente - prezzo_precedente
-            variazione_percentuale = (variazione / prezzo_precedente) * 100 if prezzo_precedente else 0
+    finestra.bind("<Destroy>", chiusa, add="+")
 
-            valore = quantita_totale * prezzo_corrente
-            valore_totale_portafoglio += valore
+    def quotazioni_aggiornate(differenze):
+        applica_a_tabella(tabella, lbl_valore_totale, differenze)
+        if differenze.istante is not None:
+            stato = f"Aggiornato alle {time.strftime('%H:%M:%S', time.localtime(differenze.istante))}"
+            if not differenze.aperto:
+                stato += " (mercato chiuso)"
+            lbl_stato.config(text=stato)
 
-            tabella.insert("", "end", values=(
-                ticker,
-                f"{quantita_totale}",
-                f"{valore:.2f} €",
-                f"{variazione_percentuale:+.2f}%"
-            ))
-        except Exception as e:
-            tabella.insert("", "end", values=(
-                ticker,
-                f"{quantita_totale}",
-                "Errore",
-                "N/D"
-            ))
+    def quotazioni_fallite(e):
+        lbl_stato.config(text="Quotazioni non disponibili, nuovo tentativo al prossimo aggiornamento")
 
-    # Aggiorna il valore totale del portafoglio
-    lbl_valore_totale.config(text=f"Valore Totale: €{valore_totale_portafoglio:,.2f}")
+    # all'apertura i prezzi in cache, poi scarica solo la centrale: il suo primo giro (subito, o
+    # anticipato se ci sono ticker mai visti) è l'unico download, niente aggiornamento a parte
+    centrale.precarica(_quotazioni_note(motore_posizioni.quantita_posseduta()))
+    aggiornatore.avvia(finestra, quotazioni_aggiornate, in_errore=quotazioni_fallite)
 
     # Pulsanti operazioni
     frame_bottoni = tk.Frame(finestra)
@@ -494,9 +788,8 @@ def apri_finestra_investimenti():
     btn_vendi.grid(row=0, column=1, padx=10)
 
     btn_dettagli = tk.Button(frame_bottoni, text="Dettagli avanzati", width=18,
-                             command=lambda: messagebox.showinfo("In sviluppo", "Dettagli avanzati in sviluppo"))
+                             command=apri_finestra_dettagli)
     btn_dettagli.grid(row=0, column=2, padx=10)
 
-    btn_watchlist = tk.Button(frame_bottoni, text="Watchlist", width=15,
-                              command=lambda: messagebox.showinfo("In sviluppo", "Watchlist in sviluppo"))
+    btn_watchlist = tk.Button(frame_bottoni, text="Watchlist", width=15, command=apri_finestra_watchlist)
     btn_watchlist.grid(row=0, column=3, padx=10)
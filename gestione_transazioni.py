@@ -3,30 +3,289 @@
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk, messagebox
-from logica_transazioni import registra_transazione
+from logica_transazioni import registra_transazione, transazione_atomica
+from ricerca_transazioni import IndiceTransazioni
+import aggregati
+from utils.attivita import esegui
+
+COLONNE_TRANSAZIONI = ("Data", "Conto", "Categoria", "Importo", "Descrizione")
+_CAMPI = {"Data": "data", "Conto": "conto", "Categoria": "categoria", "Importo": "importo", "Descrizione": "descrizione"}
+
+
+class TabellaVirtuale:
+    """Treeview che tiene solo una finestra di righe attorno a quelle visibili.
+
+    Nel widget ci sono al più `pagine` pagine da `pagina` righe: scorrendo verso il fondo si
+    aggiunge una pagina sotto e si toglie la prima, verso l'inizio il contrario, così il Treeview
+    resta piccolo anche dopo aver scorso tutto un ledger enorme. La scrollbar mostra la posizione
+    nell'intera lista. Ordinamento e formattazione lavorano sui dati (una lista di indici), non sui widget.
+    """
+
+    def __init__(self, master, transazioni, pagina=200, pagine=3, margine=0.1):
+        self.transazioni = transazioni
+        self.pagina = pagina
+        self.pagine = pagine
+        self.margine = margine  # frazione della finestra dai bordi oltre la quale si sposta la finestra
+        self.indici = list(range(len(transazioni)))
+        self.inizio = 0  # self.indici[inizio:fine] sono le righe presenti nel Treeview
+        self.fine = 0
+        self._spostamento_previsto = False
+        self.colonna_ordinamento = None
+        self.decrescente = False
+
+        contenitore = tk.Frame(master)
+        contenitore.pack(fill=tk.BOTH, expand=True)
+
+        self.tree = ttk.Treeview(contenitore, columns=COLONNE_TRANSAZIONI, show="headings")
+        for col in COLONNE_TRANSAZIONI:
+            self.tree.heading(col, text=col, command=lambda c=col: self.ordina(c))
+            self.tree.column(col, width=100)
+
+        self.scrollbar = ttk.Scrollbar(contenitore, orient="vertical", command=self._scrollbar)
+        self.tree.configure(yscrollcommand=self._scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Colori pastello
+        self.tree.tag_configure("entrata", background="#d5f5d5")
+        self.tree.tag_configure("uscita", background="#f7d6d6")
+
+        self._mostra_da(0)
+
+    def _valori(self, i):
+        tr = self.transazioni[i]
+        importo = tr["importo"]
+        tag = "entrata" if importo >= 0 else "uscita"
+        return (tr["data"], tr["conto"], tr["categoria"], f'{importo:.2f}', tr["descrizione"]), (tag,)
+
+    def _scroll(self, primo, ultimo):
+        # frazioni sulle righe presenti -> frazioni sull'intera lista, per la scrollbar
+        primo, ultimo = float(primo), float(ultimo)
+        totale, presenti = len(self.indici), self.fine - self.inizio
+        if totale:
+            self.scrollbar.set((self.inizio + primo * presenti) / totale, (self.inizio + ultimo * presenti) / totale)
+        else:
+            self.scrollbar.set(0, 1)
+        if self._spostamento_previsto:
+            return
+        if ultimo >= 1 - self.margine and self.fine < totale:
+            self._spostamento_previsto = True
+            # after_idle: non si toccano le righe dentro la callback di scroll
+            self.tree.after_idle(self._avanza)
+        elif primo <= self.margine and self.inizio > 0:
+            self._spostamento_previsto = True
+            self.tree.after_idle(self._arretra)
+
+    def _scrollbar(self, *args):
+        # trascinando la scrollbar si può saltare ovunque nella lista: fuori finestra si ricomincia da lì
+        if args[0] == "moveto":
+            riga = int(float(args[1]) * len(self.indici))
+            if self.inizio <= riga < self.fine - self.pagina // 2 or (riga >= self.inizio and self.fine == len(self.indici)):
+                self._vai_a(riga)
+            else:
+                self._mostra_da(riga)
+        else:
+            self.tree.yview(*args)
+
+    def _prima_visibile(self):
+        return self.inizio + round(float(self.tree.yview()[0]) * (self.fine - self.inizio))
+
+    def _vai_a(self, riga):
+        presenti = self.fine - self.inizio
+        self.tree.yview_moveto((riga - self.inizio) / presenti if presenti else 0)
+
+    def _togli_eccesso(self, in_cima):
+        eccesso = self.fine - self.inizio - self.pagina * self.pagine
+        if eccesso <= 0:
+            return
+        figli = self.tree.get_children()
+        if in_cima:
+            self.tree.delete(*figli[:eccesso])
+            self.inizio += eccesso
+        else:
+            self.tree.delete(*figli[-eccesso:])
+            self.fine -= eccesso
+
+    def _avanza(self):
+        self._spostamento_previsto = False
+        prima = self._prima_visibile()
+        fine = min(self.fine + self.pagina, len(self.indici))
+        for i in self.indici[self.fine:fine]:
+            valori, tag = self._valori(i)
+            self.tree.insert("", "end", values=valori, tags=tag)
+        self.fine = fine
+        self._togli_eccesso(in_cima=True)
+        self._vai_a(prima)
+
+    def _arretra(self):
+        self._spostamento_previsto = False
+        prima = self._prima_visibile()
+        inizio = max(self.inizio - self.pagina, 0)
+        for posizione, i in enumerate(self.indici[inizio:self.inizio]):
+            valori, tag = self._valori(i)
+            self.tree.insert("", posizione, values=valori, tags=tag)
+        self.inizio = inizio
+        self._togli_eccesso(in_cima=False)
+        self._vai_a(prima)
+
+    def _mostra_da(self, riga):
+        """Ricrea la finestra attorno a `riga` (posizione in self.indici) e la porta in cima."""
+        self.tree.delete(*self.tree.get_children())
+        riga = max(0, min(riga, len(self.indici) - 1))
+        self.inizio = max(riga - self.pagina, 0)
+        self.fine = min(self.inizio + self.pagina * self.pagine, len(self.indici))
+        for i in self.indici[self.inizio:self.fine]:
+            valori, tag = self._valori(i)
+            self.tree.insert("", "end", values=valori, tags=tag)
+        self._vai_a(riga)
+
+    def mostra(self, indici):
+        """Sostituisce le righe mostrate con le transazioni in `indici`, rispettando l'ordinamento scelto."""
+        self.indici = list(indici)
+        if self.colonna_ordinamento is not None:
+            self._ordina_indici()
+        self._ricarica()
+
+    def _ricarica(self):
+        self._mostra_da(0)
+
+    def _ordina_indici(self):
+        campo = _CAMPI[self.colonna_ordinamento]
+        if hasattr(self.transazioni, "chiavi_ordinamento"):
+            # TabellaTransazioni: ordinamento stabile su numpy invece di una chiave python per riga
+            import numpy as np
+            indici = np.asarray(self.indici, dtype=np.int64)
+            chiavi = self.transazioni.chiavi_ordinamento(campo)[indici]
+            ordine = np.argsort(-chiavi if self.decrescente else chiavi, kind="stable")
+            self.indici = indici[ordine].tolist()
+            return
+        if campo == "importo":
+            chiave = lambda i: self.transazioni[i]["importo"]
+        else:
+            chiave = lambda i: str(self.transazioni[i].get(campo, "")).lower()
+        self.indici.sort(key=chiave, reverse=self.decrescente)
+
+    def ordina(self, colonna):
+        if self.colonna_ordinamento == colonna:
+            self.decrescente = not self.decrescente
+        else:
+            self.colonna_ordinamento, self.decrescente = colonna, False
+        self._ordina_indici()
+        for col in COLONNE_TRANSAZIONI:
+            freccia = (" ▼" if self.decrescente else " ▲") if col == colonna else ""
+            self.tree.heading(col, text=col + freccia)
+        self._ricarica()
+
 
 def mostra_transazioni(cont_transactions, titolo="Transazioni"):
     """Mostra una finestra con una lista delle transazioni passate."""
     finestra = tk.Toplevel()
     finestra.title(titolo)
-    finestra.geometry("600x400")
+    finestra.geometry("760x450")
+
+    barra = tk.Frame(finestra, padx=5, pady=5)
+    barra.pack(fill=tk.X)
+    finestra.tabella = TabellaVirtuale(finestra, cont_transactions)
+
+    # l'indice si costruisce al primo filtro, così la finestra si apre comunque subito
+    indice = None
+
+    def campo(etichetta, colonna, widget):
+        tk.Label(barra, text=etichetta).grid(row=colonna // 8, column=colonna % 8, sticky="e")
+        widget.grid(row=colonna // 8, column=colonna % 8 + 1, sticky="w", padx=(0, 6))
+        return widget
+
+    entry_dal = campo("Dal:", 0, tk.Entry(barra, width=11))
+    entry_al = campo("Al:", 2, tk.Entry(barra, width=11))
+    combo_conto = campo("Conto:", 4, ttk.Combobox(barra, width=12))
+    combo_categoria = campo("Categoria:", 6, ttk.Combobox(barra, width=12))
+    entry_min = campo("Importo da:", 8, tk.Entry(barra, width=11))
+    entry_max = campo("a:", 10, tk.Entry(barra, width=11))
+    entry_testo = campo("Cerca:", 12, tk.Entry(barra, width=14))
+
+    def numero(entry):
+        testo = entry.get().strip().replace(",", ".")
+        return float(testo) if testo else None
+
+    def assicura_indice():
+        nonlocal indice
+        if indice is None:
+            indice = IndiceTransazioni(cont_transactions)
+            combo_conto.config(values=[""] + indice.conti())
+            combo_categoria.config(values=[""] + indice.categorie())
+
+    def applica_filtri():
+        finestra._filtro_previsto = None
+        assicura_indice()
+        try:
+            importo_min, importo_max = numero(entry_min), numero(entry_max)
+        except ValueError:
+            return  # importo scritto a metà: si aspetta il prossimo tasto
+        finestra.tabella.mostra(indice.filtra(
+            data_da=entry_dal.get().strip() or None,
+            data_a=entry_al.get().strip() or None,
+            conto=combo_conto.get().strip() or None,
+            categoria=combo_categoria.get().strip() or None,
+            importo_min=importo_min,
+            importo_max=importo_max,
+            testo=entry_testo.get()
+        ))
+
+    finestra._filtro_previsto = None
+
+    def filtro_ritardato(*_):
+        # si filtra quando l'utente smette di scrivere, non a ogni tasto
+        if finestra._filtro_previsto is not None:
+            finestra.after_cancel(finestra._filtro_previsto)
+        finestra._filtro_previsto = finestra.after(250, applica_filtri)
+
+    for widget in (entry_dal, entry_al, entry_min, entry_max, entry_testo, combo_conto, combo_categoria):
+        widget.bind("<KeyRelease>", filtro_ritardato)
+    for combo in (combo_conto, combo_categoria):
+        combo.bind("<<ComboboxSelected>>", filtro_ritardato)
+        combo.config(postcommand=assicura_indice)
+
+    return finestra
 
-    tree = ttk.Treeview(finestra, columns=("Data", "Conto", "Categoria", "Importo", "Descrizione"), show="headings")
-    for col in tree["columns"]:
+def mostra_report_mensile(root=None):
+    """Totali per mese e categoria letti dagli aggregati: non si scorre il ledger."""
+    finestra = tk.Toplevel(root)
+    finestra.title("Report mensile")
+    finestra.geometry("520x420")
+
+    barra = tk.Frame(finestra, padx=5, pady=5)
+    barra.pack(fill=tk.X)
+    tk.Label(barra, text="Dal mese:").pack(side=tk.LEFT)
+    entry_da = tk.Entry(barra, width=8)
+    entry_da.pack(side=tk.LEFT, padx=(0, 6))
+    tk.Label(barra, text="Al mese:").pack(side=tk.LEFT)
+    entry_a = tk.Entry(barra, width=8)
+    entry_a.pack(side=tk.LEFT, padx=(0, 6))
+    tk.Label(barra, text="Conto:").pack(side=tk.LEFT)
+    combo_conto = ttk.Combobox(barra, width=14, values=[""] + aggregati.conti_presenti())
+    combo_conto.pack(side=tk.LEFT)
+
+    colonne = ("Mese", "Categoria", "Totale", "N.")
+    tree = ttk.Treeview(finestra, columns=colonne, show="headings")
+    for col in colonne:
         tree.heading(col, text=col)
-        tree.column(col, width=100)
+        tree.column(col, width=110, anchor="center")
     tree.pack(fill=tk.BOTH, expand=True)
-
-    # Colori pastello
     tree.tag_configure("entrata", background="#d5f5d5")
     tree.tag_configure("uscita", background="#f7d6d6")
 
-    for tr in cont_transactions:
-        importo = tr["importo"]
-        tag = "entrata" if importo >= 0 else "uscita"
-        tree.insert("", "end", values=(
-            tr["data"], tr["conto"], tr["categoria"], f'{importo:.2f}', tr["descrizione"]
-        ), tags=(tag,))
+    def aggiorna(*_):
+        tree.delete(*tree.get_children())
+        for mese, categoria, totale, numero in aggregati.totali_per_categoria(
+                entry_da.get().strip() or None, entry_a.get().strip() or None, combo_conto.get().strip() or None):
+            # n.d.: somma di conti in una valuta senza tasso salvato
+            tree.insert("", "end", values=(mese, categoria, f"{totale:.2f}" if totale == totale else "n.d.", numero),
+                        tags=("entrata" if totale >= 0 else "uscita",))
+
+    tk.Button(barra, text="Aggiorna", command=aggiorna).pack(side=tk.LEFT, padx=6)
+    combo_conto.bind("<<ComboboxSelected>>", aggiorna)
+    aggiorna()
+    return finestra
 
 def aggiungi_transazione_popup(root, conti):
     def aggiorna_campi(*args):
@@ -56,9 +315,11 @@ def aggiungi_transazione_popup(root, conti):
                 descrizione = descrizione_entry.get()
                 if conto_origine not in conti or conto_destinazione not in conti:
                     raise ValueError("Conto origine o destinazione non valido.")
-                # Esegui giroconto
-                registra_transazione(-importo, conto_origine, "Giroconto", descrizione, data)
-                registra_transazione(importo, conto_destinazione, "Giroconto", descrizione, data)
+
+                def scrivi():
+                    # Esegui giroconto: entrambe le gambe in un'unica scrittura
+                    with transazione_atomica() as batch:
+                        batch.registra_giroconto(importo, conto_origine, conto_destinazione, "Giroconto", descrizione, data)
             else:
                 conto = conto_var.get()
                 categoria = categoria_entry.get()
@@ -68,14 +329,26 @@ def aggiungi_transazione_popup(root, conti):
                     importo = -importo
                 if conto not in conti:
                     raise ValueError("Conto non valido.")
-                registra_transazione(importo, conto, categoria, descrizione, data)
 
+                def scrivi():
+                    registra_transazione(importo, conto, categoria, descrizione, data)
+
+        except Exception as e:
+            messagebox.showerror("Errore", f"Errore: {e}")
+            return
+
+        def completata(_):
             messagebox.showinfo("Successo", "Transazione aggiunta.")
             finestra.destroy()
 
-        except Exception as e:
+        def fallita(e):
+            conferma_btn.config(state="normal")
             messagebox.showerror("Errore", f"Errore: {e}")
 
+        # la scrittura su disco avviene fuori dal thread di Tk
+        conferma_btn.config(state="disabled")
+        esegui(finestra, scrivi, al_termine=completata, in_errore=fallita, indicatore=stato_label)
+
     # --- GUI ---
     finestra = tk.Toplevel(root)
     finestra.title("Aggiungi Transazione")
@@ -129,6 +402,8 @@ def aggiungi_transazione_popup(root, conti):
     btn_frame.pack(pady=10)
     conferma_btn = tk.Button(btn_frame, text="Conferma", command=conferma)
     conferma_btn.pack()
+    stato_label = tk.Label(btn_frame, text="")
+    stato_label.pack()
 
     # Collegamento evento
     tipo_var.trace_add("write", aggiorna_campi)
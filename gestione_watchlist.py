@@ -0,0 +1,295 @@
+#watchlist: liste di ticker da seguire senza possederli e avvisi di prezzo
+#le quotazioni arrivano dalla stessa centrale della tabella investimenti: un ticker seguito da più viste si chiede una volta sola
+
+import json
+import os
+import re
+import time
+import tkinter as tk
+from tkinter import ttk, messagebox, simpledialog
+
+from aggiornamento_quotazioni import ConfrontoRighe, applica_a_tabella, centrale
+from blocchi_file import aggiorna
+
+percorso_watchlist = "data/watchlist.json"
+LISTA_PREDEFINITA = "Principale"
+
+
+def _vuota():
+    return {"liste": {LISTA_PREDEFINITA: []}, "avvisi": {}}
+
+def _leggi_watchlist():
+    if not os.path.exists(percorso_watchlist):
+        return _vuota()
+    try:
+        with open(percorso_watchlist, "r") as f:
+            contenuto = f.read().strip()
+            dati = json.loads(contenuto) if contenuto else _vuota()
+    except json.JSONDecodeError:
+        print("Errore nel parsing della watchlist. Il file potrebbe essere corrotto.")
+        return _vuota()
+    dati.setdefault("liste", {}).setdefault(LISTA_PREDEFINITA, [])
+    dati.setdefault("avvisi", {})
+    return dati
+
+def _scrivi_watchlist(dati):
+    os.makedirs(os.path.dirname(percorso_watchlist), exist_ok=True)
+    tmp = f"{percorso_watchlist}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(dati, f, indent=4)
+    os.replace(tmp, percorso_watchlist)
+
+watchlist = _leggi_watchlist()
+
+def modifica_watchlist(modifica):
+    """Applica modifica(dati) al file (riletto, così le modifiche di altri processi non si perdono)."""
+    global watchlist
+
+    def applica(dati):
+        modifica(dati)
+        return dati
+
+    watchlist = aggiorna(percorso_watchlist, _leggi_watchlist, applica, _scrivi_watchlist)
+    return watchlist
+
+
+def separa_tickers(testo):
+    """"aapl, msft  NVDA" -> ["AAPL", "MSFT", "NVDA"], senza duplicati."""
+    return list(dict.fromkeys(t.upper() for t in re.split(r"[\s,;]+", testo) if t))
+
+def aggiungi_tickers(lista, tickers):
+    def modifica(dati):
+        esistenti = dati["liste"].setdefault(lista, [])
+        esistenti.extend(t for t in tickers if t not in esistenti)
+    return modifica_watchlist(modifica)
+
+def rimuovi_tickers(lista, tickers):
+    def modifica(dati):
+        dati["liste"][lista] = [t for t in dati["liste"].get(lista, []) if t not in tickers]
+        # l'avviso resta solo se il ticker è ancora in qualche lista
+        seguiti = {t for l in dati["liste"].values() for t in l}
+        for ticker in tickers:
+            if ticker not in seguiti:
+                dati["avvisi"].pop(ticker, None)
+    return modifica_watchlist(modifica)
+
+def crea_lista(nome):
+    return modifica_watchlist(lambda dati: dati["liste"].setdefault(nome, []))
+
+def imposta_avviso(ticker, sopra=None, sotto=None):
+    """Soglie di prezzo per `ticker`; entrambe None tolgono l'avviso."""
+    def modifica(dati):
+        if sopra is None and sotto is None:
+            dati["avvisi"].pop(ticker, None)
+        else:
+            dati["avvisi"][ticker] = {"sopra": sopra, "sotto": sotto}
+    return modifica_watchlist(modifica)
+
+def tickers_con_avviso():
+    return list(watchlist["avvisi"])
+
+
+class ControlloAvvisi:
+    """Controlla le soglie a ogni giro. Un avviso scatta quando il prezzo supera la soglia e si
+    riarma solo quando il prezzo torna indietro: non si ripete a ogni aggiornamento."""
+
+    def __init__(self):
+        self._scattati = set()  # (ticker, "sopra" | "sotto")
+
+    def controlla(self, quotazioni, avvisi):
+        """Messaggi degli avvisi appena scattati."""
+        messaggi = []
+        for ticker, soglie in avvisi.items():
+            quotazione = quotazioni.get(ticker)
+            if quotazione is None or quotazione.get("prezzo") is None:
+                continue
+            prezzo = quotazione["prezzo"]
+            for verso, soglia in soglie.items():
+                if soglia is None:
+                    continue
+                superata = prezzo >= soglia if verso == "sopra" else prezzo <= soglia
+                chiave = (ticker, verso)
+                if superata and chiave not in self._scattati:
+                    self._scattati.add(chiave)
+                    messaggi.append(f"{ticker} a {prezzo:,.2f}: {verso} la soglia di {soglia:,.2f}")
+                elif not superata:
+                    self._scattati.discard(chiave)
+        return messaggi
+
+    def scattato(self, ticker):
+        return any(t == ticker for t, _ in self._scattati)
+
+
+controllo_avvisi = ControlloAvvisi()
+_iscrizione_avvisi = None
+
+def avvia_avvisi(widget):
+    """Iscrive gli avvisi alla centrale per tutta la vita di `widget` (la finestra principale)."""
+    global _iscrizione_avvisi
+
+    def ricevi(quotazioni, aperto, istante):
+        if istante is None:
+            return  # prezzi già noti, non un aggiornamento: non si avvisa due volte
+        for messaggio in controllo_avvisi.controlla(quotazioni, watchlist["avvisi"]):
+            widget.bell()
+            messagebox.showwarning("Avviso di prezzo", messaggio, parent=widget)
+
+    if _iscrizione_avvisi is not None:
+        centrale.richiedi(_iscrizione_avvisi)  # già attivo: basta chiedere i ticker nuovi
+    elif tickers_con_avviso():  # nessun avviso: la centrale non gira per niente
+        _iscrizione_avvisi = centrale.iscrivi(widget, tickers_con_avviso, ricevi)
+    return _iscrizione_avvisi
+
+
+def descrivi_avviso(ticker):
+    soglie = watchlist["avvisi"].get(ticker)
+    if not soglie:
+        return ""
+    parti = []
+    if soglie.get("sopra") is not None:
+        parti.append(f"≥ {soglie['sopra']:,.2f}")
+    if soglie.get("sotto") is not None:
+        parti.append(f"≤ {soglie['sotto']:,.2f}")
+    testo = " / ".join(parti)
+    return f"🔔 {testo}" if controllo_avvisi.scattato(ticker) else testo
+
+def formatta_riga_watchlist(ticker, quotazione):
+    """Valori della riga (Ticker, Nome, Prezzo, Variazione 1D, Avviso)."""
+    if quotazione is None or quotazione.get("prezzo") is None:
+        return (ticker, "", "N/D", "N/D", descrivi_avviso(ticker))
+    prezzo = quotazione["prezzo"]
+    precedente = quotazione.get("precedente")
+    variazione = (prezzo - precedente) / precedente * 100 if precedente else 0
+    valuta = quotazione.get("valuta") or ""
+    return (ticker, quotazione.get("nome") or "", f"{prezzo:,.2f} {valuta}".strip(),
+            f"{variazione:+.2f}%", descrivi_avviso(ticker))
+
+
+def apri_finestra_watchlist():
+    finestra = tk.Toplevel()
+    finestra.title("Watchlist")
+    larghezza = 750
+    altezza = 500
+    x = (finestra.winfo_screenwidth() // 2) - (larghezza // 2)
+    y = (finestra.winfo_screenheight() // 2) - (altezza // 2)
+    finestra.geometry(f"{larghezza}x{altezza}+{x}+{y}")
+
+    # Scelta della lista
+    frame_liste = tk.Frame(finestra)
+    frame_liste.pack(fill="x", padx=20, pady=10)
+
+    tk.Label(frame_liste, text="Lista:").pack(side="left")
+    lista_corrente = tk.StringVar(value=LISTA_PREDEFINITA)
+    combo_liste = ttk.Combobox(frame_liste, textvariable=lista_corrente, state="readonly",
+                               values=list(watchlist["liste"]))
+    combo_liste.pack(side="left", padx=5)
+
+    # Tabella
+    colonne = ("Ticker", "Nome", "Prezzo", "Variazione 1D", "Avviso")
+    tabella = ttk.Treeview(finestra, columns=colonne, show="headings", height=14)
+    for col in colonne:
+        tabella.heading(col, text=col)
+        tabella.column(col, anchor="center", width=130)
+    tabella.pack(fill="both", expand=True, padx=20)
+
+    lbl_stato = tk.Label(finestra, text="", fg="gray")
+    lbl_stato.pack()
+
+    confronto = ConfrontoRighe()
+    ultime = {}  # quotazioni dell'ultimo giro, per ridisegnare subito dopo una modifica
+
+    def tickers():
+        return list(watchlist["liste"].get(lista_corrente.get(), []))
+
+    def ricevi(quotazioni, aperto, istante):
+        ultime.clear()
+        ultime.update(quotazioni)
+        righe = {t: formatta_riga_watchlist(t, quotazioni.get(t)) for t in tickers()}
+        applica_a_tabella(tabella, None, confronto.confronta(righe))
+        if istante is not None:
+            stato = f"{len(righe)} titoli, aggiornati alle {time.strftime('%H:%M:%S', time.localtime(istante))}"
+            if not aperto:
+                stato += " (mercato chiuso)"
+            lbl_stato.config(text=stato)
+
+    def quotazioni_fallite(e):
+        lbl_stato.config(text="Quotazioni non disponibili, nuovo tentativo al prossimo aggiornamento")
+
+    iscrizione = centrale.iscrivi(finestra, tickers, ricevi, quotazioni_fallite)
+
+    def lista_cambiata():
+        # nuovi ticker (o un'altra lista): righe subito con i prezzi noti, i mancanti con un giro anticipato
+        combo_liste.config(values=list(watchlist["liste"]))
+        centrale.richiedi(iscrizione)
+
+    combo_liste.bind("<<ComboboxSelected>>", lambda e: lista_cambiata())
+
+    def nuova_lista():
+        nome = simpledialog.askstring("Nuova lista", "Nome della lista:", parent=finestra)
+        if not nome or not nome.strip():
+            return
+        crea_lista(nome.strip())
+        lista_corrente.set(nome.strip())
+        lista_cambiata()
+
+    tk.Button(frame_liste, text="Nuova lista", command=nuova_lista).pack(side="left", padx=5)
+
+    # Aggiunta e rimozione
+    frame_bottoni = tk.Frame(finestra)
+    frame_bottoni.pack(pady=10)
+
+    tk.Label(frame_bottoni, text="Ticker (anche più di uno):").grid(row=0, column=0, padx=5)
+    entry_ticker = tk.Entry(frame_bottoni, width=30)
+    entry_ticker.grid(row=0, column=1, padx=5)
+
+    def aggiungi():
+        nuovi = separa_tickers(entry_ticker.get())
+        if not nuovi:
+            return
+        aggiungi_tickers(lista_corrente.get(), nuovi)
+        entry_ticker.delete(0, tk.END)
+        lista_cambiata()
+
+    def rimuovi():
+        selezionati = list(tabella.selection())
+        if not selezionati:
+            messagebox.showinfo("Watchlist", "Seleziona uno o più titoli da rimuovere.", parent=finestra)
+            return
+        rimuovi_tickers(lista_corrente.get(), selezionati)
+        lista_cambiata()
+
+    def chiedi_soglia(testo, attuale):
+        # None se l'utente annulla, "" se lascia vuoto (nessuna soglia)
+        valore = simpledialog.askstring("Avviso di prezzo", testo, parent=finestra,
+                                        initialvalue="" if attuale is None else f"{attuale}")
+        return None if valore is None else valore.strip().replace(",", ".")
+
+    def avviso():
+        selezionati = tabella.selection()
+        if len(selezionati) != 1:
+            messagebox.showinfo("Watchlist", "Seleziona un titolo.", parent=finestra)
+            return
+        ticker = selezionati[0]
+        soglie = watchlist["avvisi"].get(ticker, {})
+        sopra = chiedi_soglia(f"{ticker}: avvisa quando il prezzo sale a (vuoto = nessuna soglia)",
+                              soglie.get("sopra"))
+        if sopra is None:
+            return
+        sotto = chiedi_soglia(f"{ticker}: avvisa quando il prezzo scende a (vuoto = nessuna soglia)",
+                              soglie.get("sotto"))
+        if sotto is None:
+            return
+        try:
+            sopra = float(sopra) if sopra else None
+            sotto = float(sotto) if sotto else None
+        except ValueError:
+            messagebox.showerror("Errore", "Inserisci un prezzo valido.", parent=finestra)
+            return
+        imposta_avviso(ticker, sopra, sotto)
+        avvia_avvisi(finestra.nametowidget("."))  # la prima soglia accende il controllo in background
+        ricevi(dict(ultime), True, None)
+
+    tk.Button(frame_bottoni, text="Aggiungi", width=10, bg="#b3ffcc", command=aggiungi).grid(row=0, column=2, padx=5)
+    tk.Button(frame_bottoni, text="Rimuovi", width=10, bg="#ffcccc", command=rimuovi).grid(row=0, column=3, padx=5)
+    tk.Button(frame_bottoni, text="Avviso prezzo", width=12, command=avviso).grid(row=0, column=4, padx=5)
+    entry_ticker.bind("<Return>", lambda e: aggiungi())
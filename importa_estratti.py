@@ -0,0 +1,182 @@
+#importazione in blocco di estratti conto CSV/OFX
+#uso:  python importa_estratti.py estratto.csv --conto "Conto Corrente"
+
+import argparse
+import csv
+import os
+from collections import Counter
+from datetime import datetime
+
+from denaro import centesimi
+from logica_transazioni import transazione_atomica
+from storage import carica_conti, transazioni_per_conto
+
+CATEGORIA_DEFAULT = "importazione"
+
+# intestazioni riconosciute nei CSV delle banche (confronto senza maiuscole/spazi ai bordi)
+COLONNE_CSV = {
+    "data": ["data", "date", "data operazione", "data contabile", "data valuta", "booking date"],
+    "importo": ["importo", "amount", "importo (eur)", "importo eur"],
+    "entrate": ["entrate", "avere", "accrediti", "credit"],
+    "uscite": ["uscite", "dare", "addebiti", "debit"],
+    "descrizione": ["descrizione", "description", "causale", "descrizione operazione", "memo"],
+    "categoria": ["categoria", "category"],
+}
+
+FORMATI_DATA = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%Y%m%d"]
+
+
+def _converti_data(testo):
+    testo = testo.strip()
+    for formato in FORMATI_DATA:
+        try:
+            return datetime.strptime(testo, formato).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"Data non riconosciuta: {testo!r}")
+
+def _converti_importo(testo):
+    testo = testo.strip().replace("€", "").replace(" ", "")
+    if not testo:
+        return 0.0
+    # "1.234,56" (formato italiano) oppure "1,234.56"
+    if "," in testo and "." in testo:
+        if testo.rfind(",") > testo.rfind("."):
+            testo = testo.replace(".", "").replace(",", ".")
+        else:
+            testo = testo.replace(",", "")
+    elif "," in testo:
+        testo = testo.replace(",", ".")
+    return float(testo)
+
+def chiave_transazione(tr):
+    # confronto sul giorno e sui centesimi: i float e gli orari non devono creare falsi "nuovi"
+    return (tr["data"][:10], tr["conto"], centesimi(tr["importo"]), " ".join(str(tr.get("descrizione", "")).lower().split()))
+
+
+# --- parser ---
+
+def leggi_csv(percorso, conto, categoria=CATEGORIA_DEFAULT):
+    """Generatore: una transazione per riga del CSV, senza caricare il file in memoria."""
+    with open(percorso, "r", newline="", encoding="utf-8-sig") as f:
+        campione = f.read(4096)
+        f.seek(0)
+        try:
+            dialetto = csv.Sniffer().sniff(campione, delimiters=";,\t")
+        except csv.Error:
+            dialetto = csv.excel
+        lettore = csv.reader(f, dialetto)
+
+        intestazione = [c.strip().lower() for c in next(lettore, [])]
+        indici = {}
+        for campo, candidati in COLONNE_CSV.items():
+            for candidato in candidati:
+                if candidato in intestazione:
+                    indici[campo] = intestazione.index(candidato)
+                    break
+        if "data" not in indici or ("importo" not in indici and "entrate" not in indici and "uscite" not in indici):
+            raise ValueError("Intestazione CSV non riconosciuta: servono almeno data e importo.")
+
+        for riga in lettore:
+            if not any(cella.strip() for cella in riga):
+                continue
+            valore = lambda campo: riga[indici[campo]] if campo in indici and indici[campo] < len(riga) else ""
+            if "importo" in indici:
+                importo = _converti_importo(valore("importo"))
+            else:
+                importo = _converti_importo(valore("entrate")) - abs(_converti_importo(valore("uscite")))
+            yield {
+                "data": _converti_data(valore("data")),
+                "conto": conto,
+                "importo": importo,
+                "categoria": valore("categoria").strip() or categoria,
+                "descrizione": valore("descrizione").strip()
+            }
+
+def _token_ofx(f, dimensione_blocco=65536):
+    # Spezza il file in coppie (tag, testo) leggendo a blocchi: funziona sia con l'OFX 1.x
+    # in stile SGML (tag non chiusi, uno per riga) sia con l'OFX 2.x in XML su una riga sola.
+    resto = ""
+    while True:
+        blocco = f.read(dimensione_blocco)
+        if not blocco:
+            break
+        resto += blocco
+        pezzi = resto.split("<")
+        resto = pezzi.pop()  # l'ultimo pezzo potrebbe essere incompleto
+        for pezzo in pezzi:
+            if ">" in pezzo:
+                tag, testo = pezzo.split(">", 1)
+                yield tag.strip().upper(), testo.strip()
+    if ">" in resto:
+        tag, testo = resto.split(">", 1)
+        yield tag.strip().upper(), testo.strip()
+
+def leggi_ofx(percorso, conto, categoria=CATEGORIA_DEFAULT):
+    """Generatore: una transazione per blocco <STMTTRN> dell'OFX."""
+    with open(percorso, "r", encoding="utf-8", errors="replace") as f:
+        corrente = None
+        for tag, testo in _token_ofx(f):
+            if tag == "STMTTRN":
+                corrente = {}
+            elif tag == "/STMTTRN" and corrente is not None:
+                if "DTPOSTED" in corrente and "TRNAMT" in corrente:
+                    descrizione = " - ".join(v for v in (corrente.get("NAME"), corrente.get("MEMO")) if v)
+                    yield {
+                        "data": _converti_data(corrente["DTPOSTED"][:8]),
+                        "conto": conto,
+                        "importo": _converti_importo(corrente["TRNAMT"]),
+                        "categoria": categoria,
+                        "descrizione": descrizione
+                    }
+                corrente = None
+            elif corrente is not None and not tag.startswith("/") and testo:
+                corrente[tag] = testo
+
+def leggi_estratto(percorso, conto, categoria=CATEGORIA_DEFAULT):
+    estensione = os.path.splitext(percorso)[1].lower()
+    if estensione in (".ofx", ".qfx"):
+        return leggi_ofx(percorso, conto, categoria)
+    return leggi_csv(percorso, conto, categoria)
+
+
+# --- importazione ---
+
+def importa_transazioni(transazioni, conto):
+    """Aggiunge le transazioni non ancora presenti nel ledger, con un'unica scrittura.
+
+    I duplicati sono riconosciuti con un indice hash sulle transazioni già registrate nel conto;
+    due movimenti identici nello stesso estratto restano entrambi, purché non siano già nel ledger.
+    """
+    gia_presenti = Counter(chiave_transazione(tr) for tr in transazioni_per_conto(conto))
+    visti = Counter()
+    risultato = {"importate": 0, "duplicate": 0}
+
+    with transazione_atomica() as batch:
+        for tr in transazioni:
+            chiave = chiave_transazione(tr)
+            visti[chiave] += 1
+            if visti[chiave] <= gia_presenti[chiave]:
+                risultato["duplicate"] += 1
+                continue
+            # come ogni altra registrazione: importo arrotondato al centesimo prima di ledger e saldo
+            batch.registra(tr["importo"], tr["conto"], tr["categoria"], tr["descrizione"], tr["data"])
+            risultato["importate"] += 1
+    return risultato
+
+def importa_estratto(percorso, conto, categoria=CATEGORIA_DEFAULT):
+    if conto not in carica_conti():
+        raise ValueError(f"Il conto '{conto}' non esiste.")
+    return importa_transazioni(leggi_estratto(percorso, conto, categoria), conto)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa un estratto conto CSV o OFX.")
+    parser.add_argument("file", nargs="+", help="uno o più file .csv/.ofx")
+    parser.add_argument("--conto", required=True, help="conto a cui attribuire i movimenti")
+    parser.add_argument("--categoria", default=CATEGORIA_DEFAULT)
+    args = parser.parse_args()
+
+    for percorso in args.file:
+        esito = importa_estratto(percorso, args.conto, args.categoria)
+        print(f"{percorso}: {esito['importate']} importate, {esito['duplicate']} già presenti")
@@ -1,46 +1,88 @@
 #logica, aggiornamenti e giroconto
 
-from storage import carica_conti, salva_conti, carica_transazioni, salva_transazioni
+from storage import carica_conti, applica_batch
 
-import json
-import os
+from contextlib import contextmanager
 
-FILE_CONTI = "data/conti.json"
+from denaro import normalizza, somma_saldo
+from cambi import cambi, valute_conti
 
-def carica_conti():
-    if not os.path.exists(FILE_CONTI):
-        return {}
-    with open(FILE_CONTI, "r") as f:
-        return json.load(f)
-
-def salva_conti(conti):
-    with open(FILE_CONTI, "w") as f:
-        json.dump(conti, f, indent=4)
+import aggregati
+import saldi_storici
 
 
 def aggiungi_transazione(transazione):
-    transazioni = carica_transazioni()
-    transazioni.append(transazione)
-    salva_transazioni(transazioni)
+    # accodata al journal: non serve rileggere e riscrivere tutto il ledger
+    with transazione_atomica() as batch:
+        batch.aggiungi_transazione(transazione)
+
+class Batch:
+    """Raccoglie transazioni e variazioni di saldo da scrivere tutte insieme (vedi transazione_atomica)."""
+
+    def __init__(self):
+        self.transazioni = []
+        self.delta_saldi = {}
+
+    def aggiorna_saldo(self, nome_conto, importo):
+        self.delta_saldi[nome_conto] = somma_saldo(self.delta_saldi.get(nome_conto, 0), importo)
+
+    def aggiungi_transazione(self, transazione):
+        self.transazioni.append(transazione)
+
+    def registra(self, importo, conto, categoria, descrizione, data=None):
+        if data is None:
+            from datetime import datetime
+            data = datetime.now().strftime("%Y-%m-%d")
+        importo = normalizza(importo)  # al centesimo: nel ledger non entrano frazioni di centesimo
+
+        transazione = {
+            "data": data,
+            "conto": conto,
+            "importo": importo,
+            "categoria": categoria,
+            "descrizione": descrizione
+        }
+        self.aggiorna_saldo(conto, importo)
+        self.aggiungi_transazione(transazione)
+        return transazione
+
+    def registra_giroconto(self, importo, conto_origine, conto_destinazione, categoria, descrizione, data=None):
+        """Le due gambe di un giroconto; tra conti in valute diverse l'entrata è convertita al cambio attuale."""
+        importo_destinazione = importo_convertito(importo, conto_origine, conto_destinazione)
+        uscita = self.registra(-importo, conto_origine, categoria, descrizione, data)
+        entrata = self.registra(importo_destinazione, conto_destinazione, categoria, descrizione, data)
+        return uscita, entrata
+
+def importo_convertito(importo, conto_origine, conto_destinazione):
+    """`importo` nella valuta di conto_origine espresso nella valuta di conto_destinazione."""
+    valute = valute_conti([conto_origine, conto_destinazione])
+    origine, destinazione = valute[conto_origine], valute[conto_destinazione]
+    if origine == destinazione:
+        return importo
+    tassi = cambi.tassi([origine, destinazione])
+    if tassi[origine] is None or tassi[destinazione] is None:
+        raise ValueError(f"Tasso di cambio {origine}/{destinazione} non disponibile.")
+    return normalizza(importo * tassi[origine] / tassi[destinazione])
+
+@contextmanager
+def transazione_atomica():
+    # with transazione_atomica() as batch:
+    #     batch.registra(-10, "Conto Corrente", "Giroconto", "...")
+    #     batch.registra(10, "PayPal", "Giroconto", "...")
+    # tutto viene scritto all'uscita dal blocco, niente se il blocco solleva un'eccezione
+    batch = Batch()
+    yield batch
+    if batch.transazioni or batch.delta_saldi:
+        # gli aggregati vanno caricati prima di scrivere: se mancano vengono
+        # ricalcolati dal ledger, che non deve ancora contenere questo batch
+        aggregati.carica_aggregati()
+        applica_batch(batch.delta_saldi, batch.transazioni)
+        aggregati.registra(batch.transazioni)
+        saldi_storici.registra(batch.transazioni)
 
 def registra_transazione(importo, conto, categoria, descrizione, data=None):
-    if data is None:
-        from datetime import datetime
-        data = datetime.now().strftime("%Y-%m-%d")
-
-    transazione = {
-        "data": data,
-        "conto": conto,
-        "importo": importo,
-        "categoria": categoria,
-        "descrizione": descrizione
-    }
-
-    # Aggiorna saldo conto
-    aggiorna_saldo(conto, importo)
-
-    # Salva transazione
-    aggiungi_transazione(transazione)
+    with transazione_atomica() as batch:
+        batch.registra(importo, conto, categoria, descrizione, data)
 
 def giroconto(conto_origine, conto_destinazione, importo):
     if importo <= 0:
@@ -56,15 +98,13 @@ def giroconto(conto_origine, conto_destinazione, importo):
     if conti[conto_origine] < importo:
         raise ValueError("Saldo insufficiente per completare il giroconto.")
 
-    # Uscita dal conto origine
-    registra_transazione(conto_origine, f"Giroconto verso {conto_destinazione}", -importo, "giroconto")
+    importo_destinazione = importo_convertito(importo, conto_origine, conto_destinazione)
+    with transazione_atomica() as batch:
+        # Uscita dal conto origine
+        batch.registra(-importo, conto_origine, "giroconto", f"Giroconto verso {conto_destinazione}")
 
-    # Entrata nel conto destinazione
-    registra_transazione(conto_destinazione, f"Giroconto da {conto_origine}", importo, "giroconto")
+        # Entrata nel conto destinazione (nella sua valuta)
+        batch.registra(importo_destinazione, conto_destinazione, "giroconto", f"Giroconto da {conto_origine}")
 
 def aggiorna_saldo(nome_conto, importo):
-    conti = carica_conti()
-    if nome_conto not in conti:
-        conti[nome_conto] = 0
-    conti[nome_conto] += importo
-    salva_conti(conti)
\ No newline at end of file
+    applica_batch({nome_conto: importo}, [])
\ No newline at end of file
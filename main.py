@@ -1,22 +1,35 @@
 import tkinter as tk
 from gestione_conti import apri_finestra_gestione_conti
-from utils.sfondo import scegli_sfondo_casuale, ridimensiona_sfondo
-from gestione_transazioni import mostra_transazioni, aggiungi_transazione_popup
-from gestione_investimenti import apri_finestra_investimenti
-from storage import carica_conti, carica_transazioni
-
+from utils.sfondo import scegli_sfondo_casuale, prepara_sfondo, dimensione_cache
+from utils.attivita import esegui
+from PIL import ImageTk
+from gestione_transazioni import mostra_transazioni, aggiungi_transazione_popup, mostra_report_mensile
+from storage import carica_conti, carica_tabella_transazioni, tabella_per_conto
+from cambi import formatta_importo, valute_conti
 
+ATTESA_RESIZE = 150  # ms senza nuovi <Configure> prima di ridisegnare lo sfondo
 
 
 def mostra_saldi(frame, conti):
     for widget in frame.winfo_children():
         widget.destroy()  # pulisce il frame per aggiornare
 
+    valute = valute_conti(conti)
     for nome, saldo in conti.items():
-        testo = f"{nome}: € {saldo:.2f}"
+        testo = f"{nome}: {formatta_importo(saldo, valute[nome])}"
         label = tk.Label(frame, text=testo, font=("Arial", 14))
         label.pack(anchor="w")
 
+def apri_finestra_investimenti():
+    # import al primo clic: matplotlib, le quotazioni e investimenti.json non rallentano l'avvio
+    from gestione_investimenti import apri_finestra_investimenti
+    apri_finestra_investimenti()
+
+def avvia_avvisi_watchlist(root):
+    # gli avvisi di prezzo si controllano anche a finestre chiuse; il modulo si carica dopo l'avvio
+    from gestione_watchlist import avvia_avvisi
+    avvia_avvisi(root)
+
 def centra_finestra(finestra, larghezza, altezza):
     finestra.update_idletasks()
     screen_width = finestra.winfo_screenwidth()
@@ -32,28 +45,46 @@ def main():
     larghezza = 400
     altezza = 400
     centra_finestra(root, larghezza, altezza)
-    root.resizable(False, False)        #todo: quando lo sfondo diventa responsive eliminare questa riga
 
     conti = carica_conti()
-    transazioni = carica_transazioni()
 
-    # Carica sfondo
+    # Carica sfondo: l'immagine si prepara in background, la finestra compare subito
     root.sfondo_path = scegli_sfondo_casuale("sfondi")
-    root.sfondo_img = ridimensiona_sfondo(root.sfondo_path, (larghezza, altezza))
 
     #label sfondo
-    root.sfondo_label = tk.Label(root, image=root.sfondo_img)
-    root.sfondo_label.image = root.sfondo_img
+    root.sfondo_label = tk.Label(root)
     root.sfondo_label.place(x=0, y=0, relwidth=1, relheight=1)
     root.sfondo_label.lower()  # Manda lo sfondo dietro
 
-    # todo: Aggiorna sfondo al resize, per ora con questa funzione lo sfondo scompare all'apertura (problema con "root."?)
-#    def aggiorna_sfondo(event):
-#        nuovo = ridimensiona_sfondo(root.sfondo_path, (event.width, event.height))
-#        root.sfondo_label.configure(image=nuovo)
-#        root.sfondo_label.image = nuovo
+    def mostra_sfondo(img):
+        root.sfondo_img = ImageTk.PhotoImage(img)
+        root.sfondo_label.configure(image=root.sfondo_img)
+        root.sfondo_label.image = root.sfondo_img
+
+    def carica_sfondo(dimensione):
+        richiesta = root.sfondo_dimensione = dimensione_cache(dimensione)
+        # se nel frattempo è stata chiesta un'altra dimensione, questo risultato è vecchio
+        esegui(root, prepara_sfondo, root.sfondo_path, dimensione,
+               al_termine=lambda img: mostra_sfondo(img) if richiesta == root.sfondo_dimensione else None)
+
+    carica_sfondo((larghezza, altezza))
 
-#    root.bind("<Configure>", aggiorna_sfondo)
+    # Aggiorna sfondo al resize: si aspetta che il trascinamento si fermi, e solo se
+    # la dimensione arrotondata cambia (dentro lo stesso passo l'immagine resta quella)
+    root.sfondo_attesa = None
+
+    def aggiorna_sfondo(event):
+        if event.widget is not root:
+            return  # <Configure> arriva anche per ogni widget figlio
+        if root.sfondo_attesa is not None:
+            root.after_cancel(root.sfondo_attesa)
+        dimensione = (event.width, event.height)
+        if dimensione_cache(dimensione) == root.sfondo_dimensione:
+            root.sfondo_attesa = None
+            return
+        root.sfondo_attesa = root.after(ATTESA_RESIZE, lambda: carica_sfondo(dimensione))
+
+    root.bind("<Configure>", aggiorna_sfondo)
 
 
     tk.Label(root, text="Cato Finance :)", font=("Arial", 16), bg="white").pack(pady=10)
@@ -65,24 +96,29 @@ def main():
                                           command=apri_finestra_investimenti)
     btn_gestisci_investimenti.pack(pady=(0, 10))
 
+    valute = valute_conti(conti)
     for nome_conto in conti:
         if nome_conto == "Investimenti":
             continue
-        tk.Button(frame_conti, text=f"{nome_conto} ({conti[nome_conto]:.2f} €)",
-                  command=lambda c=nome_conto: mostra_transazioni([tr for tr in transazioni if tr["conto"] == c],
+        tk.Button(frame_conti, text=f"{nome_conto} ({formatta_importo(conti[nome_conto], valute[nome_conto])})",
+                  command=lambda c=nome_conto: mostra_transazioni(tabella_per_conto(c),
                                                                   f"Transazioni - {c}")).pack(pady=5)
 
     btn_tutte = tk.Button(root, text="📜 Visualizza tutte le transazioni",
-                          command=lambda: mostra_transazioni(transazioni, "Tutte le transazioni"))
+                          command=lambda: mostra_transazioni(carica_tabella_transazioni(), "Tutte le transazioni"))
     btn_tutte.pack(pady=5)
 
     btn_aggiungi = tk.Button(root, text="➕ Aggiungi transazione",
                              command=lambda: aggiungi_transazione_popup(root, conti))
     btn_aggiungi.pack(pady=5)
 
+    tk.Button(root, text="📊 Report mensile", command=lambda: mostra_report_mensile(root)).pack(pady=5)
+
     tk.Button(root, text="💼 Gestione Conti",
               command=lambda: apri_finestra_gestione_conti(root, lambda: print("TODO aggiorna saldi"))).pack(pady=5)
 
+    root.after(2000, lambda: avvia_avvisi_watchlist(root))
+
     root.mainloop()
 
 
@@ -0,0 +1,135 @@
+#posizioni aperte per ticker, aggiornate operazione per operazione invece di riscandire lo storico
+
+import threading
+from decimal import Decimal
+
+from denaro import euro, controvalore, quota_centesimi, quantita as quantita_dec
+
+# sotto questa soglia una quantità è considerata zero (residui di quantità salvate come float arrotondati)
+EPSILON_QUANTITA = 1e-9
+
+
+def in_ordine(operazioni):
+    """Operazioni in ordine di giorno e, nello stesso giorno, di registrazione.
+
+    È l'ordine di analisi_portafoglio.operazioni_dataframe: un'operazione retrodatata
+    conta dal suo giorno, così costo medio e P&L tornano uguali nei due calcoli.
+    """
+    return sorted(operazioni, key=lambda op: op["data"][:10])
+
+
+class Posizione:
+    """Quantità, costo di carico e P&L realizzato di un ticker (metodo del costo medio ponderato).
+
+    Internamente quantità in Decimal e importi in centesimi interi (vedi denaro.py), così dopo
+    molte vendite parziali non resta nessun residuo; verso l'esterno tutto è float come prima.
+    """
+
+    def __init__(self):
+        self._quantita = Decimal(0)
+        self._costo = 0  # centesimi: costo di carico delle quote ancora possedute
+        self._realizzato = 0  # centesimi
+        self.operazioni = 0
+        self.ultimo_giorno = ""  # giorno dell'ultima operazione applicata (YYYY-MM-DD)
+
+    @property
+    def quantita(self):
+        return float(self._quantita)
+
+    @property
+    def costo(self):
+        return euro(self._costo)
+
+    @property
+    def realizzato(self):
+        return euro(self._realizzato)
+
+    @property
+    def pmu(self):
+        return float(Decimal(self._costo) / self._quantita / 100) if self._quantita > 0 else 0
+
+    def _costo_venduto(self, quantita_venduta):
+        # vendere tutto scarica tutto il costo, senza arrotondamenti residui
+        if quantita_venduta >= self._quantita:
+            return self._costo
+        return quota_centesimi(self._costo, quantita_venduta, self._quantita)
+
+    def guadagno_vendita(self, quantita_venduta, prezzo):
+        """Guadagno (in euro) che realizzerebbe la vendita di quantita_venduta quote a prezzo."""
+        q = quantita_dec(quantita_venduta)
+        return euro(controvalore(q, prezzo) - self._costo_venduto(q))
+
+    def applica(self, operazione):
+        q = quantita_dec(operazione["quantita"])
+        prezzo = operazione["prezzo_unitario"]
+        if operazione.get("tipo", "acquisto") == "acquisto":
+            self._quantita += q
+            self._costo += controvalore(q, prezzo)
+        else:
+            costo_venduto = self._costo_venduto(q)
+            self._realizzato += controvalore(q, prezzo) - costo_venduto
+            self._quantita -= q
+            self._costo -= costo_venduto
+            if abs(self._quantita) < EPSILON_QUANTITA:
+                self._quantita = Decimal(0)
+                self._costo = 0
+        self.operazioni += 1
+        self.ultimo_giorno = max(self.ultimo_giorno, operazione["data"][:10])
+
+
+class MotorePosizioni:
+    """Tiene una Posizione per ticker, con le operazioni applicate in_ordine().
+
+    Lo storico (investimenti.json) si scorre una volta sola in ricostruisci();
+    poi ogni nuova operazione aggiorna la sua posizione in O(1). Solo un'operazione
+    retrodatata rifà la posizione del suo ticker.
+    """
+
+    def __init__(self, investimenti=None):
+        self._lock = threading.Lock()
+        self._posizioni = {}
+        self._operazioni = {}  # ticker -> operazioni (copia della lista, non quella di investimenti)
+        if investimenti:
+            self.ricostruisci(investimenti)
+
+    @staticmethod
+    def _posizione_da(operazioni):
+        posizione = Posizione()
+        for operazione in in_ordine(operazioni):
+            posizione.applica(operazione)
+        return posizione
+
+    def ricostruisci(self, investimenti):
+        operazioni = {ticker: list(ops) for ticker, ops in investimenti.items()}
+        posizioni = {ticker: self._posizione_da(ops) for ticker, ops in operazioni.items()}
+        with self._lock:
+            self._posizioni = posizioni
+            self._operazioni = operazioni
+
+    def registra(self, ticker, operazione):
+        with self._lock:
+            operazioni = self._operazioni.setdefault(ticker, [])
+            operazioni.append(operazione)
+            posizione = self._posizioni.setdefault(ticker, Posizione())
+            if operazione["data"][:10] >= posizione.ultimo_giorno:
+                posizione.applica(operazione)
+            else:
+                self._posizioni[ticker] = self._posizione_da(operazioni)
+
+    def posizione(self, ticker):
+        with self._lock:
+            return self._posizioni.get(ticker) or Posizione()
+
+    def quantita(self, ticker):
+        return self.posizione(ticker).quantita
+
+    def pmu(self, ticker):
+        return self.posizione(ticker).pmu
+
+    def quantita_posseduta(self):
+        """{ticker: quantità} dei soli titoli ancora in portafoglio."""
+        with self._lock:
+            return {t: p.quantita for t, p in self._posizioni.items() if p._quantita > 0}
+
+    def tickers_posseduti(self):
+        return sorted(self.quantita_posseduta())
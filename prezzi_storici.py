@@ -0,0 +1,278 @@
+#archivio locale delle chiusure giornaliere e serie del valore del portafoglio giorno per giorno
+#un file binario per ticker in data/prezzi_storici/: si scarica solo l'intervallo che manca
+#uso:  python prezzi_storici.py aggiorna | mostra TICKER
+
+import os
+import struct
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+from blocchi_file import blocca
+
+CARTELLA_PREZZI = "data/prezzi_storici"
+
+# intestazione: firma, versione formato, numero di chiusure, primo e ultimo giorno coperti
+# (ordinali); poi le colonne: n giorni int32, n chiusure float64, tutti little-endian
+_FIRMA = b"CATP"
+_INTESTAZIONE = struct.Struct("<4sHxxiii")
+_VERSIONE_FORMATO = 1
+
+
+class SerieTicker:
+    """Chiusure di un ticker: giorni (ordinali, int32) e prezzi (float64), in ordine di data.
+
+    coperto_da/coperto_a delimitano l'intervallo già chiesto al fornitore: i giorni senza
+    chiusura lì dentro (festivi, weekend) non vanno richiesti di nuovo.
+    """
+
+    def __init__(self, giorni=None, chiusure=None, coperto_da=0, coperto_a=-1):
+        self.giorni = np.asarray(giorni if giorni is not None else [], dtype=np.int32)
+        self.chiusure = np.asarray(chiusure if chiusure is not None else [], dtype=np.float64)
+        self.coperto_da = coperto_da
+        self.coperto_a = coperto_a
+
+    def vuota(self):
+        return self.coperto_a < self.coperto_da
+
+    def mancanti(self, da, a):
+        """Intervalli (ordinali, estremi inclusi) di [da, a] non ancora coperti."""
+        if a < da:
+            return []
+        if self.vuota():
+            return [(da, a)]
+        intervalli = []
+        if da < self.coperto_da:
+            intervalli.append((da, min(a, self.coperto_da - 1)))
+        if a > self.coperto_a:
+            intervalli.append((max(da, self.coperto_a + 1), a))
+        return intervalli
+
+    def unisci(self, chiusure, da, a):
+        """Nuova serie con in più le chiusure [(data, prezzo)] scaricate per l'intervallo [da, a].
+
+        La serie di partenza non cambia: chi la sta leggendo da un altro thread (serie_valore)
+        vede sempre giorni e chiusure coerenti fra loro.
+        Una risposta vuota non copre niente (errore di rete, limite di richieste, ticker ignoto:
+        yfinance in quei casi non solleva), così l'intervallo si richiede la volta dopo. Verso
+        il futuro la copertura arriva solo all'ultima chiusura ricevuta.
+        """
+        if not chiusure:
+            return self
+        nuovi_giorni = np.array([date.fromisoformat(d[:10]).toordinal() for d, _ in chiusure], dtype=np.int32)
+        nuovi_prezzi = np.array([p for _, p in chiusure], dtype=np.float64)
+        giorni = np.concatenate([self.giorni, nuovi_giorni])
+        prezzi = np.concatenate([self.chiusure, nuovi_prezzi])
+        # un giorno già presente viene sostituito dal dato più recente
+        ordine = np.argsort(giorni, kind="stable")
+        giorni, prezzi = giorni[ordine], prezzi[ordine]
+        ultimo = np.append(giorni[1:] != giorni[:-1], True) if len(giorni) else np.zeros(0, dtype=bool)
+        # un intervallo prima della copertura la raggiunge: resta contigua anche con festivi in coda
+        if self.vuota() or a >= self.coperto_da:
+            a = min(a, int(nuovi_giorni.max()))
+        if self.vuota():
+            coperto_da, coperto_a = da, a
+        else:
+            coperto_da, coperto_a = min(self.coperto_da, da), max(self.coperto_a, a)
+        return SerieTicker(giorni[ultimo], prezzi[ultimo], coperto_da, coperto_a)
+
+    def in_bytes(self):
+        intestazione = _INTESTAZIONE.pack(_FIRMA, _VERSIONE_FORMATO, len(self.giorni), self.coperto_da, self.coperto_a)
+        return intestazione + self.giorni.astype("<i4").tobytes() + self.chiusure.astype("<f8").tobytes()
+
+    @classmethod
+    def da_bytes(cls, dati):
+        firma, versione, n, coperto_da, coperto_a = _INTESTAZIONE.unpack_from(dati)
+        if firma != _FIRMA or versione != _VERSIONE_FORMATO:
+            raise ValueError("file prezzi non riconosciuto")
+        inizio = _INTESTAZIONE.size
+        giorni = np.frombuffer(dati, dtype="<i4", count=n, offset=inizio)
+        chiusure = np.frombuffer(dati, dtype="<f8", count=n, offset=inizio + 4 * n)
+        return cls(giorni.astype(np.int32), chiusure.astype(np.float64), coperto_da, coperto_a)
+
+
+class ArchivioPrezzi:
+    """Un file per ticker; in memoria le serie restano finché il file non cambia."""
+
+    def __init__(self, cartella=CARTELLA_PREZZI):
+        self.cartella = cartella
+        self._lock = threading.Lock()
+        self._serie = {}  # ticker -> ((mtime, size), SerieTicker)
+
+    def _percorso(self, ticker):
+        return os.path.join(self.cartella, f"{ticker.upper()}.bin")
+
+    def serie(self, ticker):
+        percorso = self._percorso(ticker)
+        try:
+            st = os.stat(percorso)
+        except FileNotFoundError:
+            return SerieTicker()
+        firma = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            voce = self._serie.get(ticker.upper())
+        if voce and voce[0] == firma:
+            return voce[1]
+        try:
+            with open(percorso, "rb") as f:
+                serie = SerieTicker.da_bytes(f.read())
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Archivio prezzi di {ticker} illeggibile, verrà riscaricato: {e}")
+            serie = SerieTicker()
+        with self._lock:
+            self._serie[ticker.upper()] = (firma, serie)
+        return serie
+
+    def _salva(self, ticker, serie):
+        """Scrive la serie e la mette in memoria al posto della vecchia, con la firma del nuovo file."""
+        os.makedirs(self.cartella, exist_ok=True)
+        percorso = self._percorso(ticker)
+        tmp = f"{percorso}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(serie.in_bytes())
+        os.replace(tmp, percorso)
+        st = os.stat(percorso)
+        with self._lock:
+            self._serie[ticker.upper()] = ((st.st_mtime_ns, st.st_size), serie)
+
+    def completa(self, ticker, data_inizio, data_fine, fornitore):
+        """Scarica da `fornitore` solo le parti di [data_inizio, data_fine] che mancano.
+
+        Ritorna il numero di richieste fatte (0 se era già tutto in archivio).
+        """
+        da, a = date.fromisoformat(data_inizio).toordinal(), date.fromisoformat(data_fine).toordinal()
+        if not self.serie(ticker).mancanti(da, a):
+            return 0
+        os.makedirs(self.cartella, exist_ok=True)
+        with blocca(self._percorso(ticker)):
+            serie = self.serie(ticker)  # riletta sotto lock: un altro processo può averla appena completata
+            mancanti = serie.mancanti(da, a)
+            for inizio, fine in mancanti:
+                chiusure = fornitore.storico(ticker, date.fromordinal(inizio).isoformat(),
+                                             date.fromordinal(fine).isoformat())
+                serie = serie.unisci(chiusure, inizio, fine)
+            if mancanti:
+                self._salva(ticker, serie)
+        return len(mancanti)
+
+    def completa_tutti(self, intervalli, fornitore):
+        """intervalli: {ticker: (data_inizio, data_fine)}. I ticker si scaricano in parallelo."""
+        def completa_sicuro(ticker):
+            try:
+                return self.completa(ticker, *intervalli[ticker], fornitore)
+            except NotImplementedError:
+                return 0
+            except Exception as e:
+                print(f"Errore nel recupero dello storico di {ticker}: {e}")
+                return 0
+
+        if not intervalli:
+            return 0
+        # pool proprio: quello del fornitore può essere stato abbandonato dopo un timeout delle quotazioni
+        with ThreadPoolExecutor(max_workers=min(getattr(fornitore, "max_thread", 4), len(intervalli)),
+                                thread_name_prefix="storico") as pool:
+            return sum(pool.map(completa_sicuro, intervalli))
+
+
+def intervalli_da_coprire(investimenti, oggi=None):
+    """{ticker: (prima operazione, ultimo giorno posseduto)}, fino a ieri: la chiusura di oggi non c'è ancora."""
+    ieri = (oggi or date.today()) - timedelta(days=1)
+    intervalli = {}
+    for ticker, operazioni in investimenti.items():
+        if not operazioni:
+            continue
+        date_op = sorted(op["data"][:10] for op in operazioni)
+        quantita = sum(op["quantita"] if op.get("tipo", "acquisto") == "acquisto" else -op["quantita"]
+                       for op in operazioni)
+        fine = ieri.isoformat() if quantita > 1e-9 else min(date_op[-1], ieri.isoformat())
+        if date_op[0] <= fine:
+            intervalli[ticker.upper()] = (date_op[0], fine)
+    return intervalli
+
+
+def serie_valore(investimenti, archivio, prezzi_correnti=None, oggi=None, valute=None, cambi=None):
+    """Valore del portafoglio per ogni giorno dalla prima operazione a oggi: (giorni ordinali, valori).
+
+    Per ogni ticker quantità e prezzo si allineano ai giorni con searchsorted (quantità
+    cumulate alle date delle operazioni, ultimo prezzo noto alla data); il prezzo noto è la
+    chiusura in archivio oppure, dove manca, il prezzo dell'ultima operazione.
+    Con valute ({ticker: valuta}) e cambi (TassiCambio) ogni giorno si converte al cambio di quel giorno.
+    """
+    oggi = (oggi or date.today()).toordinal()
+    prezzi_correnti = {t.upper(): p for t, p in (prezzi_correnti or {}).items()}
+    # operazioni raggruppate per ticker una volta sola (lo stesso ticker può comparire con maiuscole diverse)
+    per_ticker = {}
+    for t, ops in investimenti.items():
+        per_ticker.setdefault(t.upper(), []).extend(ops)
+    per_ticker = {t: ops for t, ops in per_ticker.items() if ops}
+    if not per_ticker:
+        return np.zeros(0, dtype=np.int32), np.zeros(0)
+    primo = min(date.fromisoformat(op["data"][:10]).toordinal() for ops in per_ticker.values() for op in ops)
+    giorni = np.arange(primo, oggi + 1, dtype=np.int32)
+    valori = np.zeros(len(giorni))
+
+    for ticker, ops in sorted(per_ticker.items()):
+        giorni_op = np.array([date.fromisoformat(op["data"][:10]).toordinal() for op in ops], dtype=np.int32)
+        segno = np.array([1.0 if op.get("tipo", "acquisto") == "acquisto" else -1.0 for op in ops])
+        quantita_op = segno * np.array([op["quantita"] for op in ops], dtype=np.float64)
+        prezzi_op = np.array([op["prezzo_unitario"] for op in ops], dtype=np.float64)
+        ordine = np.argsort(giorni_op, kind="stable")
+        giorni_op, quantita_op, prezzi_op = giorni_op[ordine], quantita_op[ordine], prezzi_op[ordine]
+
+        # quantità posseduta alla fine di ogni giorno
+        cumulata = np.cumsum(quantita_op)
+        k = np.searchsorted(giorni_op, giorni, side="right") - 1
+        quantita = np.where(k >= 0, cumulata[np.maximum(k, 0)], 0.0)
+        quantita[np.abs(quantita) < 1e-9] = 0.0
+
+        # prezzi noti: operazioni, poi chiusure (a parità di giorno vince la chiusura), poi il prezzo di oggi
+        serie = archivio.serie(ticker)
+        giorni_noti = [giorni_op, serie.giorni]
+        prezzi_noti = [prezzi_op, serie.chiusure]
+        if ticker in prezzi_correnti and prezzi_correnti[ticker] is not None:
+            giorni_noti.append(np.array([oggi], dtype=np.int32))
+            prezzi_noti.append(np.array([prezzi_correnti[ticker]], dtype=np.float64))
+        giorni_noti, prezzi_noti = np.concatenate(giorni_noti), np.concatenate(prezzi_noti)
+        ordine = np.argsort(giorni_noti, kind="stable")
+        giorni_noti, prezzi_noti = giorni_noti[ordine], prezzi_noti[ordine]
+        j = np.searchsorted(giorni_noti, giorni, side="right") - 1
+        prezzo = np.where(j >= 0, prezzi_noti[np.maximum(j, 0)], 0.0)
+
+        controvalore = quantita * prezzo
+        if cambi is not None and valute:
+            controvalore = controvalore * cambi.tassi_storici(valute.get(ticker), giorni)
+        valori += controvalore
+    return giorni, valori
+
+
+def serie_valore_dict(investimenti, archivio, prezzi_correnti=None, valute=None, cambi=None):
+    """Come serie_valore, ma {"YYYY-MM-DD": valore} (il formato accettato da analisi_portafoglio.storico_serie)."""
+    giorni, valori = serie_valore(investimenti, archivio, prezzi_correnti, valute=valute, cambi=cambi)
+    return {date.fromordinal(int(g)).isoformat(): float(v) for g, v in zip(giorni, valori)}
+
+
+archivio = ArchivioPrezzi()
+
+
+if __name__ == "__main__":
+    from gestione_investimenti import investimenti
+    from quotazioni import fornitore_predefinito
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "aggiorna":
+        from cambi import cambi
+        from gestione_investimenti import applica_valute, completa_valute, valute_titoli
+
+        applica_valute(completa_valute())
+        intervalli = intervalli_da_coprire(investimenti)
+        intervalli.update(cambi.intervalli_storici(intervalli, valute_titoli()))
+        richieste = archivio.completa_tutti(intervalli, fornitore_predefinito())
+        print(f"{len(intervalli)} ticker e cambi controllati, {richieste} intervalli scaricati.")
+    elif len(sys.argv) == 3 and sys.argv[1] == "mostra":
+        serie = archivio.serie(sys.argv[2])
+        for giorno, prezzo in zip(serie.giorni, serie.chiusure):
+            print(f"{date.fromordinal(int(giorno)).isoformat()}  {prezzo:.4f}")
+    else:
+        print("Uso: python prezzi_storici.py aggiorna | mostra TICKER")
@@ -0,0 +1,477 @@
+#recupero delle quotazioni: un fornitore astratto, yfinance come default e uno finto per i test/offline
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+FILE_CACHE = "data/cache_quotazioni.json"
+
+
+class FornitoreQuotazioni(ABC):
+    """Base dei fornitori di quotazioni.
+
+    Le sottoclassi implementano quotazione(ticker), che ritorna un dict
+    {"nome", "prezzo", "precedente", "valuta"} oppure None se il ticker non è disponibile.
+    recupera_quotazioni la chiama in parallelo su un pool di thread limitato; i fornitori che
+    sanno chiedere più ticker con una richiesta sola impostano dimensione_lotto e implementano
+    quotazioni_lotto(tickers), che allora si usa al posto di quotazione.
+    storico(ticker, data_inizio, data_fine) ritorna le chiusure giornaliere [(data, prezzo)]
+    (vedi prezzi_storici.py); è facoltativo: chi non lo offre lascia il NotImplementedError.
+    """
+
+    dimensione_lotto = None  # ticker per richiesta; None = una richiesta per ticker
+
+    def __init__(self, max_thread=8, timeout=10.0):
+        self.max_thread = max_thread
+        self.timeout = timeout  # secondi concessi a ogni richiesta, da quando parte
+        self.richieste = 0  # richieste fatte alla sorgente (una per ticker o per lotto)
+        self._pool = None
+        self._lock_pool = threading.Lock()
+
+    @abstractmethod
+    def quotazione(self, ticker):
+        """{"nome", "prezzo", "precedente", "valuta"} oppure None."""
+
+    def quotazioni_lotto(self, tickers):
+        raise NotImplementedError
+
+    def storico(self, ticker, data_inizio, data_fine):
+        raise NotImplementedError
+
+    def _esecutore(self):
+        with self._lock_pool:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_thread, thread_name_prefix="quotazioni")
+            return self._pool
+
+    def _abbandona_pool(self, pool):
+        # una richiesta appesa occupa il suo thread finché la rete non risponde (cancel() non la
+        # ferma): le prossime richieste vanno su un pool nuovo, quello vecchio si chiude da solo
+        with self._lock_pool:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _avvia(self, inizi, chiave, funzione, *args):
+        inizi[chiave] = time.monotonic()
+        with self._lock_pool:
+            self.richieste += 1
+        return funzione(*args)
+
+    def _quotazione_sicura(self, ticker):
+        try:
+            return {ticker: self.quotazione(ticker)}
+        except Exception as e:
+            print(f"Errore nel recupero del prezzo per {ticker}: {e}")
+            return {ticker: None}
+
+    def _lotto_sicuro(self, tickers):
+        try:
+            return self.quotazioni_lotto(tickers)
+        except Exception as e:
+            print(f"Errore nel recupero dei prezzi per {', '.join(tickers)}: {e}")
+            return {}
+
+    def recupera_quotazioni(self, tickers):
+        """Quotazioni di più ticker in un colpo solo: {ticker: dict o None}.
+
+        I ticker duplicati vengono chiesti una volta sola; quelli che falliscono o
+        non rispondono entro il timeout risultano None senza bloccare gli altri.
+        Il timeout vale per ogni richiesta da quando parte; quelle ancora in coda
+        rinunciano quando anche l'ultima ondata avrebbe dovuto finire.
+        """
+        tickers = list(dict.fromkeys(t.upper() for t in tickers))
+        if not tickers:
+            return {}
+        if self.dimensione_lotto:
+            richieste = [tickers[i:i + self.dimensione_lotto] for i in range(0, len(tickers), self.dimensione_lotto)]
+            risultati = self._in_parallelo(richieste, self._lotto_sicuro)
+        else:
+            risultati = self._in_parallelo([[t] for t in tickers], lambda lotto: self._quotazione_sicura(lotto[0]))
+        return {t: risultati.get(t) for t in tickers}
+
+    def _in_parallelo(self, richieste, funzione, cosa="del prezzo"):
+        """funzione(richiesta) -> dict per ogni richiesta, sul pool, ognuna con il suo timeout; i dict uniti.
+
+        Le richieste scadute o fallite semplicemente non contribuiscono al risultato.
+        """
+        inizi = {}  # indice della richiesta -> istante in cui un thread l'ha presa
+        risultati, futures, in_corso = {}, {}, set()
+
+        def invia(indici):
+            pool = self._esecutore()
+            for n in indici:
+                future = pool.submit(self._avvia, inizi, n, funzione, richieste[n])
+                futures[future] = n
+                in_corso.add(future)
+            # in coda si aspetta al più il tempo di tutte le ondate (più richieste che thread)
+            return pool, time.monotonic() + self.timeout * math.ceil(len(indici) / self.max_thread)
+
+        pool, limite_coda = invia(range(len(richieste)))
+        while in_corso:
+            scadenze = [inizi[futures[f]] + self.timeout for f in in_corso if futures[f] in inizi]
+            wait(in_corso, timeout=max(min(scadenze + [limite_coda]) - time.monotonic(), 0),
+                 return_when=FIRST_COMPLETED)
+            adesso = time.monotonic()
+            appese = False
+            for future in list(in_corso):
+                n = futures[future]
+                if future.done():
+                    in_corso.discard(future)
+                    risultati.update(future.result())
+                elif n in inizi and adesso - inizi[n] >= self.timeout:
+                    in_corso.discard(future)
+                    appese = True
+                    print(f"Timeout nel recupero {cosa} per {', '.join(richieste[n])}")
+                elif n not in inizi and adesso >= limite_coda and future.cancel():
+                    in_corso.discard(future)
+                    print(f"Timeout nel recupero {cosa} per {', '.join(richieste[n])}")
+            if appese:
+                # i thread appesi restano occupati: le richieste ancora in coda ripartono su un pool nuovo
+                in_coda = [f for f in in_corso if futures[f] not in inizi and f.cancel()]
+                in_corso.difference_update(in_coda)
+                self._abbandona_pool(pool)
+                if in_coda:
+                    pool, limite_coda = invia([futures[f] for f in in_coda])
+        return risultati
+
+
+class FornitoreYFinance(FornitoreQuotazioni):
+    """Quotazioni da Yahoo Finance tramite yfinance (importato solo al primo uso).
+
+    I prezzi si chiedono a lotti con yf.download (una richiesta per lotto); nome e valuta non
+    cambiano e si leggono da .info una volta sola per ticker, prima dei prezzi e ognuno con il
+    suo timeout: dentro un lotto venti .info in fila farebbero scadere tutto il lotto.
+    """
+
+    dimensione_lotto = 20
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._anagrafiche = {}  # ticker -> (nome, valuta)
+
+    def _anagrafica(self, ticker):
+        if ticker not in self._anagrafiche:
+            import yfinance as yf
+
+            info = yf.Ticker(ticker).info
+            self._anagrafiche[ticker] = (info.get("shortName", ticker), info.get("currency"))
+        return self._anagrafiche[ticker]
+
+    def _anagrafica_sicura(self, ticker):
+        try:
+            return {ticker: self._anagrafica(ticker)}
+        except Exception as e:
+            print(f"Nome e valuta di {ticker} non disponibili: {e}")
+            return {}
+
+    def recupera_quotazioni(self, tickers):
+        nuovi = [t for t in dict.fromkeys(t.upper() for t in tickers) if t not in self._anagrafiche]
+        if nuovi:
+            # chi scade qui resta senza prezzo in questo giro; la sua .info, finita in ritardo, serve al prossimo
+            self._in_parallelo([[t] for t in nuovi], lambda lotto: self._anagrafica_sicura(lotto[0]),
+                               cosa="di nome e valuta")
+        return super().recupera_quotazioni(tickers)
+
+    def quotazione(self, ticker):
+        self._anagrafica(ticker)
+        return self.quotazioni_lotto([ticker]).get(ticker)
+
+    def quotazioni_lotto(self, tickers):
+        import yfinance as yf
+
+        # l'ultima riga giornaliera è la seduta in corso: la sua chiusura è il prezzo attuale
+        dati = yf.download(tickers, period="5d", interval="1d", group_by="ticker", auto_adjust=False,
+                           progress=False, threads=False, timeout=self.timeout)
+        risultati = {}
+        for ticker in tickers:
+            try:
+                colonne = dati[ticker] if dati.columns.nlevels > 1 else dati
+                chiusure = colonne["Close"].dropna()
+            except KeyError:
+                chiusure = []
+            if not len(chiusure):
+                risultati[ticker] = None
+                continue
+            if ticker not in self._anagrafiche:
+                continue  # senza valuta il prezzo non si può convertire: meglio nessun prezzo
+            nome, valuta = self._anagrafiche[ticker]
+            prezzo = float(chiusure.iloc[-1])
+            risultati[ticker] = {
+                "nome": nome,
+                "prezzo": prezzo,
+                "precedente": float(chiusure.iloc[-2]) if len(chiusure) > 1 else prezzo,
+                "valuta": valuta
+            }
+        return risultati
+
+    def storico(self, ticker, data_inizio, data_fine):
+        import yfinance as yf
+        from datetime import date, timedelta
+
+        # in yfinance "end" è escluso
+        fine = (date.fromisoformat(data_fine) + timedelta(days=1)).isoformat()
+        chiusure = yf.Ticker(ticker).history(start=data_inizio, end=fine, interval="1d", auto_adjust=False)["Close"]
+        return [(istante.strftime("%Y-%m-%d"), float(prezzo)) for istante, prezzo in chiusure.items()
+                if prezzo == prezzo]  # salta i NaN
+
+
+class FornitoreFinto(FornitoreQuotazioni):
+    """Fornitore offline: prezzi fissati a mano, utile nei test o senza rete.
+
+    prezzi è un dict ticker -> prezzo (oppure dict completo come quello di quotazione).
+    storici, facoltativo, è un dict ticker -> {data: chiusura}; per i ticker che non ci sono
+    lo storico è il prezzo attuale ripetuto nei giorni feriali.
+    """
+
+    def __init__(self, prezzi=None, ritardo=0.0, storici=None, **kwargs):
+        super().__init__(**kwargs)
+        self.prezzi = {t.upper(): p for t, p in (prezzi or {}).items()}
+        self.storici = {t.upper(): s for t, s in (storici or {}).items()}
+        self.richieste_storico = []  # (ticker, inizio, fine) chiesti, per verificare i riempimenti incrementali
+        self.ritardo = ritardo
+
+    def quotazione(self, ticker):
+        if self.ritardo:
+            time.sleep(self.ritardo)
+        dato = self.prezzi.get(ticker.upper())
+        if dato is None:
+            return None
+        if isinstance(dato, dict):
+            return dict(dato)
+        return {"nome": ticker, "prezzo": dato, "precedente": dato, "valuta": None}
+
+    def storico(self, ticker, data_inizio, data_fine):
+        from datetime import date, timedelta
+
+        ticker = ticker.upper()
+        self.richieste_storico.append((ticker, data_inizio, data_fine))
+        if self.ritardo:
+            time.sleep(self.ritardo)
+        if ticker in self.storici:
+            return sorted((d, p) for d, p in self.storici[ticker].items() if data_inizio <= d <= data_fine)
+        quotazione = self.quotazione(ticker)
+        if quotazione is None:
+            return []
+        giorno, fine = date.fromisoformat(data_inizio), date.fromisoformat(data_fine)
+        risultato = []
+        while giorno <= fine:
+            if giorno.weekday() < 5:
+                risultato.append((giorno.isoformat(), quotazione["prezzo"]))
+            giorno += timedelta(days=1)
+        return risultato
+
+
+class FornitoreScriptato(FornitoreQuotazioni):
+    """Fornitore offline che riproduce sequenze di prezzi decise prima (per provare gli aggiornamenti live).
+
+    sequenze è un dict ticker -> [prezzo, prezzo, ...]: ogni richiesta di un ticker restituisce il
+    prezzo successivo della sua sequenza, poi resta sull'ultimo. precedente è la chiusura di ieri
+    (di default il primo prezzo della sequenza); valute, facoltativo, è un dict ticker -> valuta.
+    Con dimensione_lotto i ticker si chiedono a lotti, come fa FornitoreYFinance.
+    storici, facoltativo, è un dict ticker -> [risposta, risposta, ...] con risposta = {data: chiusura}:
+    ogni chiamata a storico usa la risposta successiva (filtrata sull'intervallo), poi resta sull'ultima.
+    """
+
+    def __init__(self, sequenze, precedenti=None, valute=None, dimensione_lotto=None, storici=None, **kwargs):
+        super().__init__(**kwargs)
+        self.dimensione_lotto = dimensione_lotto
+        self.storici = {t.upper(): list(s) for t, s in (storici or {}).items()}
+        self.richieste_storico = []  # (ticker, inizio, fine) chiesti
+        self.sequenze = {t.upper(): list(s) for t, s in sequenze.items()}
+        self.precedenti = {t.upper(): p for t, p in (precedenti or {}).items()}
+        self.valute = {t.upper(): v for t, v in (valute or {}).items()}
+        self._passi = {}
+        self._lock = threading.Lock()
+
+    def quotazione(self, ticker):
+        ticker = ticker.upper()
+        sequenza = self.sequenze.get(ticker)
+        if not sequenza:
+            return None
+        with self._lock:
+            passo = self._passi.get(ticker, 0)
+            self._passi[ticker] = passo + 1
+        prezzo = sequenza[min(passo, len(sequenza) - 1)]
+        if prezzo is None:
+            return None  # un None nella sequenza simula un errore del fornitore
+        return {"nome": ticker, "prezzo": prezzo, "precedente": self.precedenti.get(ticker, sequenza[0]),
+                "valuta": self.valute.get(ticker)}
+
+    def quotazioni_lotto(self, tickers):
+        return {t: self.quotazione(t) for t in tickers}
+
+    def storico(self, ticker, data_inizio, data_fine):
+        ticker = ticker.upper()
+        risposte = self.storici.get(ticker)
+        if risposte is None:
+            raise NotImplementedError
+        with self._lock:
+            passo = sum(1 for t, _, _ in self.richieste_storico if t == ticker)
+            self.richieste_storico.append((ticker, data_inizio, data_fine))
+        risposta = risposte[min(passo, len(risposte) - 1)]
+        return sorted((d, p) for d, p in risposta.items() if data_inizio <= d <= data_fine)
+
+
+class CacheQuotazioni(FornitoreQuotazioni):
+    """Cache delle quotazioni davanti a un altro fornitore.
+
+    Ogni quotazione resta valida per ttl secondi; oltre max_voci ticker si scarta quello
+    usato meno di recente. Se percorso è dato, la cache viene letta all'avvio e salvata
+    dopo ogni aggiornamento, così l'app parte subito con gli ultimi prezzi noti.
+    """
+
+    def __init__(self, fornitore, ttl=60.0, max_voci=500, percorso=FILE_CACHE):
+        super().__init__(max_thread=fornitore.max_thread, timeout=fornitore.timeout)
+        self.fornitore = fornitore
+        self.ttl = ttl
+        self.max_voci = max_voci
+        self.percorso = percorso
+        self._voci = OrderedDict()  # ticker -> (istante, quotazione)
+        self._lock = threading.Lock()
+        self._lock_file = threading.Lock()  # i salvataggi da thread diversi non si sovrappongono
+        self._in_aggiornamento = set()
+        if percorso:
+            self._carica()
+
+    def _carica(self):
+        try:
+            with open(self.percorso, "r") as f:
+                dati = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for ticker, voce in sorted(dati.items(), key=lambda kv: kv[1]["istante"]):
+            self._voci[ticker] = (voce["istante"], voce["quotazione"])
+        self._limita()
+
+    def _salva(self):
+        if not self.percorso:
+            return
+        with self._lock:
+            dati = {t: {"istante": istante, "quotazione": q} for t, (istante, q) in self._voci.items()}
+        tmp = self.percorso + ".tmp"
+        try:
+            with self._lock_file:
+                with open(tmp, "w") as f:
+                    json.dump(dati, f)
+                os.replace(tmp, self.percorso)
+        except OSError as e:
+            print(f"Impossibile salvare la cache delle quotazioni: {e}")
+
+    def _limita(self):
+        while len(self._voci) > self.max_voci:
+            self._voci.popitem(last=False)
+
+    def _memorizza(self, quotazioni):
+        adesso = time.time()
+        with self._lock:
+            for ticker, quotazione in quotazioni.items():
+                # i fallimenti non si memorizzano: la prossima richiesta riprova
+                if quotazione is not None:
+                    self._voci[ticker] = (adesso, quotazione)
+                    self._voci.move_to_end(ticker)
+            self._limita()
+        self._salva()
+
+    def quotazione(self, ticker):
+        return self.recupera_quotazioni([ticker]).get(ticker.upper())
+
+    def storico(self, ticker, data_inizio, data_fine):
+        # lo storico ha già il suo archivio su disco (prezzi_storici.py)
+        return self.fornitore.storico(ticker, data_inizio, data_fine)
+
+    def recupera_quotazioni(self, tickers, accetta_scadute=False):
+        """Come FornitoreQuotazioni.recupera_quotazioni, ma chiede al fornitore solo ciò che manca.
+
+        Con accetta_scadute=True le quotazioni scadute vengono restituite subito e
+        aggiornate in background; quelle mai viste vengono comunque recuperate.
+        """
+        tickers = list(dict.fromkeys(t.upper() for t in tickers))
+        adesso = time.time()
+        risultati, mancanti, scadute = {}, [], []
+        with self._lock:
+            for ticker in tickers:
+                voce = self._voci.get(ticker)
+                if voce is None:
+                    mancanti.append(ticker)
+                    continue
+                self._voci.move_to_end(ticker)
+                istante, quotazione = voce
+                if adesso - istante <= self.ttl:
+                    risultati[ticker] = quotazione
+                elif accetta_scadute:
+                    risultati[ticker] = quotazione
+                    scadute.append(ticker)
+                else:
+                    mancanti.append(ticker)
+
+        if mancanti:
+            nuove = self.fornitore.recupera_quotazioni(mancanti)
+            self._memorizza(nuove)
+            risultati.update(nuove)
+        if scadute:
+            self.aggiorna_in_background(scadute)
+        return {t: risultati.get(t) for t in tickers}
+
+    def aggiorna_in_background(self, tickers):
+        with self._lock:
+            tickers = [t for t in tickers if t not in self._in_aggiornamento]
+            self._in_aggiornamento.update(tickers)
+        if not tickers:
+            return None
+
+        def aggiorna():
+            try:
+                self._memorizza(self.fornitore.recupera_quotazioni(tickers))
+            finally:
+                with self._lock:
+                    self._in_aggiornamento.difference_update(tickers)
+
+        t = threading.Thread(target=aggiorna, daemon=True)
+        t.start()
+        return t
+
+    def ricarica(self, tickers):
+        """Chiede sempre al fornitore, anche le quotazioni ancora valide (aggiornamento periodico)."""
+        tickers = list(dict.fromkeys(t.upper() for t in tickers))
+        nuove = self.fornitore.recupera_quotazioni(tickers)
+        self._memorizza(nuove)
+        return nuove
+
+    def ultima_quotazione(self, ticker):
+        """Ultimo prezzo noto, anche se scaduto, senza mai andare in rete."""
+        with self._lock:
+            voce = self._voci.get(ticker.upper())
+        return voce[1] if voce else None
+
+
+_fornitore = None
+
+def fornitore_predefinito():
+    global _fornitore
+    if _fornitore is None:
+        _fornitore = CacheQuotazioni(FornitoreYFinance())
+    return _fornitore
+
+def imposta_fornitore(fornitore):
+    """Sostituisce il fornitore usato dall'app (es. FornitoreFinto nei test)."""
+    global _fornitore
+    _fornitore = fornitore
+
+def recupera_quotazioni(tickers, accetta_scadute=False):
+    fornitore = fornitore_predefinito()
+    if accetta_scadute and isinstance(fornitore, CacheQuotazioni):
+        return fornitore.recupera_quotazioni(tickers, accetta_scadute=True)
+    return fornitore.recupera_quotazioni(tickers)
+
+def recupera_quotazioni_fresche(tickers):
+    """Quotazioni appena chieste al fornitore, senza passare dal ttl della cache (che però si aggiorna)."""
+    fornitore = fornitore_predefinito()
+    if isinstance(fornitore, CacheQuotazioni):
+        return fornitore.ricarica(tickers)
+    return fornitore.recupera_quotazioni(tickers)
@@ -0,0 +1,129 @@
+#indici per cercare e filtrare le transazioni senza riscandire tutto il ledger
+
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenizza(testo):
+    """Parole senza maiuscole né accenti: "Caffè" e "CAFFE" danno la stessa parola."""
+    scomposto = unicodedata.normalize("NFKD", str(testo or "").casefold())
+    return _TOKEN.findall("".join(c for c in scomposto if not unicodedata.combining(c)))
+
+
+class IndiceTransazioni:
+    """Indici su una lista di transazioni; i risultati sono posizioni nella lista.
+
+    - data e importo: liste ordinate, un intervallo si trova con due bisezioni
+    - conto e categoria: dizionario valore -> insieme di posizioni
+    - descrizione: indice invertito parola -> insieme di posizioni (ricerca per prefisso)
+    """
+
+    def __init__(self, transazioni=()):
+        self.transazioni = []
+        self._per_data = []     # (data, posizione) ordinate
+        self._per_importo = []  # (importo, posizione) ordinate
+        self._per_conto = {}
+        self._per_categoria = {}
+        self._parole = {}
+        self._parole_ordinate = []
+        self.aggiungi_tutte(transazioni)
+
+    def aggiungi_tutte(self, transazioni):
+        inizio = len(self.transazioni)
+        self.transazioni.extend(transazioni)
+        nuove = range(inizio, len(self.transazioni))
+        for i in nuove:
+            self._indicizza_chiavi(i)
+        # per molti elementi conviene riordinare tutto invece di inserirli uno a uno
+        self._per_data.extend((self.transazioni[i]["data"], i) for i in nuove)
+        self._per_data.sort()
+        self._per_importo.extend((self.transazioni[i]["importo"], i) for i in nuove)
+        self._per_importo.sort()
+        self._parole_ordinate = sorted(self._parole)
+
+    def aggiungi(self, transazione):
+        i = len(self.transazioni)
+        self.transazioni.append(transazione)
+        nuove_parole = self._indicizza_chiavi(i)
+        insort(self._per_data, (transazione["data"], i))
+        insort(self._per_importo, (transazione["importo"], i))
+        for parola in nuove_parole:
+            insort(self._parole_ordinate, parola)
+
+    def _indicizza_chiavi(self, i):
+        tr = self.transazioni[i]
+        self._per_conto.setdefault(tr["conto"], set()).add(i)
+        self._per_categoria.setdefault(tr.get("categoria"), set()).add(i)
+        nuove_parole = []
+        for parola in tokenizza(tr.get("descrizione")):
+            if parola not in self._parole:
+                self._parole[parola] = set()
+                nuove_parole.append(parola)
+            self._parole[parola].add(i)
+        return nuove_parole
+
+    # --- valori noti (per i menu a tendina) ---
+
+    def conti(self):
+        return sorted(self._per_conto)
+
+    def categorie(self):
+        return sorted(c for c in self._per_categoria if c)
+
+    # --- singoli filtri ---
+
+    def per_data(self, data_da=None, data_a=None):
+        inizio = bisect_left(self._per_data, (data_da,)) if data_da else 0
+        # "\uffff": una data "YYYY-MM-DD" comprende anche gli orari di quel giorno
+        fine = bisect_right(self._per_data, (data_a + "\uffff",)) if data_a else len(self._per_data)
+        return {i for _, i in self._per_data[inizio:fine]}
+
+    def per_importo(self, minimo=None, massimo=None):
+        inizio = bisect_left(self._per_importo, (minimo, -1)) if minimo is not None else 0
+        fine = bisect_right(self._per_importo, (massimo, len(self.transazioni))) if massimo is not None else len(self._per_importo)
+        return {i for _, i in self._per_importo[inizio:fine]}
+
+    def per_testo(self, testo):
+        """Posizioni la cui descrizione contiene parole che iniziano con ciascuna parola cercata."""
+        risultato = None
+        for cercata in tokenizza(testo):
+            trovate = set()
+            k = bisect_left(self._parole_ordinate, cercata)
+            while k < len(self._parole_ordinate) and self._parole_ordinate[k].startswith(cercata):
+                trovate |= self._parole[self._parole_ordinate[k]]
+                k += 1
+            risultato = trovate if risultato is None else risultato & trovate
+            if not risultato:
+                return set()
+        return risultato if risultato is not None else set(range(len(self.transazioni)))
+
+    # --- combinazione ---
+
+    def filtra(self, data_da=None, data_a=None, conto=None, categoria=None,
+               importo_min=None, importo_max=None, testo=None):
+        """Posizioni (in ordine di inserimento) che rispettano tutti i filtri dati."""
+        insiemi = []
+        if conto:
+            insiemi.append(self._per_conto.get(conto, set()))
+        if categoria:
+            insiemi.append(self._per_categoria.get(categoria, set()))
+        if testo and testo.strip():
+            insiemi.append(self.per_testo(testo))
+        if data_da or data_a:
+            insiemi.append(self.per_data(data_da, data_a))
+        if importo_min is not None or importo_max is not None:
+            insiemi.append(self.per_importo(importo_min, importo_max))
+
+        if not insiemi:
+            return list(range(len(self.transazioni)))
+        # si parte dall'insieme più piccolo, così le intersezioni costano poco
+        insiemi.sort(key=len)
+        risultato = set(insiemi[0])
+        for altro in insiemi[1:]:
+            risultato &= altro
+            if not risultato:
+                break
+        return sorted(risultato)
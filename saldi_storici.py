@@ -0,0 +1,163 @@
+#saldi storici ricavati dal ledger e riconciliazione con conti.json
+#uso:  python saldi_storici.py riconcilia
+#      python saldi_storici.py saldo "Conto Corrente" 2025-05-31
+
+import sys
+import threading
+from bisect import bisect_right
+
+from denaro import centesimi
+from storage import carica_conti, carica_transazioni, versione_ledger
+
+PASSO_CHECKPOINT = 256  # ogni quante transazioni di un conto si salva un saldo parziale
+
+
+class SaldiConto:
+    """Movimenti di un conto ordinati per data, con un saldo cumulato ogni PASSO_CHECKPOINT movimenti.
+
+    Il saldo a una data si ottiene con una bisezione sulle date, partendo dal checkpoint
+    precedente e risommando al più PASSO_CHECKPOINT movimenti.
+    """
+
+    def __init__(self):
+        self.date = []
+        self.importi = []    # centesimi, nello stesso ordine di date
+        self.checkpoint = [0]  # checkpoint[k] = somma dei primi k * PASSO_CHECKPOINT importi
+
+    def _ricalcola_checkpoint(self, da=0):
+        k = da // PASSO_CHECKPOINT
+        del self.checkpoint[k + 1:]
+        somma = self.checkpoint[k]
+        for i in range(k * PASSO_CHECKPOINT, len(self.importi)):
+            somma += self.importi[i]
+            if (i + 1) % PASSO_CHECKPOINT == 0:
+                self.checkpoint.append(somma)
+
+    def carica(self, movimenti):
+        movimenti = sorted(movimenti, key=lambda m: m[0])  # (data, centesimi), ordinamento stabile per data
+        self.date = [d for d, _ in movimenti]
+        self.importi = [c for _, c in movimenti]
+        self.checkpoint = [0]
+        self._ricalcola_checkpoint()
+
+    def aggiungi(self, data, centesimi):
+        if not self.date or data >= self.date[-1]:
+            posizione = len(self.date)
+            self.date.append(data)
+            self.importi.append(centesimi)
+        else:
+            # movimento retrodatato: si inserisce al suo posto e si rifanno i checkpoint successivi
+            posizione = bisect_right(self.date, data)
+            self.date.insert(posizione, data)
+            self.importi.insert(posizione, centesimi)
+        self._ricalcola_checkpoint(posizione)
+
+    def saldo_al(self, data):
+        """Somma (in centesimi) dei movimenti fino alla fine del giorno `data` compreso."""
+        fine = bisect_right(self.date, data + "\uffff")
+        k = fine // PASSO_CHECKPOINT
+        return self.checkpoint[k] + sum(self.importi[k * PASSO_CHECKPOINT:fine])
+
+    def totale(self):
+        return self.saldo_al("\uffff")
+
+
+class IndiceSaldi:
+    """Un SaldiConto per ogni conto del ledger."""
+
+    def __init__(self, transazioni=()):
+        self.conti = {}
+        movimenti = {}
+        for tr in transazioni:
+            movimenti.setdefault(tr["conto"], []).append((tr["data"], centesimi(tr["importo"])))
+        for conto, lista in movimenti.items():
+            self.conti[conto] = SaldiConto()
+            self.conti[conto].carica(lista)
+
+    def aggiungi(self, transazione):
+        self.conti.setdefault(transazione["conto"], SaldiConto()).aggiungi(
+            transazione["data"], centesimi(transazione["importo"]))
+
+    def saldo_al(self, conto, data):
+        saldi = self.conti.get(conto)
+        return saldi.saldo_al(data) / 100 if saldi else 0.0
+
+
+_lock = threading.Lock()
+_indice = None
+_versione_indice = None
+
+def indice_saldi():
+    """Indice costruito sul ledger corrente; si ricostruisce solo se il ledger è cambiato."""
+    global _indice, _versione_indice
+    with _lock:
+        # la versione prima delle transazioni: se cambia nel mezzo, la prossima lettura ricostruisce
+        versione = versione_ledger()
+        if _indice is None or versione != _versione_indice:
+            _indice = IndiceSaldi(carica_transazioni())
+            _versione_indice = versione
+        return _indice
+
+def registra(transazioni):
+    """Aggiunge all'indice le transazioni appena accodate (chiamato da transazione_atomica).
+
+    Se nel frattempo il ledger è cambiato anche per altro, l'indice resta com'è e
+    si ricostruisce alla prossima lettura.
+    """
+    global _versione_indice
+    if not transazioni:
+        return
+    with _lock:
+        if _indice is None:
+            return
+        versione = versione_ledger()
+        if versione != (_versione_indice[0], _versione_indice[1] + len(transazioni)):
+            return
+        for tr in transazioni:
+            _indice.aggiungi(tr)
+        _versione_indice = versione
+
+def saldo_al(conto, data):
+    """Saldo di `conto` alla fine del giorno `data` (YYYY-MM-DD) secondo il ledger."""
+    return indice_saldi().saldo_al(conto, data)
+
+
+def riconcilia(conti=None, transazioni=None):
+    """Confronta conti.json con la somma del ledger.
+
+    Ritorna [(conto, saldo_conti, saldo_ledger, differenza)] per ogni conto che non torna.
+    Una differenza può essere un saldo iniziale mai registrato come transazione o una
+    scrittura interrotta tra ledger e conti.json.
+    Senza `transazioni` le somme sono i totali dell'indice dei saldi, già in memoria e
+    aggiornato a ogni registrazione: nessuna copia del ledger. Con `transazioni` (anche un
+    generatore) le si scorre una volta sola senza tenerle.
+    """
+    conti = carica_conti() if conti is None else conti
+    if transazioni is None:
+        somme = {conto: saldi.totale() for conto, saldi in indice_saldi().conti.items()}
+    else:
+        somme = {}
+        for tr in transazioni:
+            somme[tr["conto"]] = somme.get(tr["conto"], 0) + centesimi(tr["importo"])
+
+    differenze = []
+    for conto in sorted(set(conti) | set(somme)):
+        saldo_conti = centesimi(conti.get(conto, 0))
+        saldo_ledger = somme.get(conto, 0)
+        if saldo_conti != saldo_ledger:
+            differenze.append((conto, saldo_conti / 100, saldo_ledger / 100, (saldo_conti - saldo_ledger) / 100))
+    return differenze
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "riconcilia":
+        differenze = riconcilia()
+        if not differenze:
+            print("Tutti i conti tornano con il ledger.")
+        for conto, saldo_conti, saldo_ledger, differenza in differenze:
+            print(f"{conto}: conti.json {saldo_conti:.2f} €, ledger {saldo_ledger:.2f} €, differenza {differenza:+.2f} €")
+        sys.exit(1 if differenze else 0)
+    elif len(sys.argv) == 4 and sys.argv[1] == "saldo":
+        print(f"{sys.argv[2]} al {sys.argv[3]}: {saldo_al(sys.argv[2], sys.argv[3]):.2f} €")
+    else:
+        print('Uso: python saldi_storici.py riconcilia | saldo "Conto" YYYY-MM-DD')
@@ -3,26 +3,392 @@
 
 import json
 import os
+import threading
+
+from blocchi_file import aggiorna, blocca, incrementa_versione
+from denaro import somma_saldo
+from tabella_transazioni import TabellaTransazioni
+
+# "json" (default) oppure "sqlite", vedi storage_sqlite.py
+BACKEND = os.environ.get("CATO_STORAGE", "json")
 
 FILE_CONTI = "data/conti.json"
 FILE_TRANSAZIONI = "data/transazioni.json"
 
-def carica_conti():
+# Modalità journal: le nuove transazioni vengono accodate (una per riga, JSONL)
+# invece di riscrivere tutto transazioni.json, che resta lo snapshot compattato.
+# Un transazioni.json già esistente è usato così com'è come snapshot iniziale.
+USA_JOURNAL = True
+FILE_JOURNAL = "data/transazioni.jsonl"
+SOGLIA_COMPATTAZIONE = 1000  # righe di journal oltre le quali si compatta in background
+
+# _lock protegge journal e cache del repository tra i thread; tra processi i file sono protetti
+# da blocca() (vedi blocchi_file.py). Ordine fisso per non bloccarsi: prima _lock, poi blocca().
+_lock = threading.RLock()
+_righe_journal = None  # contatore righe, calcolato al primo accesso
+
+
+def _scrivi_atomico(percorso, dati, indent=4):
+    # scrive su un file temporaneo e poi lo rinomina, così non resta mai un file a metà
+    # nome unico per processo e thread: due scrittori non si rubano il file temporaneo
+    tmp = f"{percorso}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(dati, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, percorso)
+
+
+def _firma(percorso):
+    # (mtime, dimensione, inode) del file, None se non esiste; l'inode cambia a ogni
+    # _scrivi_atomico, anche se un altro processo riscrive con stessa dimensione e stesso mtime
+    try:
+        st = os.stat(percorso)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _leggi_conti():
     if not os.path.exists(FILE_CONTI):
         return {}
     with open(FILE_CONTI, "r") as f:
         return json.load(f)
 
-def salva_conti(conti):
-    with open(FILE_CONTI, "w") as f:
-        json.dump(conti, f, indent=4)
 
-def carica_transazioni():
+def _leggi_snapshot():
     if not os.path.exists(FILE_TRANSAZIONI):
         return []
     with open(FILE_TRANSAZIONI, "r") as f:
-        return json.load(f)
+        contenuto = f.read().strip()
+    return json.loads(contenuto) if contenuto else []
+
+def _leggi_journal(percorso=None):
+    percorso = percorso or FILE_JOURNAL
+    if not os.path.exists(percorso):
+        return []
+    righe = []
+    with open(percorso, "r") as f:
+        for riga in f:
+            riga = riga.strip()
+            if not riga:
+                continue
+            try:
+                voce = json.loads(riga)
+            except json.JSONDecodeError:
+                # riga troncata da un crash durante la scrittura: si ignora
+                continue
+            # una riga può contenere un intero batch (lista), scritto o perso tutto insieme
+            if isinstance(voce, list):
+                righe.extend(voce)
+            else:
+                righe.append(voce)
+    return righe
+
+def _file_compattazione():
+    return FILE_JOURNAL + ".compattazione"
+
+def _fondi_compattazione():
+    # Fonde nello snapshot il journal messo da parte da compatta_journal.
+    # Il file .len registra la lunghezza dello snapshot prima della fusione: se dopo un crash
+    # lo snapshot è più lungo, la fusione era già avvenuta e non va ripetuta.
+    vecchio = _file_compattazione()
+    file_len = vecchio + ".len"
+    if not os.path.exists(vecchio):
+        if os.path.exists(file_len):
+            os.remove(file_len)
+        return
+    righe = _leggi_journal(vecchio)
+    snapshot = _leggi_snapshot()
+    gia_fuso = False
+    if os.path.exists(file_len):
+        try:
+            with open(file_len, "r") as f:
+                gia_fuso = len(snapshot) != int(f.read().strip())
+        except ValueError:
+            # .len illeggibile: la fusione è avvenuta se lo snapshot finisce già con queste righe
+            gia_fuso = bool(righe) and snapshot[-len(righe):] == righe
+    else:
+        _scrivi_atomico(file_len, len(snapshot))
+    if righe and not gia_fuso:
+        _scrivi_atomico(FILE_TRANSAZIONI, snapshot + righe)
+    os.remove(vecchio)
+    os.remove(file_len)
+
+def _leggi_transazioni():
+    if not USA_JOURNAL:
+        return _leggi_snapshot()
+    with _lock, blocca(FILE_TRANSAZIONI):
+        _fondi_compattazione()
+        return _leggi_snapshot() + _leggi_journal()
+
+def _scrivi_transazioni(transazioni):
+    global _righe_journal
+    with _lock, blocca(FILE_TRANSAZIONI):
+        _scrivi_atomico(FILE_TRANSAZIONI, transazioni)
+        if USA_JOURNAL:
+            # riscrittura completa: lo snapshot diventa la lista intera e il journal si svuota
+            if os.path.exists(FILE_JOURNAL):
+                os.remove(FILE_JOURNAL)
+            _righe_journal = 0
+        incrementa_versione(FILE_TRANSAZIONI)
+
+def _accoda_file(nuove):
+    # Più transazioni finiscono su un'unica riga, così dopo un crash ci sono tutte o nessuna.
+    # Ritorna True se il journal ha superato la soglia di compattazione.
+    global _righe_journal
+    if not USA_JOURNAL:
+        with _lock, blocca(FILE_TRANSAZIONI):
+            _scrivi_atomico(FILE_TRANSAZIONI, _leggi_snapshot() + nuove)
+            incrementa_versione(FILE_TRANSAZIONI)
+        return False
+    blocco = json.dumps(nuove[0] if len(nuove) == 1 else nuove) + "\n"
+    with _lock, blocca(FILE_TRANSAZIONI):
+        _fondi_compattazione()
+        with open(FILE_JOURNAL, "a+") as f:
+            # se l'ultima scrittura è stata interrotta a metà riga, si riparte da una riga nuova
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                if f.read(1) != "\n":
+                    blocco = "\n" + blocco
+            f.write(blocco)
+            f.flush()
+            os.fsync(f.fileno())
+        incrementa_versione(FILE_TRANSAZIONI)
+        # il contatore vede solo le righe di questo processo: la soglia è indicativa
+        if _righe_journal is None:
+            _righe_journal = len(_leggi_journal())
+        else:
+            _righe_journal += len(nuove)
+        return _righe_journal >= SOGLIA_COMPATTAZIONE
+
+def _compatta_file():
+    global _righe_journal
+    with _lock, blocca(FILE_TRANSAZIONI):
+        _fondi_compattazione()
+        if not os.path.exists(FILE_JOURNAL):
+            _righe_journal = 0
+            return
+        # il journal viene prima rinominato: se il processo muore a metà,
+        # al prossimo accesso _fondi_compattazione sa ancora quali righe vanno fuse
+        os.replace(FILE_JOURNAL, _file_compattazione())
+        _fondi_compattazione()
+        _righe_journal = 0
+
+
+class Repository:
+    """Conti e transazioni già letti dal disco, condivisi da tutto il processo.
+
+    La copia in memoria resta valida finché mtime e dimensione dei file non cambiano;
+    le scritture passano di qui e aggiornano direttamente la cache, così quello che il
+    processo ha appena scritto non viene mai riletto.
+    """
+
+    def __init__(self):
+        self._conti = None
+        self._firma_conti = None
+        self._transazioni = None
+        self._firma_transazioni = None
+        self._tabella = None  # stesse transazioni in forma colonnare, vedi tabella_transazioni.py
+        # versione del ledger in memoria: la generazione cambia a ogni rilettura o riscrittura,
+        # accodate conta le transazioni aggiunte da allora (vedi versione_ledger)
+        self._generazione = 0
+        self._accodate = 0
+
+    def _firma_ledger(self):
+        return (_firma(FILE_TRANSAZIONI), _firma(FILE_JOURNAL), _firma(_file_compattazione()))
+
+    def _ledger_valido(self):
+        return self._transazioni is not None and self._firma_ledger() == self._firma_transazioni
+
+    def carica_conti(self):
+        with _lock:
+            firma = _firma(FILE_CONTI)
+            if self._conti is None or firma != self._firma_conti:
+                self._conti = _leggi_conti()
+                self._firma_conti = firma
+            return dict(self._conti)
+
+    def salva_conti(self, conti):
+        with _lock, blocca(FILE_CONTI):
+            self._scrivi_conti(conti)
+            incrementa_versione(FILE_CONTI)
+
+    def _scrivi_conti(self, conti):
+        _scrivi_atomico(FILE_CONTI, conti)
+        self._conti = dict(conti)
+        self._firma_conti = _firma(FILE_CONTI)
+
+    def aggiorna_conti(self, modifica):
+        # concorrenza ottimistica: se un altro processo scrive conti.json tra la lettura
+        # e la scrittura, modifica() viene rifatta sui saldi aggiornati
+        with _lock:
+            return dict(aggiorna(FILE_CONTI, self.carica_conti, modifica, self._scrivi_conti))
+
+    def carica_transazioni(self):
+        with _lock:
+            return list(self._carica_lista())
+
+    def carica_tabella(self):
+        with _lock:
+            if not self._ledger_valido() or self._tabella is None:
+                self._tabella = TabellaTransazioni(self._carica_lista())
+            return self._tabella
+
+    def _carica_lista(self):
+        if not self._ledger_valido():
+            firma = self._firma_ledger()
+            self._transazioni = _leggi_transazioni()
+            self._firma_transazioni = firma
+            self._tabella = None
+            self._nuova_generazione()
+        return self._transazioni
+
+    def _nuova_generazione(self):
+        self._generazione += 1
+        self._accodate = 0
+
+    def versione(self):
+        with _lock:
+            self._carica_lista()
+            return (self._generazione, self._accodate)
+
+    def salva_transazioni(self, transazioni):
+        with _lock, blocca(FILE_TRANSAZIONI):
+            _scrivi_transazioni(transazioni)
+            self._transazioni = list(transazioni)
+            self._tabella = None
+            self._firma_transazioni = self._firma_ledger()
+            self._nuova_generazione()
+
+    def accoda_transazioni(self, nuove):
+        nuove = list(nuove)
+        if not nuove:
+            return
+        # il lock sul file copre anche il controllo della cache: nessun altro processo
+        # può accodare tra il controllo e la scrittura
+        with _lock, blocca(FILE_TRANSAZIONI):
+            valido = self._ledger_valido()
+            da_compattare = _accoda_file(nuove)
+            if valido:
+                self._transazioni.extend(nuove)
+                self._accodate += len(nuove)
+                if self._tabella is not None:
+                    self._tabella.estendi(nuove)
+                self._firma_transazioni = self._firma_ledger()
+            else:
+                self._transazioni = None
+                self._tabella = None
+        if da_compattare:
+            compatta_in_background()
+
+    def compatta_journal(self):
+        with _lock, blocca(FILE_TRANSAZIONI):
+            valido = self._ledger_valido()
+            _compatta_file()
+            # il contenuto non cambia, cambiano solo i file
+            if valido:
+                self._firma_transazioni = self._firma_ledger()
+
+    def invalida(self):
+        with _lock:
+            self._conti = None
+            self._transazioni = None
+            self._tabella = None
+
+
+repository = Repository()
+
+
+def carica_conti():
+    return repository.carica_conti()
+
+def salva_conti(conti):
+    repository.salva_conti(conti)
+
+def aggiorna_conti(modifica):
+    """Applica modifica(conti) -> conti a conti.json senza perdere scritture di altri processi.
+
+    modifica può essere chiamata più volte (una per tentativo): non deve avere effetti collaterali.
+    """
+    return repository.aggiorna_conti(modifica)
+
+def carica_transazioni():
+    return repository.carica_transazioni()
+
+def versione_ledger():
+    """(generazione, accodate): cambia a ogni modifica del ledger, anche di altri processi.
+
+    Se tra due letture sono state solo accodate n transazioni la generazione è la stessa e
+    accodate è cresciuto di n: chi tiene dati ricavati dal ledger può aggiornarli invece di rifarli.
+    """
+    return repository.versione()
+
+def carica_tabella_transazioni():
+    """Il ledger come TabellaTransazioni, condivisa e aggiornata a ogni accodamento: da non modificare."""
+    return repository.carica_tabella()
 
 def salva_transazioni(transazioni):
-    with open(FILE_TRANSAZIONI, "w") as f:
-        json.dump(transazioni, f, indent=4)
+    repository.salva_transazioni(transazioni)
+
+def accoda_transazioni(nuove):
+    """Aggiunge transazioni al journal con una sola scrittura + fsync, senza rileggere il ledger."""
+    repository.accoda_transazioni(nuove)
+
+def accoda_transazione(transazione):
+    accoda_transazioni([transazione])
+
+def applica_batch(delta_saldi, nuove_transazioni):
+    """Registra in un colpo solo un gruppo di transazioni e le relative variazioni di saldo.
+
+    Il ledger riceve una sola scrittura (una riga di journal), conti.json una sola
+    scrittura su file temporaneo + rename. Il ledger va scritto per primo: se il processo
+    muore prima dei saldi, la differenza resta ricostruibile dalle transazioni.
+    """
+    def applica_delta(conti):
+        for conto, delta in delta_saldi.items():
+            conti[conto] = somma_saldo(conti.get(conto, 0), delta)
+        return conti
+
+    accoda_transazioni(nuove_transazioni)
+    if not delta_saldi:
+        return carica_conti()
+    return aggiorna_conti(applica_delta)
+
+def compatta_journal():
+    """Fonde il journal nello snapshot transazioni.json e lo svuota."""
+    repository.compatta_journal()
+
+def compatta_in_background():
+    t = threading.Thread(target=compatta_journal, daemon=True)
+    t.start()
+    return t
+
+
+# --- query ---
+# con il backend json sono semplici scansioni della lista, storage_sqlite le serve con gli indici
+
+def transazioni_per_conto(conto):
+    return [tr for tr in carica_transazioni() if tr["conto"] == conto]
+
+def tabella_per_conto(conto):
+    """Le transazioni di un conto come TabellaTransazioni (dalla tabella in cache, senza rileggere il ledger)."""
+    return carica_tabella_transazioni().per_conto(conto)
+
+def transazioni_intervallo(data_inizio, data_fine, conto=None):
+    """Transazioni con data compresa tra data_inizio e data_fine (YYYY-MM-DD, estremi inclusi)."""
+    fine = data_fine + "\uffff"
+    return [tr for tr in carica_transazioni()
+            if data_inizio <= tr["data"] <= fine and (conto is None or tr["conto"] == conto)]
+
+def transazioni_per_categoria(categoria):
+    return [tr for tr in carica_transazioni() if tr["categoria"] == categoria]
+
+
+# letture json sempre raggiungibili (servono alla migrazione verso sqlite)
+_carica_conti_json = _leggi_conti
+_carica_transazioni_json = _leggi_transazioni
+
+if BACKEND == "sqlite":
+    from storage_sqlite import (carica_conti, salva_conti, aggiorna_conti, carica_transazioni, carica_tabella_transazioni, salva_transazioni,
+                                versione_ledger, accoda_transazioni, accoda_transazione, applica_batch, compatta_journal,
+                                transazioni_per_conto, tabella_per_conto, transazioni_intervallo, transazioni_per_categoria)
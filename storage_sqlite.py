@@ -0,0 +1,203 @@
+#backend SQLite opzionale: stesso contratto carica_*/salva_* di storage.py, più query indicizzate
+#si attiva con la variabile d'ambiente CATO_STORAGE=sqlite
+#migrazione dei file json esistenti:  python storage_sqlite.py migra
+
+import os
+import sqlite3
+import sys
+import threading
+
+from denaro import normalizza
+from tabella_transazioni import TabellaTransazioni
+
+FILE_DB = "data/cato.db"
+ATTESA_LOCK = 30  # secondi
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conti (
+    nome TEXT PRIMARY KEY,
+    saldo REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transazioni (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL,
+    conto TEXT NOT NULL,
+    importo REAL NOT NULL,
+    categoria TEXT,
+    descrizione TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transazioni_conto_data ON transazioni(conto, data);
+CREATE INDEX IF NOT EXISTS idx_transazioni_categoria ON transazioni(categoria);
+CREATE INDEX IF NOT EXISTS idx_transazioni_data ON transazioni(data);
+"""
+
+_COLONNE = "data, conto, importo, categoria, descrizione"
+
+# una connessione per thread (sqlite3 non condivide le connessioni tra thread)
+_locale = threading.local()
+
+
+def connessione():
+    conn = getattr(_locale, "conn", None)
+    if conn is None or getattr(_locale, "percorso", None) != FILE_DB:
+        cartella = os.path.dirname(FILE_DB)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+        # con più processi che scrivono si aspetta il lock invece di fallire subito
+        conn = sqlite3.connect(FILE_DB, timeout=ATTESA_LOCK)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _locale.conn = conn
+        _locale.percorso = FILE_DB
+    return conn
+
+def _a_dict(riga):
+    data, conto, importo, categoria, descrizione = riga
+    return {
+        "data": data,
+        "conto": conto,
+        "importo": importo,
+        "categoria": categoria,
+        "descrizione": descrizione
+    }
+
+def _a_tupla(tr):
+    return (tr["data"], tr["conto"], tr["importo"], tr.get("categoria"), tr.get("descrizione"))
+
+def _fine_giornata(data):
+    # "2025-05-17" deve includere anche "2025-05-17 10:52"
+    return data + "\uffff"
+
+
+def carica_conti():
+    righe = connessione().execute("SELECT nome, saldo FROM conti ORDER BY rowid")
+    return {nome: saldo for nome, saldo in righe}
+
+def salva_conti(conti):
+    conn = connessione()
+    with conn:
+        conn.execute("DELETE FROM conti")
+        conn.executemany("INSERT INTO conti (nome, saldo) VALUES (?, ?)", conti.items())
+
+def aggiorna_conti(modifica):
+    """Lettura e scrittura dei saldi nella stessa transazione: BEGIN IMMEDIATE fa aspettare gli altri scrittori."""
+    conn = connessione()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conti = modifica(carica_conti())
+        conn.execute("DELETE FROM conti")
+        conn.executemany("INSERT INTO conti (nome, saldo) VALUES (?, ?)", conti.items())
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return conti
+
+def carica_transazioni():
+    righe = connessione().execute(f"SELECT {_COLONNE} FROM transazioni ORDER BY id")
+    return [_a_dict(r) for r in righe]
+
+def versione_ledger():
+    # data_version cambia quando un'altra connessione scrive, seq cresce di uno per riga inserita
+    conn = connessione()
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    riga = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'transazioni'").fetchone()
+    return (data_version, riga[0] if riga else 0)
+
+def carica_tabella_transazioni():
+    righe = connessione().execute(f"SELECT {_COLONNE} FROM transazioni ORDER BY id")
+    return TabellaTransazioni(_a_dict(r) for r in righe)
+
+def salva_transazioni(transazioni):
+    conn = connessione()
+    with conn:
+        conn.execute("DELETE FROM transazioni")
+        conn.executemany(f"INSERT INTO transazioni ({_COLONNE}) VALUES (?, ?, ?, ?, ?)",
+                         (_a_tupla(tr) for tr in transazioni))
+
+def accoda_transazioni(nuove):
+    conn = connessione()
+    with conn:
+        conn.executemany(f"INSERT INTO transazioni ({_COLONNE}) VALUES (?, ?, ?, ?, ?)",
+                         (_a_tupla(tr) for tr in nuove))
+
+def accoda_transazione(transazione):
+    accoda_transazioni([transazione])
+
+def applica_batch(delta_saldi, nuove_transazioni):
+    """Transazioni e variazioni di saldo in un'unica transazione SQLite."""
+    conn = connessione()
+    with conn:
+        for conto, delta in delta_saldi.items():
+            conn.execute("INSERT INTO conti (nome, saldo) VALUES (?, 0) ON CONFLICT(nome) DO NOTHING", (conto,))
+            # ROUND(..., 2): il saldo resta al centesimo anche dopo migliaia di aggiornamenti
+            conn.execute("UPDATE conti SET saldo = ROUND(saldo + ?, 2) WHERE nome = ?", (normalizza(delta), conto))
+        conn.executemany(f"INSERT INTO transazioni ({_COLONNE}) VALUES (?, ?, ?, ?, ?)",
+                         (_a_tupla(tr) for tr in nuove_transazioni))
+    return carica_conti()
+
+def compatta_journal():
+    # con SQLite non c'è journal da compattare
+    pass
+
+
+# --- query servite dagli indici ---
+
+def transazioni_per_conto(conto):
+    righe = connessione().execute(
+        f"SELECT {_COLONNE} FROM transazioni WHERE conto = ? ORDER BY data, id", (conto,))
+    return [_a_dict(r) for r in righe]
+
+def tabella_per_conto(conto):
+    # solo le righe del conto, dall'indice (conto, data): non si carica tutta la tabella
+    return TabellaTransazioni(transazioni_per_conto(conto))
+
+def transazioni_intervallo(data_inizio, data_fine, conto=None):
+    """Transazioni con data compresa tra data_inizio e data_fine (YYYY-MM-DD, estremi inclusi)."""
+    if conto is None:
+        righe = connessione().execute(
+            f"SELECT {_COLONNE} FROM transazioni WHERE data >= ? AND data <= ? ORDER BY data, id",
+            (data_inizio, _fine_giornata(data_fine)))
+    else:
+        righe = connessione().execute(
+            f"SELECT {_COLONNE} FROM transazioni WHERE conto = ? AND data >= ? AND data <= ? ORDER BY data, id",
+            (conto, data_inizio, _fine_giornata(data_fine)))
+    return [_a_dict(r) for r in righe]
+
+def transazioni_per_categoria(categoria):
+    righe = connessione().execute(
+        f"SELECT {_COLONNE} FROM transazioni WHERE categoria = ? ORDER BY data, id", (categoria,))
+    return [_a_dict(r) for r in righe]
+
+
+# --- migrazione ---
+
+def migra_da_json(file_conti="data/conti.json", file_transazioni="data/transazioni.json"):
+    """Importa conti e transazioni dai file json (journal incluso) sostituendo il contenuto del db."""
+    import storage
+
+    vecchi_conti, vecchie_transazioni = storage.FILE_CONTI, storage.FILE_TRANSAZIONI
+    storage.FILE_CONTI, storage.FILE_TRANSAZIONI = file_conti, file_transazioni
+    try:
+        conti = storage._carica_conti_json()
+        transazioni = storage._carica_transazioni_json()
+    finally:
+        storage.FILE_CONTI, storage.FILE_TRANSAZIONI = vecchi_conti, vecchie_transazioni
+
+    conn = connessione()
+    with conn:
+        conn.execute("DELETE FROM conti")
+        conn.executemany("INSERT INTO conti (nome, saldo) VALUES (?, ?)", conti.items())
+        conn.execute("DELETE FROM transazioni")
+        conn.executemany(f"INSERT INTO transazioni ({_COLONNE}) VALUES (?, ?, ?, ?, ?)",
+                         (_a_tupla(tr) for tr in transazioni))
+    return len(conti), len(transazioni)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migra":
+        n_conti, n_transazioni = migra_da_json(*sys.argv[2:4])
+        print(f"Migrati {n_conti} conti e {n_transazioni} transazioni in {FILE_DB}")
+    else:
+        print("Uso: python storage_sqlite.py migra [file_conti.json] [file_transazioni.json]")
@@ -0,0 +1,88 @@
+#stress test: N processi scrivono insieme sugli stessi file di data/, poi si controlla che non manchi nulla
+#uso:  python stress_storage.py [processi] [transazioni_per_processo]
+#gira in una cartella temporanea: i dati veri non vengono toccati
+
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+PROCESSI = 8
+TRANSAZIONI = 200
+CONTI = ("Stress A", "Stress B", "Stress C")
+
+
+def _scrittore(cartella, indice, quante, soglia_compattazione):
+    os.chdir(cartella)
+    import storage
+    import logica_transazioni
+
+    storage.SOGLIA_COMPATTAZIONE = soglia_compattazione  # compattazioni frequenti, in mezzo alle scritture
+    casuale = random.Random(indice)
+    for n in range(quante):
+        importo = casuale.randint(-5000, 5000) / 100
+        conto = casuale.choice(CONTI)
+        if n % 10 == 0:
+            # ogni tanto un giroconto: due transazioni e due saldi nello stesso batch
+            altro = casuale.choice([c for c in CONTI if c != conto])
+            with logica_transazioni.transazione_atomica() as batch:
+                batch.registra(-abs(importo), conto, "giroconto", f"p{indice}-{n}", "2025-01-01")
+                batch.registra(abs(importo), altro, "giroconto", f"p{indice}-{n}", "2025-01-01")
+        else:
+            logica_transazioni.registra_transazione(importo, conto, "stress", f"p{indice}-{n}", "2025-01-01")
+
+
+def esegui(processi=PROCESSI, quante=TRANSAZIONI, soglia_compattazione=50):
+    cartella = tempfile.mkdtemp(prefix="cato_stress_")
+    os.makedirs(os.path.join(cartella, "data"))
+    try:
+        inizio = time.perf_counter()
+        contesto = multiprocessing.get_context("spawn")
+        lavoratori = [contesto.Process(target=_scrittore, args=(cartella, i, quante, soglia_compattazione))
+                      for i in range(processi)]
+        for p in lavoratori:
+            p.start()
+        for p in lavoratori:
+            p.join()
+        durata = time.perf_counter() - inizio
+        if any(p.exitcode != 0 for p in lavoratori):
+            return [f"{sum(p.exitcode != 0 for p in lavoratori)} processi terminati con errore"], durata
+
+        os.chdir(cartella)
+        import storage
+        import aggregati
+        import saldi_storici
+        storage.repository.invalida()
+
+        problemi = []
+        transazioni = storage.carica_transazioni()
+        attese = processi * (quante + (quante + 9) // 10)
+        if len(transazioni) != attese:
+            problemi.append(f"transazioni nel ledger: {len(transazioni)}, attese {attese}")
+        descrizioni = {(tr["descrizione"], tr["importo"]) for tr in transazioni}
+        if len(descrizioni) != len(transazioni):
+            problemi.append(f"{len(transazioni) - len(descrizioni)} transazioni duplicate")
+        for conto, saldo_conti, saldo_ledger, differenza in saldi_storici.riconcilia():
+            problemi.append(f"{conto}: conti.json {saldo_conti:.2f}, ledger {saldo_ledger:.2f}")
+        for chiave, salvato, atteso in aggregati.verifica():
+            problemi.append(f"aggregati {chiave}: {salvato} invece di {atteso}")
+        return problemi, durata
+    finally:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        shutil.rmtree(cartella, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    processi = int(sys.argv[1]) if len(sys.argv) > 1 else PROCESSI
+    quante = int(sys.argv[2]) if len(sys.argv) > 2 else TRANSAZIONI
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    problemi, durata = esegui(processi, quante)
+    print(f"{processi} processi x {quante} scritture in {durata:.1f} s")
+    if not problemi:
+        print("Nessun aggiornamento perso: ledger, conti.json e aggregati coerenti.")
+    for problema in problemi:
+        print(f"  PROBLEMA: {problema}")
+    sys.exit(1 if problemi else 0)
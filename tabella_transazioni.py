@@ -0,0 +1,251 @@
+#ledger in forma colonnare: una colonna compatta per campo invece di un dict per transazione
+#le righe si leggono come prima (tr["importo"], tr.get("categoria")), le scansioni vanno su numpy
+
+from array import array
+from collections.abc import Mapping
+from datetime import date
+
+from denaro import centesimi
+
+CAMPI = ("data", "conto", "categoria", "importo", "descrizione")
+SENZA_ORARIO = -1
+
+
+class Dizionario:
+    """Codifica a dizionario: ogni valore distinto è salvato una volta sola, le righe tengono un codice."""
+
+    def __init__(self):
+        self.valori = []
+        self.codici = {}
+
+    def codice(self, valore):
+        c = self.codici.get(valore)
+        if c is None:
+            c = self.codici[valore] = len(self.valori)
+            self.valori.append(valore)
+        return c
+
+    def __len__(self):
+        return len(self.valori)
+
+
+def _codifica_data(testo):
+    """"YYYY-MM-DD" o "YYYY-MM-DD HH:MM" -> (giorno ordinale, minuti dalla mezzanotte); None se altro formato."""
+    try:
+        giorno = date(int(testo[0:4]), int(testo[5:7]), int(testo[8:10])).toordinal()
+        if len(testo) == 10 and testo[4] == testo[7] == "-":
+            return giorno, SENZA_ORARIO
+        if len(testo) == 16 and testo[10] == " " and testo[13] == ":":
+            return giorno, int(testo[11:13]) * 60 + int(testo[14:16])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def _decodifica_data(giorno, minuti):
+    testo = date.fromordinal(giorno).isoformat()
+    if minuti != SENZA_ORARIO:
+        testo += f" {minuti // 60:02d}:{minuti % 60:02d}"
+    return testo
+
+
+class RigaTransazione(Mapping):
+    """Vista in sola lettura su una riga della tabella, usabile come il dict di una transazione."""
+
+    __slots__ = ("tabella", "posizione")
+
+    def __init__(self, tabella, posizione):
+        self.tabella = tabella
+        self.posizione = posizione
+
+    def __getitem__(self, campo):
+        return self.tabella.valore(self.posizione, campo)
+
+    def __iter__(self):
+        yield from CAMPI
+        yield from self.tabella._extra.get(self.posizione, ())
+
+    def __len__(self):
+        return len(CAMPI) + len(self.tabella._extra.get(self.posizione, ()))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class TabellaTransazioni:
+    """Transazioni per colonne.
+
+    - data: giorno ordinale (int32) + minuti dalla mezzanotte (int16, -1 se senza orario)
+    - importo: centesimi interi (int64)
+    - conto, categoria, descrizione: codici (uint32) in un Dizionario condiviso
+    Date in formati diversi e campi in più (rari) stanno in dizionari a parte per posizione.
+    Le colonne sono `array` della libreria standard; numpy si importa solo per le scansioni.
+    """
+
+    def __init__(self, transazioni=(), dizionari=None):
+        self.giorni = array("i")
+        self.minuti = array("h")
+        self.centesimi = array("q")
+        self.codici = {campo: array("I") for campo in ("conto", "categoria", "descrizione")}
+        # le sotto-tabelle condividono i dizionari: i codici restano confrontabili
+        self.dizionari = dizionari or {campo: Dizionario() for campo in self.codici}
+        self._date_testo = {}
+        self._extra = {}
+        self.estendi(transazioni)
+
+    # --- scrittura ---
+
+    def aggiungi(self, tr):
+        posizione = len(self.centesimi)
+        # prima tutti i valori (qui può fallire una conversione), poi le append: le colonne
+        # restano sempre della stessa lunghezza
+        codificata = _codifica_data(tr["data"])
+        data_testo = None
+        if codificata is None:
+            data_testo = tr["data"]
+            codificata = (0, SENZA_ORARIO)
+        valori = [(self.giorni, codificata[0]), (self.minuti, codificata[1]),
+                  (self.centesimi, centesimi(tr["importo"]))]
+        valori += [(colonna, self.dizionari[campo].codice(tr.get(campo))) for campo, colonna in self.codici.items()]
+        aggiunte = []
+        try:
+            for colonna, valore in valori:
+                colonna.append(valore)
+                aggiunte.append(colonna)
+        except BufferError:
+            # qualcuno tiene ancora un buffer su una colonna: si annulla la riga a metà
+            for colonna in aggiunte:
+                colonna.pop()
+            raise
+        if data_testo is not None:
+            self._date_testo[posizione] = data_testo
+        extra = {k: v for k, v in tr.items() if k not in CAMPI}
+        if extra:
+            self._extra[posizione] = extra
+
+    def estendi(self, transazioni):
+        for tr in transazioni:
+            self.aggiungi(tr)
+
+    # --- lettura per riga ---
+
+    def __len__(self):
+        return len(self.centesimi)
+
+    def __getitem__(self, posizione):
+        if isinstance(posizione, slice):
+            return [RigaTransazione(self, i) for i in range(*posizione.indices(len(self)))]
+        if posizione < 0:
+            posizione += len(self)
+        if not 0 <= posizione < len(self):
+            raise IndexError("posizione fuori dalla tabella")
+        return RigaTransazione(self, posizione)
+
+    def __iter__(self):
+        return (RigaTransazione(self, i) for i in range(len(self)))
+
+    def valore(self, posizione, campo):
+        if campo == "importo":
+            return self.centesimi[posizione] / 100
+        if campo == "data":
+            testo = self._date_testo.get(posizione)
+            return testo if testo is not None else _decodifica_data(self.giorni[posizione], self.minuti[posizione])
+        if campo in self.codici:
+            return self.dizionari[campo].valori[self.codici[campo][posizione]]
+        return self._extra.get(posizione, {})[campo]
+
+    def riga(self, posizione):
+        """La transazione come dict normale (per salvarla o modificarla)."""
+        return dict(RigaTransazione(self, posizione))
+
+    def righe(self):
+        return [self.riga(i) for i in range(len(self))]
+
+    # --- scansioni vettoriali ---
+
+    def colonna(self, nome):
+        """Copia numpy di una colonna: "giorni", "minuti", "centesimi" o un campo codificato.
+
+        Una copia e non una vista: finché un buffer sull'array esiste l'array non può crescere,
+        e la tabella in cache cresce anche da altri thread mentre la GUI filtra.
+        """
+        import numpy as np
+        sorgente = getattr(self, nome) if nome in ("giorni", "minuti", "centesimi") else self.codici[nome]
+        tipi = {"i": np.int32, "h": np.int16, "q": np.int64, "I": np.uint32}
+        return np.array(sorgente, dtype=tipi[sorgente.typecode]) if len(sorgente) else np.zeros(0, tipi[sorgente.typecode])
+
+    def maschera(self, conto=None, categoria=None, data_da=None, data_a=None):
+        """Array booleano delle righe che rispettano i filtri (date "YYYY-MM-DD", estremi inclusi)."""
+        import numpy as np
+        m = np.ones(len(self), dtype=bool)
+        for campo, valore in (("conto", conto), ("categoria", categoria)):
+            if valore is not None:
+                codice = self.dizionari[campo].codici.get(valore)
+                if codice is None:
+                    return np.zeros(len(self), dtype=bool)
+                m &= self.colonna(campo) == codice
+        if data_da or data_a:
+            giorni = self.colonna("giorni")
+            if data_da:
+                m &= giorni >= date.fromisoformat(data_da[:10]).toordinal()
+            if data_a:
+                m &= giorni <= date.fromisoformat(data_a[:10]).toordinal()
+            for posizione, testo in self._date_testo.items():
+                m[posizione] = ((not data_da or testo >= data_da) and (not data_a or testo[:10] <= data_a)
+                                and self._rispetta_codici(posizione, conto, categoria))
+        return m
+
+    def _rispetta_codici(self, posizione, conto, categoria):
+        return ((conto is None or self.valore(posizione, "conto") == conto)
+                and (categoria is None or self.valore(posizione, "categoria") == categoria))
+
+    def posizioni(self, **filtri):
+        import numpy as np
+        return np.flatnonzero(self.maschera(**filtri))
+
+    def totale(self, **filtri):
+        """Somma degli importi delle righe filtrate, calcolata sui centesimi."""
+        return int(self.colonna("centesimi")[self.maschera(**filtri)].sum()) / 100
+
+    def seleziona(self, posizioni):
+        """Nuova tabella con le sole righe in `posizioni` (stessi dizionari)."""
+        import numpy as np
+        posizioni = np.asarray(posizioni, dtype=np.int64)
+        sotto = TabellaTransazioni(dizionari=self.dizionari)
+        sotto.giorni = array("i", self.colonna("giorni")[posizioni].tobytes())
+        sotto.minuti = array("h", self.colonna("minuti")[posizioni].tobytes())
+        sotto.centesimi = array("q", self.colonna("centesimi")[posizioni].tobytes())
+        for campo in self.codici:
+            sotto.codici[campo] = array("I", self.colonna(campo)[posizioni].tobytes())
+        for nuova, vecchia in enumerate(posizioni.tolist()):
+            if vecchia in self._date_testo:
+                sotto._date_testo[nuova] = self._date_testo[vecchia]
+            if vecchia in self._extra:
+                sotto._extra[nuova] = self._extra[vecchia]
+        return sotto
+
+    def per_conto(self, conto):
+        return self.seleziona(self.posizioni(conto=conto))
+
+    def chiavi_ordinamento(self, campo):
+        """Una chiave intera per riga che ordina come il campo (testi senza distinzione di maiuscole)."""
+        import numpy as np
+        if campo == "importo":
+            return self.colonna("centesimi").astype(np.int64)
+        if campo == "data":
+            chiavi = self.colonna("giorni").astype(np.int64) * 1441 + self.colonna("minuti") + 1
+            # le date in formati strani (giorno 0 nella colonna) vanno dopo ogni data valida in ordine crescente
+            if self._date_testo:
+                chiavi[list(self._date_testo)] = (date.max.toordinal() + 1) * 1441
+            return chiavi
+        valori = self.dizionari[campo].valori
+        ordine = sorted(range(len(valori)), key=lambda c: str(valori[c] or "").lower())
+        rango = np.empty(len(valori), dtype=np.int64)
+        rango[ordine] = np.arange(len(valori))
+        return rango[self.colonna(campo)]
+
+    def memoria(self):
+        """Byte occupati dalle colonne e dai valori distinti (stima)."""
+        import sys
+        colonne = sum(c.itemsize * len(c) for c in (self.giorni, self.minuti, self.centesimi, *self.codici.values()))
+        valori = sum(sys.getsizeof(v) for d in self.dizionari.values() for v in d.valori)
+        return colonne + valori
@@ -0,0 +1,84 @@
+#prove del ciclo di aggiornamento delle quotazioni, offline con FornitoreScriptato
+#uso:  python -m pytest test_aggiornamento_quotazioni.py   oppure   python test_aggiornamento_quotazioni.py
+
+from aggiornamento_quotazioni import AggiornatoreQuotazioni, CentraleQuotazioni, Iscrizione, SempreAperto
+from cambi import TassiCambio
+from quotazioni import FornitoreScriptato
+
+
+def prepara(sequenze, posizioni, valute=None, dimensione_lotto=None):
+    """Centrale con un solo iscritto (la tabella investimenti); ritorna (centrale, fornitore, giro)
+    dove giro() fa un giro completo e ritorna le Differenze per la tabella."""
+    fornitore = FornitoreScriptato(sequenze, valute=valute, dimensione_lotto=dimensione_lotto)
+    cambi = TassiCambio(percorso=None)  # solo in memoria, niente rete
+    cambi.memorizza({"USD": 0.5}, istante=None)
+    centrale = CentraleQuotazioni(fornitore.recupera_quotazioni, orari=SempreAperto(), cambi=cambi)
+    aggiornatore = AggiornatoreQuotazioni(lambda: posizioni, cambi=cambi)
+    risultati = []
+    centrale._iscrizioni.append(Iscrizione(aggiornatore.tickers,
+                                           lambda q, a, i: risultati.append(aggiornatore.ricevi(q, a, i))))
+
+    def giro():
+        centrale.giro_completo()
+        return risultati.pop()
+
+    return centrale, fornitore, giro
+
+
+def test_solo_righe_cambiate():
+    _, _, giro = prepara({"AAA": [100.0, 101.0, 101.0], "BBB": [20.0, 20.0, 20.0]}, {"AAA": 10, "BBB": 3})
+
+    primo = giro()
+    assert set(primo.righe) == {"AAA", "BBB"}
+    assert primo.totale is not None
+
+    secondo = giro()
+    assert set(secondo.righe) == {"AAA"}  # BBB non si è mosso: la sua riga non si tocca
+    assert secondo.righe["AAA"][2] == "1,010.00 €"
+    assert secondo.rimosse == []
+    assert secondo.totale is not None
+
+    assert giro().vuota()  # niente di cambiato, niente da ridisegnare
+
+
+def test_righe_rimosse():
+    posizioni = {"AAA": 10, "BBB": 3}
+    centrale, _, giro = prepara({"AAA": [100.0], "BBB": [20.0]}, posizioni)
+    giro()
+
+    posizioni.pop("BBB")  # venduto con la finestra aperta
+    differenze = giro()
+    assert differenze.rimosse == ["BBB"]
+    assert differenze.righe == {}
+    assert differenze.totale == "Valore Totale: €1,000.00"
+    assert "BBB" not in centrale._quotazioni  # nessuno lo segue più: esce dalla memoria
+
+
+def test_errore_del_fornitore_tiene_ultimo_prezzo():
+    centrale, _, giro = prepara({"AAA": [100.0], "CCC": [5.0, None, 6.0]}, {"AAA": 10, "CCC": 40},
+                                valute={"CCC": "USD"})
+    primo = giro()
+    assert primo.righe["CCC"][2] == "100.00 €"  # 40 x 5 USD x 0.5
+
+    secondo = giro()  # il fornitore non risponde per CCC
+    assert "CCC" not in secondo.righe and "CCC" not in secondo.rimosse
+    assert centrale._quotazioni["CCC"]["prezzo"] == 5.0
+
+    terzo = giro()
+    assert terzo.righe["CCC"][2] == "120.00 €"
+
+
+def test_richieste_a_lotti():
+    _, fornitore, giro = prepara({"AAA": [1.0], "BBB": [2.0], "CCC": [3.0]}, {"AAA": 1, "BBB": 1, "CCC": 1},
+                                 dimensione_lotto=2)
+    giro()
+    assert fornitore.richieste == 2  # tre ticker, lotti da due
+    giro()
+    assert fornitore.richieste == 4
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
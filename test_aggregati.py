@@ -0,0 +1,51 @@
+#prove dei totali per mese x conto x categoria contro il ledger
+#uso:  python -m pytest test_aggregati.py   oppure   python test_aggregati.py
+
+import os
+
+import aggregati
+from dati_di_prova import azzera_cache, cartella_dati
+from logica_transazioni import registra_transazione, transazione_atomica
+
+
+def test_registra_incrementale_e_ricostruisci():
+    with cartella_dati(conti={"Banca": 0, "Cassa": 0}):
+        registra_transazione(0.1, "Banca", "spesa", "a", "2025-01-03")
+        registra_transazione(0.2, "Banca", "spesa", "b", "2025-01-20")
+        with transazione_atomica() as batch:
+            batch.registra(-12.5, "Cassa", "spesa", "c", "2025-02-01")
+            batch.registra(1000, "Banca", "stipendio", "d", "2025-02-27")
+            batch.registra(-0.3, "Banca", "spesa", "e", "2024-12-31")  # retrodatata
+        assert aggregati.verifica() == []
+        assert aggregati.totali_per_categoria() == [
+            ("2024-12", "spesa", -0.3, 1),
+            ("2025-01", "spesa", 0.3, 2),
+            ("2025-02", "spesa", -12.5, 1),
+            ("2025-02", "stipendio", 1000.0, 1),
+        ]
+        incrementali = aggregati.carica_aggregati()
+
+        # da un processo nuovo: stesso file, e la ricostruzione dal ledger dà gli stessi totali
+        azzera_cache()
+        assert aggregati.carica_aggregati() == incrementali
+        assert aggregati.ricostruisci() == incrementali
+        registra_transazione(5, "Cassa", "resto", "f", "2025-02-02")
+        assert aggregati.verifica() == []
+        assert aggregati.totali_per_categoria("2025-02", "2025-02", conto="Cassa") == [
+            ("2025-02", "resto", 5.0, 1), ("2025-02", "spesa", -12.5, 1)]
+
+
+def test_file_mancante_si_ricostruisce():
+    with cartella_dati(conti={"Banca": 0}):
+        registra_transazione(10, "Banca", "spesa", "a", "2025-01-03")
+        os.remove(aggregati.FILE_AGGREGATI)
+        registra_transazione(5, "Banca", "spesa", "b", "2025-01-04")
+        assert aggregati.verifica() == []
+        assert aggregati.carica_aggregati()["transazioni"] == 2
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
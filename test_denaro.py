@@ -0,0 +1,63 @@
+#prove degli importi in centesimi: arrotondamenti, negativi, float e somme
+#uso:  python -m pytest test_denaro.py   oppure   python test_denaro.py
+
+import random
+from decimal import Decimal
+
+import denaro
+from denaro import centesimi, controvalore, differenza, normalizza, quota_centesimi, somma_centesimi, somma_saldo
+
+
+def test_tipi_di_input():
+    assert centesimi(12) == 1200 and centesimi(-3) == -300
+    assert centesimi(12.34) == 1234 and centesimi(-12.34) == -1234
+    assert centesimi("12,34") == 1234 and centesimi(" -0.5 ") == -50
+    assert centesimi(Decimal("7.01")) == 701
+
+
+def test_meta_strada_lontano_da_zero():
+    # 0.125, 0.375... sono esatti in binario: a metà strada, per ogni tipo di input, lontano da zero
+    # (round() di python andrebbe sul pari: 0.125 -> 12)
+    for testo, atteso in [("0.125", 13), ("0.375", 38), ("1.625", 163), ("0.875", 88)]:
+        for segno in (1, -1):
+            assert centesimi(segno * float(testo)) == segno * atteso, (segno, testo)
+            assert centesimi(Decimal(testo) * segno) == segno * atteso, (segno, testo)
+    assert centesimi("-0.125") == -13
+
+
+def test_float_non_esatti():
+    # 1.005 come float è 1.00499999...: conta il valore binario, non le cifre scritte
+    assert centesimi(1.005) == 100 and centesimi("1.005") == 101
+    assert centesimi(0.1 + 0.2) == 30
+    assert normalizza(0.1 + 0.2) == 0.3 and normalizza(-1.239) == -1.24
+
+
+def test_somma_saldo_senza_deriva():
+    saldo = 0.0
+    for _ in range(1000):
+        saldo = somma_saldo(saldo, 0.1)
+    assert saldo == 100.0
+    assert somma_saldo(10.0, -10.01) == -0.01
+    assert somma_saldo(0, 0.125) == 0.13 and somma_saldo(0, -0.125) == -0.13
+    assert differenza(0.3, 0.1) == 0.2
+
+
+def test_somma_numpy_uguale_a_python():
+    casuale = random.Random(3)
+    importi = [casuale.choice([1, -1]) * casuale.randint(0, 10 ** 6) / 8 / 100 for _ in range(denaro.SOGLIA_NUMPY)]
+    assert somma_centesimi(importi) == sum(centesimi(i) for i in importi)  # sopra soglia: numpy
+    assert somma_centesimi(importi[:10]) == sum(centesimi(i) for i in importi[:10])
+    assert somma_centesimi(iter(importi[:3])) == sum(centesimi(i) for i in importi[:3])
+
+
+def test_controvalori():
+    assert controvalore(3, 10.125) == 3038  # 30.375 -> 30.38
+    assert controvalore(0.1, 0.3) == 3
+    assert quota_centesimi(1000, 1, 3) == 333 and quota_centesimi(1000, 2, 3) == 667
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
@@ -0,0 +1,49 @@
+#prove della riduzione dei punti per i grafici (LTTB e min-max)
+#uso:  python -m pytest test_grafici.py   oppure   python test_grafici.py
+
+import numpy as np
+
+from utils.grafici import lttb, min_max, riduci
+
+
+def serie(n, seme=0):
+    casuale = np.random.default_rng(seme)
+    return np.arange(n, dtype=np.float64), np.cumsum(casuale.normal(size=n))
+
+
+def test_lttb():
+    for n, soglia in [(1000, 100), (1000, 3), (101, 100), (10_000, 977)]:
+        x, y = serie(n)
+        indici = lttb(x, y, soglia)
+        assert len(indici) == soglia
+        assert indici[0] == 0 and indici[-1] == n - 1
+        assert np.all(np.diff(indici) > 0)  # in ordine, senza ripetizioni
+
+
+def test_min_max():
+    for n, punti in [(1000, 100), (1000, 7), (5000, 640), (1001, 4)]:
+        x, y = serie(n, seme=1)
+        indici = riduci(x, y, punti, metodo="minmax")
+        assert len(indici) <= punti
+        assert indici[0] == 0 and indici[-1] == n - 1
+        assert np.all(np.diff(indici) > 0)
+        assert int(np.argmax(y)) in indici and int(np.argmin(y)) in indici  # i picchi restano
+    x, y = serie(1000)
+    assert len(riduci(x, y, 3, metodo="minmax")) == 3  # meno di due secchi più gli estremi: LTTB
+
+
+def test_serie_corte_invariate():
+    for n in (0, 1, 2, 5, 50):
+        x, y = serie(n)
+        for metodo in ("lttb", "minmax"):
+            assert riduci(x, y, 50, metodo=metodo).tolist() == list(range(n))
+    x, y = serie(10)
+    assert lttb(x, y, 2).tolist() == list(range(10))  # meno di tre punti: non si riduce
+    assert min_max(x, y, 0).tolist() == list(range(10))
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
@@ -0,0 +1,116 @@
+#prove dell'importazione di estratti conto CSV/OFX, in una cartella data/ temporanea
+#uso:  python -m pytest test_importa_estratti.py   oppure   python test_importa_estratti.py
+
+import os
+
+from dati_di_prova import cartella_dati
+from importa_estratti import importa_estratto, importa_transazioni, leggi_csv, leggi_ofx
+from storage import carica_conti, carica_transazioni
+
+CSV_ITALIANO = """Data;Descrizione;Importo
+02/01/2025;Stipendio  GENNAIO;1.234,56
+03/01/2025;Caffè;-1,20
+03/01/2025;Caffè;-1,20
+
+"""
+
+CSV_DARE_AVERE = """Booking Date,Description,Credit,Debit
+2025-01-05,Rimborso,"10.00",
+2025-01-06,Spesa,,"25.50"
+"""
+
+# OFX 1.x in stile SGML: tag non chiusi, uno per riga
+OFX_SGML = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20250107120000
+<TRNAMT>-42.10
+<NAME>Supermercato
+<MEMO>carta
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20250108
+<TRNAMT>100
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+# OFX 2.x in XML su una riga sola
+OFX_XML = ("<OFX><STMTTRN><DTPOSTED>20250109</DTPOSTED><TRNAMT>5.5</TRNAMT><NAME>Bonifico</NAME></STMTTRN>"
+           "<STMTTRN><DTPOSTED>20250110</DTPOSTED><NAME>senza importo</NAME></STMTTRN></OFX>")
+
+
+def scrivi(nome, testo):
+    with open(nome, "w", encoding="utf-8") as f:
+        f.write(testo)
+    return nome
+
+
+def test_csv_formato_italiano():
+    with cartella_dati():
+        righe = list(leggi_csv(scrivi("estratto.csv", CSV_ITALIANO), "Banca"))
+    assert [(r["data"], r["importo"]) for r in righe] == [("2025-01-02", 1234.56), ("2025-01-03", -1.2),
+                                                         ("2025-01-03", -1.2)]
+    assert righe[0]["descrizione"] == "Stipendio  GENNAIO"
+    assert all(r["conto"] == "Banca" and r["categoria"] == "importazione" for r in righe)
+
+
+def test_csv_colonne_dare_avere():
+    with cartella_dati():
+        righe = list(leggi_csv(scrivi("estratto.csv", CSV_DARE_AVERE), "Banca", categoria="varie"))
+    assert [(r["data"], r["importo"], r["categoria"]) for r in righe] == [("2025-01-05", 10.0, "varie"),
+                                                                         ("2025-01-06", -25.5, "varie")]
+
+
+def test_ofx_sgml_e_xml():
+    with cartella_dati():
+        sgml = list(leggi_ofx(scrivi("estratto.ofx", OFX_SGML), "Banca"))
+        xml = list(leggi_ofx(scrivi("estratto2.ofx", OFX_XML), "Banca"))
+    assert [(r["data"], r["importo"], r["descrizione"]) for r in sgml] == [
+        ("2025-01-07", -42.1, "Supermercato - carta"), ("2025-01-08", 100.0, "")]
+    assert [(r["data"], r["importo"]) for r in xml] == [("2025-01-09", 5.5)]  # senza TRNAMT si salta
+
+
+def test_duplicati_contati_come_multiinsieme():
+    with cartella_dati(conti={"Banca": 0}):
+        percorso = scrivi("estratto.csv", CSV_ITALIANO)
+        assert importa_estratto(percorso, "Banca") == {"importate": 3, "duplicate": 0}
+        # stesso estratto di nuovo: i due caffè identici sono già entrambi nel ledger
+        assert importa_estratto(percorso, "Banca") == {"importate": 0, "duplicate": 3}
+
+        # un terzo caffè uguale nello stesso giorno è nuovo; spazi e maiuscole non contano
+        nuove = [{"data": "2025-01-03", "conto": "Banca", "importo": -1.2, "categoria": "x", "descrizione": "caffè"}] * 3
+        nuove.append({"data": "2025-01-02 09:00", "conto": "Banca", "importo": 1234.56, "categoria": "x",
+                      "descrizione": "stipendio gennaio"})
+        assert importa_transazioni(nuove, "Banca") == {"importate": 1, "duplicate": 3}
+        assert len(carica_transazioni()) == 4
+        assert carica_conti()["Banca"] == 1230.96
+
+
+def test_importi_arrotondati_al_centesimo():
+    with cartella_dati(conti={"Banca": 0}):
+        nuove = [{"data": "2025-01-0%d" % g, "conto": "Banca", "importo": 0.1 + 0.2, "categoria": "x",
+                  "descrizione": f"riga {g}"} for g in range(1, 4)]
+        importa_transazioni(nuove, "Banca")
+        assert [tr["importo"] for tr in carica_transazioni()] == [0.3, 0.3, 0.3]
+        assert carica_conti()["Banca"] == 0.9
+
+
+def test_conto_inesistente():
+    with cartella_dati(conti={"Banca": 0}):
+        try:
+            importa_estratto(scrivi("estratto.csv", CSV_ITALIANO), "Altro")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("atteso ValueError")
+        assert not os.path.exists("data/transazioni.jsonl")
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
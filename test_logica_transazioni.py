@@ -0,0 +1,82 @@
+#prove di transazione_atomica: tutto o niente su conti, ledger, aggregati e saldi storici
+#uso:  python -m pytest test_logica_transazioni.py   oppure   python test_logica_transazioni.py
+
+import copy
+import os
+
+import aggregati
+import saldi_storici
+import storage
+from dati_di_prova import cartella_dati
+from logica_transazioni import registra_transazione, transazione_atomica
+
+
+class Interrotta(Exception):
+    pass
+
+
+def contenuto(percorso):
+    if not os.path.exists(percorso):
+        return None
+    with open(percorso, "rb") as f:
+        return f.read()
+
+
+def stato():
+    """Tutto ciò che una transazione può toccare, su disco e in memoria."""
+    indice = saldi_storici.indice_saldi()
+    return {
+        "file": {p: contenuto(p) for p in (storage.FILE_CONTI, storage.FILE_TRANSAZIONI, storage.FILE_JOURNAL,
+                                           aggregati.FILE_AGGREGATI, aggregati.FILE_AGGREGATI + ".versione")},
+        "conti": storage.carica_conti(),
+        "ledger": storage.carica_transazioni(),
+        "versione_ledger": storage.versione_ledger(),
+        "aggregati": copy.deepcopy(aggregati.carica_aggregati()),
+        "saldi": {c: (list(s.date), list(s.importi), list(s.checkpoint)) for c, s in indice.conti.items()},
+    }
+
+
+def test_eccezione_non_scrive_niente():
+    passo = saldi_storici.PASSO_CHECKPOINT
+    saldi_storici.PASSO_CHECKPOINT = 2  # più checkpoint con poche transazioni
+    try:
+        with cartella_dati(conti={"Banca": 0, "Cassa": 0}):
+            for giorno in range(1, 6):
+                registra_transazione(10, "Banca", "spesa", f"riga {giorno}", f"2025-01-0{giorno}")
+            prima = stato()
+            assert len(prima["saldi"]["Banca"][2]) == 3
+
+            try:
+                with transazione_atomica() as batch:
+                    batch.registra(-25, "Banca", "giroconto", "uscita", "2025-01-02")  # retrodatata
+                    batch.registra(25, "Cassa", "giroconto", "entrata", "2025-01-02")
+                    raise Interrotta()
+            except Interrotta:
+                pass
+            assert stato() == prima
+            assert saldi_storici.saldo_al("Banca", "2025-01-03") == 30.0
+    finally:
+        saldi_storici.PASSO_CHECKPOINT = passo
+
+
+def test_batch_completato_aggiorna_tutto():
+    with cartella_dati(conti={"Banca": 0, "Cassa": 0}):
+        registra_transazione(100, "Banca", "stipendio", "gennaio", "2025-01-01")
+        saldi_storici.indice_saldi()
+        with transazione_atomica() as batch:
+            batch.registra_giroconto(40, "Banca", "Cassa", "giroconto", "prelievo", "2025-01-05")
+        assert storage.carica_conti() == {"Banca": 60.0, "Cassa": 40.0}
+        assert len(storage.carica_transazioni()) == 3
+        assert aggregati.verifica() == []
+        assert saldi_storici.riconcilia() == []
+        assert saldi_storici.saldo_al("Cassa", "2025-01-04") == 0.0
+        assert saldi_storici.saldo_al("Cassa", "2025-01-05") == 40.0
+        with open(storage.FILE_JOURNAL) as f:
+            assert len(f.readlines()) == 2  # un batch, una riga
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
@@ -0,0 +1,65 @@
+#prove del motore delle posizioni contro le analisi per colonne di analisi_portafoglio
+#uso:  python -m pytest test_posizioni.py   oppure   python test_posizioni.py
+
+import math
+
+from analisi_portafoglio import operazioni_dataframe, riepilogo_per_ticker
+from posizioni import MotorePosizioni
+
+
+def op(tipo, data, quantita, prezzo):
+    return {"tipo": tipo, "data": data, "quantita": quantita, "prezzo_unitario": prezzo}
+
+
+def confronta(investimenti, motore):
+    riepilogo = riepilogo_per_ticker(operazioni_dataframe(investimenti), {})
+    for ticker in investimenti:
+        posizione = motore.posizione(ticker)
+        riga = riepilogo.loc[ticker]
+        assert math.isclose(posizione.quantita, riga["quantita"], abs_tol=1e-9), ticker
+        assert math.isclose(posizione.costo, riga["costo"], abs_tol=0.01), ticker
+        assert math.isclose(posizione.realizzato, riga["realizzato"], abs_tol=0.01), ticker
+
+
+def test_operazione_retrodatata():
+    investimenti = {
+        "AAA": [op("acquisto", "2025-01-10", 10, 100.0), op("vendita", "2025-03-01", 5, 130.0)],
+        "BBB": [op("acquisto", "2025-02-01", 3, 50.0)],
+    }
+    motore = MotorePosizioni(investimenti)
+    confronta(investimenti, motore)
+
+    # acquisto registrato dopo la vendita ma datato prima: cambia il costo medio della vendita
+    retrodatata = op("acquisto", "2025-02-15", 10, 160.0)
+    investimenti["AAA"].append(retrodatata)
+    motore.registra("AAA", retrodatata)
+    confronta(investimenti, motore)
+    assert math.isclose(motore.pmu("AAA"), 130.0)
+    assert motore.posizione("AAA").realizzato == 0.0  # venduto al costo medio
+
+    # lo stesso risultato ricostruendo da capo
+    confronta(investimenti, MotorePosizioni(investimenti))
+
+    # un'operazione più recente di tutte si applica senza rifare la posizione
+    posizione = motore.posizione("BBB")
+    nuova = op("vendita", "2025-04-01 10:00", 1, 60.0)
+    investimenti["BBB"].append(nuova)
+    motore.registra("BBB", nuova)
+    assert motore.posizione("BBB") is posizione
+    confronta(investimenti, motore)
+
+
+def test_stesso_giorno_in_ordine_di_registrazione():
+    investimenti = {"AAA": [op("acquisto", "2025-01-10", 4, 10.0), op("vendita", "2025-01-10", 4, 12.0),
+                            op("acquisto", "2025-01-10", 2, 20.0)]}
+    motore = MotorePosizioni(investimenti)
+    confronta(investimenti, motore)
+    assert motore.quantita("AAA") == 2 and math.isclose(motore.pmu("AAA"), 20.0)
+    assert math.isclose(motore.posizione("AAA").realizzato, 8.0)
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
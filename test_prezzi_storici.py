@@ -0,0 +1,78 @@
+#prove dell'archivio delle chiusure giornaliere, offline con FornitoreScriptato
+#uso:  python -m pytest test_prezzi_storici.py   oppure   python test_prezzi_storici.py
+
+import tempfile
+from datetime import date
+
+from prezzi_storici import ArchivioPrezzi, SerieTicker
+from quotazioni import FornitoreScriptato
+
+CHIUSURE = {"2025-01-02": 10.0, "2025-01-03": 11.0, "2025-01-06": 12.0}
+
+
+def giorno(testo):
+    return date.fromisoformat(testo).toordinal()
+
+
+def test_risposta_vuota_non_copre_intervallo():
+    # prima risposta vuota (errore di rete silenzioso), poi i dati
+    fornitore = FornitoreScriptato({}, storici={"AAA": [{}, CHIUSURE]})
+    with tempfile.TemporaryDirectory() as cartella:
+        archivio = ArchivioPrezzi(cartella)
+        assert archivio.completa("AAA", "2025-01-02", "2025-01-06", fornitore) == 1
+        assert archivio.serie("AAA").vuota()
+
+        assert archivio.completa("AAA", "2025-01-02", "2025-01-06", fornitore) == 1
+        serie = archivio.serie("AAA")
+        assert serie.chiusure.tolist() == [10.0, 11.0, 12.0]
+        assert archivio.completa("AAA", "2025-01-02", "2025-01-06", fornitore) == 0
+        assert len(fornitore.richieste_storico) == 2
+
+
+def test_copertura_fino_all_ultima_chiusura():
+    serie = SerieTicker().unisci([("2025-01-02", 10.0), ("2025-01-03", 11.0)],
+                                 giorno("2025-01-02"), giorno("2025-01-08"))
+    assert (serie.coperto_da, serie.coperto_a) == (giorno("2025-01-02"), giorno("2025-01-03"))
+    assert serie.mancanti(giorno("2025-01-02"), giorno("2025-01-08")) == [(giorno("2025-01-04"), giorno("2025-01-08"))]
+
+    # un intervallo prima della copertura la raggiunge anche se finisce con giorni senza chiusura
+    serie = serie.unisci([("2024-12-30", 9.0)], giorno("2024-12-28"), giorno("2025-01-01"))
+    assert serie.coperto_da == giorno("2024-12-28")
+    assert serie.mancanti(giorno("2024-12-28"), giorno("2025-01-03")) == []
+
+
+def test_risposta_vuota_lascia_la_serie_com_era():
+    serie = SerieTicker().unisci([], giorno("2025-01-02"), giorno("2025-01-06"))
+    assert serie.vuota()
+    assert serie.mancanti(giorno("2025-01-02"), giorno("2025-01-06")) == [(giorno("2025-01-02"), giorno("2025-01-06"))]
+
+
+def test_unisci_non_tocca_la_serie_in_memoria():
+    fornitore = FornitoreScriptato({}, storici={"AAA": [CHIUSURE]})
+    with tempfile.TemporaryDirectory() as cartella:
+        archivio = ArchivioPrezzi(cartella)
+        archivio.completa("AAA", "2025-01-02", "2025-01-03", fornitore)
+        letta = archivio.serie("AAA")
+        giorni = letta.giorni.copy()
+
+        archivio.completa("AAA", "2025-01-02", "2025-01-06", fornitore)
+        assert (letta.giorni == giorni).all() and len(letta.chiusure) == len(giorni)
+        nuova = archivio.serie("AAA")
+        assert nuova is not letta and nuova.chiusure.tolist() == [10.0, 11.0, 12.0]
+
+
+def test_completa_tutti_con_pool_del_fornitore_chiuso():
+    fornitore = FornitoreScriptato({}, storici={"AAA": [CHIUSURE], "BBB": [CHIUSURE]})
+    fornitore._esecutore().shutdown()  # come dopo _abbandona_pool
+    with tempfile.TemporaryDirectory() as cartella:
+        archivio = ArchivioPrezzi(cartella)
+        intervalli = {"AAA": ("2025-01-02", "2025-01-06"), "BBB": ("2025-01-02", "2025-01-03")}
+        assert archivio.completa_tutti(intervalli, fornitore) == 2
+        assert archivio.serie("BBB").chiusure.tolist() == [10.0, 11.0]
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
@@ -0,0 +1,142 @@
+#prove dei fornitori di quotazioni e della cache, offline con FornitoreFinto/FornitoreScriptato
+#uso:  python -m pytest test_quotazioni.py   oppure   python test_quotazioni.py
+
+import os
+import tempfile
+import time
+
+from quotazioni import CacheQuotazioni, FornitoreFinto, FornitoreScriptato, FornitoreYFinance
+
+
+class FornitoreLento(FornitoreFinto):
+    """FornitoreFinto con un ritardo diverso per ticker (secondi)."""
+
+    def __init__(self, prezzi, ritardi, **kwargs):
+        super().__init__(prezzi, **kwargs)
+        self.ritardi = ritardi
+
+    def quotazione(self, ticker):
+        time.sleep(self.ritardi.get(ticker, 0))
+        return super().quotazione(ticker)
+
+
+class AnagraficheLente(FornitoreYFinance):
+    """FornitoreYFinance senza rete: .info lenta (ritardo per ticker), prezzi a 1 per chi ha l'anagrafica."""
+
+    def __init__(self, ritardi, **kwargs):
+        super().__init__(**kwargs)
+        self.ritardi = ritardi
+
+    def _anagrafica(self, ticker):
+        if ticker not in self._anagrafiche:
+            time.sleep(self.ritardi.get(ticker, 0.05))
+            self._anagrafiche[ticker] = (ticker, "USD")
+        return self._anagrafiche[ticker]
+
+    def quotazioni_lotto(self, tickers):
+        return {t: {"nome": self._anagrafiche[t][0], "prezzo": 1.0, "precedente": 1.0,
+                    "valuta": self._anagrafiche[t][1]} for t in tickers if t in self._anagrafiche}
+
+
+def test_duplicati_e_ticker_sconosciuti():
+    fornitore = FornitoreFinto({"AAA": 10.0, "BBB": {"nome": "Bi", "prezzo": 2.0, "precedente": 1.5, "valuta": "USD"}})
+    risultati = fornitore.recupera_quotazioni(["aaa", "AAA", "BBB", "ZZZ"])
+    assert list(risultati) == ["AAA", "BBB", "ZZZ"]
+    assert risultati["AAA"]["prezzo"] == 10.0 and risultati["BBB"]["valuta"] == "USD"
+    assert risultati["ZZZ"] is None
+    assert fornitore.richieste == 3
+
+
+def test_timeout_per_richiesta():
+    fornitore = FornitoreLento({"AAA": 1.0, "BBB": 2.0, "CCC": 3.0}, {"BBB": 2.0}, max_thread=2, timeout=0.3)
+    inizio = time.monotonic()
+    risultati = fornitore.recupera_quotazioni(["AAA", "BBB", "CCC"])
+    assert time.monotonic() - inizio < 1.5  # BBB non si aspetta fino in fondo
+    assert risultati["AAA"]["prezzo"] == 1.0 and risultati["CCC"]["prezzo"] == 3.0
+    assert risultati["BBB"] is None
+
+    # il pool con il thread appeso è stato abbandonato: il giro dopo parte su uno nuovo
+    fornitore.ritardi = {}
+    assert fornitore.recupera_quotazioni(["BBB"])["BBB"]["prezzo"] == 2.0
+
+
+def test_ondate_oltre_i_thread():
+    # sei richieste da 0.1 s su due thread: tre ondate, ognuna dentro il suo timeout
+    prezzi = {f"T{i}": float(i) for i in range(6)}
+    fornitore = FornitoreLento(prezzi, {t: 0.1 for t in prezzi}, max_thread=2, timeout=0.25)
+    risultati = fornitore.recupera_quotazioni(list(prezzi))
+    assert all(risultati[t]["prezzo"] == p for t, p in prezzi.items())
+
+
+def test_lotti():
+    fornitore = FornitoreScriptato({t: [1.0] for t in "ABCDE"}, dimensione_lotto=2)
+    risultati = fornitore.recupera_quotazioni(list("ABCDE"))
+    assert all(risultati[t]["prezzo"] == 1.0 for t in "ABCDE")
+    assert fornitore.richieste == 3
+
+
+def test_anagrafiche_fuori_dal_lotto():
+    # venti .info da 0.05 s in fila (1 s) supererebbero il timeout del lotto: ognuna ha il suo
+    tickers = [f"T{i}" for i in range(20)]
+    fornitore = AnagraficheLente({"LENTO": 2.0}, max_thread=8, timeout=0.5)
+    inizio = time.monotonic()
+    risultati = fornitore.recupera_quotazioni(tickers + ["LENTO"])
+    assert time.monotonic() - inizio < 1.5
+    assert all(risultati[t]["valuta"] == "USD" for t in tickers)
+    assert risultati["LENTO"] is None  # senza nome e valuta niente prezzo, niente lotto bloccato
+    assert fornitore.richieste == 21 + 2  # una .info per ticker, due lotti di prezzi
+
+    fornitore.recupera_quotazioni(tickers)
+    assert fornitore.richieste == 23 + 1  # anagrafiche già note: solo il lotto
+
+
+def test_cache_ttl_e_fallimenti():
+    fornitore = FornitoreScriptato({"AAA": [1.0, 2.0], "BBB": [None, 5.0]})
+    cache = CacheQuotazioni(fornitore, ttl=60, percorso=None)
+    primo = cache.recupera_quotazioni(["AAA", "BBB"])
+    assert primo["AAA"]["prezzo"] == 1.0 and primo["BBB"] is None
+    assert fornitore.richieste == 2
+
+    secondo = cache.recupera_quotazioni(["AAA", "BBB"])
+    assert secondo["AAA"]["prezzo"] == 1.0  # ancora valida: dalla cache
+    assert secondo["BBB"]["prezzo"] == 5.0  # il fallimento non era stato memorizzato
+    assert fornitore.richieste == 3
+
+    assert cache.ricarica(["AAA"])["AAA"]["prezzo"] == 2.0  # ricarica ignora il ttl
+    assert cache.ultima_quotazione("aaa")["prezzo"] == 2.0
+
+
+def test_cache_scadute_in_background():
+    fornitore = FornitoreScriptato({"AAA": [1.0, 2.0]})
+    cache = CacheQuotazioni(fornitore, ttl=0, percorso=None)
+    cache.recupera_quotazioni(["AAA"])
+    time.sleep(0.01)
+    assert cache.recupera_quotazioni(["AAA"], accetta_scadute=True)["AAA"]["prezzo"] == 1.0
+    for _ in range(100):
+        if cache.ultima_quotazione("AAA")["prezzo"] == 2.0:
+            break
+        time.sleep(0.01)
+    assert cache.ultima_quotazione("AAA")["prezzo"] == 2.0
+    assert fornitore.richieste == 2
+
+
+def test_cache_limite_e_file():
+    with tempfile.TemporaryDirectory() as cartella:
+        percorso = os.path.join(cartella, "cache.json")
+        cache = CacheQuotazioni(FornitoreFinto({"AAA": 1.0, "BBB": 2.0, "CCC": 3.0}), max_voci=2, percorso=percorso)
+        cache.recupera_quotazioni(["AAA", "BBB"])
+        cache.recupera_quotazioni(["AAA"])  # AAA usato di recente: esce BBB
+        cache.recupera_quotazioni(["CCC"])
+        assert cache.ultima_quotazione("BBB") is None
+
+        riaperta = CacheQuotazioni(FornitoreFinto({}), percorso=percorso)
+        assert riaperta.ultima_quotazione("AAA")["prezzo"] == 1.0
+        assert riaperta.recupera_quotazioni(["CCC"])["CCC"]["prezzo"] == 3.0  # dal file, senza rete
+        assert riaperta.fornitore.richieste == 0
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
@@ -0,0 +1,62 @@
+#prove degli indici di ricerca sulle transazioni
+#uso:  python -m pytest test_ricerca_transazioni.py   oppure   python test_ricerca_transazioni.py
+
+import storage
+from dati_di_prova import cartella_dati
+from logica_transazioni import registra_transazione
+from ricerca_transazioni import IndiceTransazioni, tokenizza
+
+TRANSAZIONI = [
+    {"data": "2025-01-02", "conto": "Banca", "importo": -3.5, "categoria": "bar", "descrizione": "Caffè e brioche"},
+    {"data": "2025-01-05 12:00", "conto": "Cassa", "importo": -40.0, "categoria": "spesa", "descrizione": "SUPERMERCATO Città"},
+    {"data": "2025-02-01", "conto": "Banca", "importo": 1500.0, "categoria": "stipendio", "descrizione": "Stipendio gennaio"},
+    {"data": "2025-02-03", "conto": "Banca", "importo": -2.0, "categoria": "bar", "descrizione": "caffe"},
+]
+
+
+def test_maiuscole_e_accenti():
+    assert tokenizza("Caffè, CITTÀ e Straße!") == ["caffe", "citta", "e", "strasse"]
+    indice = IndiceTransazioni(TRANSAZIONI)
+    assert indice.filtra(testo="caffe") == [0, 3]
+    assert indice.filtra(testo="CAFFÈ") == [0, 3]
+    assert indice.filtra(testo="citta super") == [1]
+    assert indice.filtra(testo="caf bri") == [0]  # prefissi, tutte le parole
+    assert indice.filtra(testo="tè") == []
+
+
+def test_filtri_combinati():
+    indice = IndiceTransazioni(TRANSAZIONI)
+    assert indice.filtra() == [0, 1, 2, 3]
+    assert indice.filtra(data_da="2025-01-05", data_a="2025-01-05") == [1]  # anche con l'orario
+    assert indice.filtra(conto="Banca", importo_max=0) == [0, 3]
+    assert indice.filtra(categoria="bar", importo_min=-3) == [3]
+    assert indice.filtra(conto="Nessuno", testo="caffe") == []
+    assert indice.conti() == ["Banca", "Cassa"]
+
+
+def test_aggiornamento_dopo_registra():
+    with cartella_dati(conti={"Banca": 0, "Cassa": 0}):
+        storage.accoda_transazioni(TRANSAZIONI)
+        indice = IndiceTransazioni(storage.carica_transazioni())
+
+        registra_transazione(-4.2, "Cassa", "bar", "Caffè al banco", "2025-01-03")
+        registra_transazione(12, "Posta", "rimborso", "Rimborso città", "2025-02-02")
+        for tr in storage.carica_transazioni()[len(indice.transazioni):]:
+            indice.aggiungi(tr)
+
+        ricostruito = IndiceTransazioni(storage.carica_transazioni())
+        filtri = [{"testo": "caffe"}, {"testo": "citta"}, {"conto": "Posta"}, {"categoria": "bar"},
+                  {"data_da": "2025-01-03", "data_a": "2025-02-02"}, {"importo_min": -5, "importo_max": 12},
+                  {"conto": "Cassa", "testo": "caff"}]
+        for filtro in filtri:
+            assert indice.filtra(**filtro) == ricostruito.filtra(**filtro), filtro
+        assert indice.filtra(testo="caffe") == [0, 3, 4]
+        assert indice.conti() == ["Banca", "Cassa", "Posta"]
+        assert indice.categorie() == ricostruito.categorie()
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
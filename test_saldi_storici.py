@@ -0,0 +1,99 @@
+#prove dei saldi storici: checkpoint, indice incrementale e riconciliazione con conti.json
+#uso:  python -m pytest test_saldi_storici.py   oppure   python test_saldi_storici.py
+
+import random
+
+import saldi_storici
+import storage
+from dati_di_prova import azzera_cache, cartella_dati
+from gestione_conti import modifica_saldo, registra_correzione
+from logica_transazioni import registra_transazione, transazione_atomica
+from saldi_storici import IndiceSaldi, SaldiConto
+
+
+def saldo_atteso(movimenti, data):
+    return sum(c for d, c in movimenti if d[:10] <= data)
+
+
+def test_checkpoint_con_movimenti_retrodatati():
+    passo = saldi_storici.PASSO_CHECKPOINT
+    saldi_storici.PASSO_CHECKPOINT = 4
+    try:
+        casuale = random.Random(7)
+        giorni = [f"2025-{m:02d}-{g:02d}" for m in range(1, 4) for g in (1, 10, 20)]
+        movimenti = [(casuale.choice(giorni), casuale.randint(-5000, 5000)) for _ in range(30)]
+        saldi = SaldiConto()
+        saldi.carica(movimenti[:10])
+        for data, importo in movimenti[10:]:  # molti arrivano prima dell'ultimo giorno già visto
+            saldi.aggiungi(data, importo)
+
+        assert saldi.date == sorted(saldi.date)
+        assert len(saldi.checkpoint) == 30 // 4 + 1
+        assert saldi.checkpoint == [sum(saldi.importi[:k * 4]) for k in range(len(saldi.checkpoint))]
+        for data in ["2024-12-31"] + giorni + ["2025-12-31"]:
+            assert saldi.saldo_al(data) == saldo_atteso(movimenti, data), data
+        assert saldi.totale() == sum(c for _, c in movimenti)
+    finally:
+        saldi_storici.PASSO_CHECKPOINT = passo
+
+
+def test_saldo_a_fine_giornata():
+    indice = IndiceSaldi([{"data": "2025-01-05 18:30", "conto": "Banca", "importo": 10.1},
+                          {"data": "2025-01-05", "conto": "Banca", "importo": -0.1}])
+    assert indice.saldo_al("Banca", "2025-01-04") == 0.0
+    assert indice.saldo_al("Banca", "2025-01-05") == 10.0  # anche la riga con l'orario
+    assert indice.saldo_al("Altro", "2025-01-05") == 0.0
+
+
+def test_indice_incrementale_uguale_alla_ricostruzione():
+    with cartella_dati(conti={"Banca": 0, "Cassa": 0}):
+        registra_transazione(100, "Banca", "stipendio", "a", "2025-01-10")
+        indice = saldi_storici.indice_saldi()
+        with transazione_atomica() as batch:
+            batch.registra(-30, "Banca", "spesa", "b", "2025-01-05")  # retrodatata
+            batch.registra(30, "Cassa", "spesa", "c", "2025-01-05")
+        assert saldi_storici.indice_saldi() is indice  # aggiornato, non ricostruito
+
+        ricostruito = IndiceSaldi(storage.carica_transazioni())
+        for conto in ("Banca", "Cassa"):
+            for data in ("2025-01-04", "2025-01-05", "2025-01-10"):
+                assert indice.saldo_al(conto, data) == ricostruito.saldo_al(conto, data)
+        assert saldi_storici.saldo_al("Banca", "2025-01-05") == -30.0
+
+        # un accodamento che l'indice non ha visto (altro processo) lo fa ricostruire
+        storage.accoda_transazioni([{"data": "2025-01-11", "conto": "Cassa", "importo": 1.0,
+                                     "categoria": "x", "descrizione": "d"}])
+        assert saldi_storici.indice_saldi() is not indice
+        assert saldi_storici.saldo_al("Cassa", "2025-01-11") == 31.0
+
+
+def test_riconcilia():
+    with cartella_dati(conti={"Banca": 0}):
+        registra_transazione(50, "Banca", "x", "a", "2025-01-01")
+        registra_transazione(-20.25, "Banca", "x", "b", "2025-01-02")
+        assert saldi_storici.riconcilia() == []
+
+        storage.aggiorna_conti(lambda conti: {**conti, "Banca": 40, "Vecchio": 5})
+        atteso = [("Banca", 40.0, 29.75, 10.25), ("Vecchio", 5.0, 0.0, 5.0)]
+        assert saldi_storici.riconcilia() == atteso
+        # stesso risultato scorrendo un generatore sulle transazioni, e da un processo nuovo
+        assert saldi_storici.riconcilia(transazioni=iter(storage.carica_transazioni())) == atteso
+        azzera_cache()
+        assert saldi_storici.riconcilia() == atteso
+
+
+def test_correzione_manuale_solo_giorno():
+    with cartella_dati(conti={"Banca": 0}):
+        registra_transazione(10, "Banca", "x", "a", "2025-01-01")
+        modifica_saldo("Banca", 12.5, registra_correzione)
+        correzione = storage.carica_transazioni()[-1]
+        assert len(correzione["data"]) == 10 and correzione["importo"] == 2.5
+        assert saldi_storici.saldo_al("Banca", correzione["data"]) == 12.5
+        assert saldi_storici.riconcilia() == []
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
@@ -0,0 +1,104 @@
+#prove del ledger in modalità journal: righe troncate, file .len e crash durante la compattazione
+#uso:  python -m pytest test_storage.py   oppure   python test_storage.py
+
+import json
+import os
+
+import storage
+from dati_di_prova import azzera_cache, cartella_dati
+
+
+def tr(n, conto="Banca"):
+    return {"data": f"2025-01-{n:02d}", "conto": conto, "importo": float(n), "categoria": "x", "descrizione": f"t{n}"}
+
+
+def importi():
+    # come li vede un processo appena avviato
+    azzera_cache()
+    return [t["importo"] for t in storage.carica_transazioni()]
+
+
+def test_riga_troncata_in_fondo_al_journal():
+    with cartella_dati():
+        storage.accoda_transazioni([tr(1)])
+        storage.accoda_transazioni([tr(2), tr(3)])  # un batch: una riga sola
+        with open(storage.FILE_JOURNAL, "r+") as f:
+            f.truncate(os.path.getsize(storage.FILE_JOURNAL) - 10)  # crash a metà del batch
+        assert importi() == [1.0]  # il batch troncato si perde tutto, non a metà
+
+        storage.accoda_transazioni([tr(4)])  # riparte da una riga nuova
+        assert importi() == [1.0, 4.0]
+
+
+def test_compattazione_e_journal_dopo():
+    with cartella_dati():
+        storage.accoda_transazioni([tr(1), tr(2)])
+        storage.compatta_journal()
+        assert not os.path.exists(storage.FILE_JOURNAL)
+        storage.accoda_transazioni([tr(3)])
+        assert importi() == [1.0, 2.0, 3.0]
+        with open(storage.FILE_TRANSAZIONI) as f:
+            assert [t["importo"] for t in json.load(f)] == [1.0, 2.0]
+
+
+def prepara_crash(snapshot, journal, len_file=None, fuso=False):
+    """Stato dei file lasciato da un processo morto durante _compatta_file."""
+    storage._scrivi_atomico(storage.FILE_TRANSAZIONI, snapshot + (journal if fuso else []))
+    with open(storage._file_compattazione(), "w") as f:
+        f.write(json.dumps(journal) + "\n")
+    if len_file is not None:
+        with open(storage._file_compattazione() + ".len", "w") as f:
+            f.write(len_file)
+
+
+def test_crash_dopo_il_rename_del_journal():
+    with cartella_dati():
+        prepara_crash([tr(1)], [tr(2), tr(3)])
+        assert importi() == [1.0, 2.0, 3.0]
+        assert not os.path.exists(storage._file_compattazione())
+        assert importi() == [1.0, 2.0, 3.0]  # fusa una volta sola
+
+
+def test_crash_dopo_il_file_len():
+    with cartella_dati():
+        prepara_crash([tr(1)], [tr(2)], len_file="1")  # .len scritto, snapshot non ancora riscritto
+        assert importi() == [1.0, 2.0]
+
+
+def test_crash_dopo_la_fusione():
+    with cartella_dati():
+        prepara_crash([tr(1)], [tr(2)], len_file="1", fuso=True)  # mancava solo la pulizia
+        assert importi() == [1.0, 2.0]
+        assert not os.path.exists(storage._file_compattazione() + ".len")
+
+
+def test_file_len_troncato():
+    with cartella_dati():
+        prepara_crash([tr(1)], [tr(2)], len_file="")
+        assert importi() == [1.0, 2.0]
+    with cartella_dati():
+        prepara_crash([tr(1)], [tr(2)], len_file="", fuso=True)
+        assert importi() == [1.0, 2.0]
+
+
+def test_file_len_senza_compattazione():
+    with cartella_dati():
+        storage.accoda_transazioni([tr(1)])
+        with open(storage._file_compattazione() + ".len", "w") as f:
+            f.write("7")  # avanzo di una pulizia interrotta
+        assert importi() == [1.0]
+        assert not os.path.exists(storage._file_compattazione() + ".len")
+
+
+def test_accodamento_dopo_crash_in_compattazione():
+    with cartella_dati():
+        prepara_crash([tr(1)], [tr(2)])
+        storage.accoda_transazioni([tr(3)])  # fonde prima di accodare
+        assert importi() == [1.0, 2.0, 3.0]
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
@@ -0,0 +1,80 @@
+#prove del ledger colonnare: righe, ordinamento, filtri e tabella per conto
+#uso:  python -m pytest test_tabella_transazioni.py   oppure   python test_tabella_transazioni.py
+
+import numpy as np
+
+import storage
+from dati_di_prova import cartella_dati
+from tabella_transazioni import TabellaTransazioni
+
+TRANSAZIONI = [
+    {"data": "2025-01-10", "conto": "Banca", "importo": -12.5, "categoria": "spesa", "descrizione": "Pane"},
+    {"data": "31/12/2024", "conto": "Banca", "importo": 3.0, "categoria": "varie", "descrizione": "vecchia"},
+    {"data": "2025-01-10 08:30", "conto": "Cassa", "importo": 100.0, "categoria": "Stipendio", "descrizione": "acconto"},
+    {"data": "2025-01-02", "conto": "Cassa", "importo": -0.1, "categoria": "spesa", "descrizione": "caffè",
+     "nota": "campo in più"},
+    {"data": "2025-01-10 07:00", "conto": "Banca", "importo": 20.0, "categoria": "altro", "descrizione": "Bonifico"},
+]
+
+
+def ordina(tabella, campo):
+    ordine = np.argsort(tabella.chiavi_ordinamento(campo), kind="stable")
+    return [tabella.valore(int(i), "descrizione") for i in ordine]
+
+
+def test_righe_come_dict():
+    tabella = TabellaTransazioni(TRANSAZIONI)
+    assert len(tabella) == 5
+    assert [dict(r) for r in tabella] == TRANSAZIONI
+    assert tabella[-1]["data"] == "2025-01-10 07:00"
+    assert tabella.riga(3)["nota"] == "campo in più"
+    assert tabella[1]["data"] == "31/12/2024"  # formato strano restituito com'era
+
+
+def test_ordinamento():
+    tabella = TabellaTransazioni(TRANSAZIONI)
+    # senza orario prima delle 00:00 dello stesso giorno, le date strane in fondo
+    assert ordina(tabella, "data") == ["caffè", "Pane", "Bonifico", "acconto", "vecchia"]
+    assert ordina(tabella, "importo") == ["Pane", "caffè", "vecchia", "Bonifico", "acconto"]
+    assert ordina(tabella, "categoria") == ["Bonifico", "Pane", "caffè", "acconto", "vecchia"]
+    assert ordina(tabella, "descrizione") == ["acconto", "Bonifico", "caffè", "Pane", "vecchia"]
+
+
+def test_filtri():
+    tabella = TabellaTransazioni(TRANSAZIONI)
+    assert tabella.posizioni(conto="Banca").tolist() == [0, 1, 4]
+    assert tabella.posizioni(conto="Banca", categoria="spesa").tolist() == [0]
+    assert tabella.posizioni(conto="Nessuno").tolist() == []
+    assert tabella.posizioni(data_da="2025-01-01", data_a="2025-01-09").tolist() == [3]
+    # le date in formati strani si confrontano come testo, come fa storage.transazioni_intervallo
+    assert tabella.posizioni(data_da="2025-01-10").tolist() == [0, 1, 2, 4]
+    assert tabella.posizioni(data_a="2025-01-10").tolist() == [0, 2, 3, 4]
+    assert tabella.totale(conto="Cassa") == 99.9
+    assert tabella.totale() == 110.4
+
+
+def test_seleziona_e_per_conto():
+    tabella = TabellaTransazioni(TRANSAZIONI)
+    cassa = tabella.per_conto("Cassa")
+    assert [dict(r) for r in cassa] == [TRANSAZIONI[2], TRANSAZIONI[3]]
+    assert cassa.dizionari is tabella.dizionari
+    banca = tabella.per_conto("Banca")
+    assert banca[1]["data"] == "31/12/2024" and ordina(banca, "data")[-1] == "vecchia"
+
+
+def test_tabella_per_conto_dal_ledger():
+    with cartella_dati():
+        storage.accoda_transazioni(TRANSAZIONI[:3])
+        assert [r["descrizione"] for r in storage.tabella_per_conto("Banca")] == ["Pane", "vecchia"]
+        tabella = storage.carica_tabella_transazioni()
+        storage.accoda_transazioni(TRANSAZIONI[3:])
+        assert storage.carica_tabella_transazioni() is tabella  # estesa, non ricostruita
+        assert [r["descrizione"] for r in storage.tabella_per_conto("Banca")] == ["Pane", "vecchia", "Bonifico"]
+        assert storage.tabella_per_conto("Cassa").totale() == 99.9
+
+
+if __name__ == "__main__":
+    for nome, prova in list(globals().items()):
+        if nome.startswith("test_"):
+            prova()
+            print(f"{nome}: ok")
@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Esegue lavoro lento (file, rete, immagini) su un pool di thread e riporta il risultato a Tk.
+# Il thread di lavoro non tocca mai i widget: il thread di Tk controlla con after() se il
+# risultato è pronto e chiama le callback. Se la finestra viene chiusa, l'attività si annulla.
+
+INTERVALLO_CONTROLLO = 30  # ms tra un controllo e l'altro
+TESTO_CARICAMENTO = "⏳ Caricamento..."
+
+
+class Attivita:
+    def __init__(self, future, widget):
+        self.future = future
+        self.widget = widget
+        self.annullata = False
+
+    def annulla(self):
+        # il lavoro già partito finisce comunque, ma le callback non vengono più chiamate
+        self.annullata = True
+        self.future.cancel()
+
+
+class EsecutoreAttivita:
+    def __init__(self, max_thread=4):
+        self.max_thread = max_thread
+        self._pool = None
+        self._lock = threading.Lock()
+        self._per_widget = {}  # percorso Tk del widget -> attività ancora aperte
+
+    def _esecutore(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_thread, thread_name_prefix="attivita")
+            return self._pool
+
+    def esegui(self, widget, funzione, *args, al_termine=None, in_errore=None, indicatore=None):
+        """Esegue funzione(*args) in background; al_termine(risultato) gira poi sul thread di Tk.
+
+        widget è la finestra (o un widget) a cui l'attività appartiene: quando viene distrutto
+        l'attività si annulla. indicatore, se dato, è una Label che mostra il caricamento.
+        """
+        attivita = Attivita(self._esecutore().submit(funzione, *args), widget)
+
+        testo_precedente = None
+        if indicatore is not None:
+            testo_precedente = indicatore.cget("text")
+            indicatore.config(text=TESTO_CARICAMENTO)
+
+        self._registra(widget, attivita)
+
+        def controlla():
+            if attivita.annullata:
+                return
+            if not attivita.future.done():
+                widget.after(INTERVALLO_CONTROLLO, controlla)
+                return
+            self._per_widget.get(str(widget), set()).discard(attivita)
+            if indicatore is not None and indicatore.cget("text") == TESTO_CARICAMENTO:
+                indicatore.config(text=testo_precedente)
+            errore = attivita.future.exception()
+            if errore is not None:
+                if in_errore is not None:
+                    in_errore(errore)
+                else:
+                    print(f"Errore in un'attività in background: {errore}")
+            elif al_termine is not None:
+                al_termine(attivita.future.result())
+
+        widget.after(INTERVALLO_CONTROLLO, controlla)
+        return attivita
+
+    def _registra(self, widget, attivita):
+        chiave = str(widget)
+        if chiave not in self._per_widget:
+            self._per_widget[chiave] = set()
+
+            def annulla_alla_chiusura(event):
+                # <Destroy> arriva anche per i figli della finestra: conta solo la finestra stessa
+                if event.widget is widget:
+                    self.annulla_tutte(widget)
+
+            # add="+": non sostituisce altri binding su <Destroy>
+            widget.bind("<Destroy>", annulla_alla_chiusura, add="+")
+        self._per_widget[chiave].add(attivita)
+
+    def annulla_tutte(self, widget):
+        for attivita in self._per_widget.pop(str(widget), set()):
+            attivita.annulla()
+
+
+esecutore = EsecutoreAttivita()
+
+def esegui(widget, funzione, *args, **kwargs):
+    return esecutore.esegui(widget, funzione, *args, **kwargs)
@@ -0,0 +1,163 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# Grafici a linea per serie lunghe (anni di valori giornalieri).
+# Una sola Figure per finestra, creata senza pyplot: niente figure globali che restano in memoria.
+# I punti si riducono alla larghezza in pixel (LTTB o min-max) e il disegno finito resta in una
+# piccola cache per (versione della serie, dimensione): riaprire o ridimensionare costa poco.
+
+PUNTI_PER_PIXEL = 1
+MAX_CACHE = 4
+ATTESA_RESIZE = 150  # ms
+
+
+def lttb(x, y, soglia):
+    """Largest-Triangle-Three-Buckets: `soglia` indici che conservano la forma della serie."""
+    n = len(x)
+    if soglia >= n or soglia < 3:
+        return np.arange(n)
+    passo = (n - 2) / (soglia - 2)
+    # secchio i = [bordi[i], bordi[i + 1]); il primo e l'ultimo punto stanno da soli
+    bordi = np.append((np.floor(np.arange(soglia - 1) * passo) + 1).astype(np.int64), n)
+    # media del secchio successivo a ciascuno, con somme cumulate
+    cx, cy = np.concatenate([[0], np.cumsum(x)]), np.concatenate([[0], np.cumsum(y)])
+    inizio_succ, fine_succ = bordi[1:-1], bordi[2:]
+    conteggio = fine_succ - inizio_succ
+    media_x = (cx[fine_succ] - cx[inizio_succ]) / conteggio
+    media_y = (cy[fine_succ] - cy[inizio_succ]) / conteggio
+
+    indici = np.empty(soglia, dtype=np.int64)
+    indici[0], indici[-1] = 0, n - 1
+    a = 0
+    for i in range(soglia - 2):
+        inizio, fine = bordi[i], bordi[i + 1]
+        area = np.abs((x[a] - media_x[i]) * (y[inizio:fine] - y[a]) - (x[a] - x[inizio:fine]) * (media_y[i] - y[a]))
+        a = inizio + int(np.argmax(area))
+        indici[i + 1] = a
+    return indici
+
+def min_max(x, y, secchi):
+    """Per ogni secchio il punto più basso e quello più alto, in ordine: i picchi non spariscono mai."""
+    n = len(x)
+    if 2 * secchi >= n or secchi < 1:
+        return np.arange(n)
+    bordi = np.linspace(0, n, secchi + 1).astype(np.int64)[:-1]
+    indice = np.arange(n)
+    # argmin/argmax per secchio: si ordina per (secchio, valore) e si prendono gli estremi
+    secchio = np.searchsorted(bordi, indice, side="right") - 1
+    ordine = np.lexsort((y, secchio))
+    primi = np.searchsorted(secchio[ordine], np.arange(secchi), side="left")
+    ultimi = np.append(primi[1:], n) - 1
+    scelti = np.unique(np.concatenate([ordine[primi], ordine[ultimi], [0, n - 1]]))
+    return scelti
+
+def riduci(x, y, punti, metodo="lttb"):
+    """Indici dei punti da disegnare per una serie larga `punti` pixel: al più `punti`, estremi compresi."""
+    if len(x) <= punti:
+        return np.arange(len(x))
+    if metodo == "minmax" and punti >= 4:
+        # due punti per secchio, più il primo e l'ultimo se non sono già un minimo o un massimo
+        return min_max(x, y, max(1, (punti - 2) // 2))
+    return lttb(x, y, punti)
+
+
+def giorni_matplotlib(date):
+    """Date ("YYYY-MM-DD", datetime64 o date) -> numeri di giorno come li usa matplotlib (dal 1970-01-01)."""
+    return np.asarray(date, dtype="datetime64[D]").astype(np.int64).astype(np.float64)
+
+
+class GraficoSerie:
+    """Figura e canvas Tk riusati: mostra() cambia i dati della linea, non ricrea il grafico."""
+
+    def __init__(self, master, titolo="", etichetta_y="", colore="green", dimensione=(5, 2.5), metodo="lttb"):
+        # matplotlib si importa solo quando serve davvero un grafico
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.metodo = metodo
+        self.figura = Figure(figsize=dimensione)
+        self.assi = self.figura.add_subplot()
+        self.assi.set_title(titolo)
+        self.assi.set_ylabel(etichetta_y)
+        self.assi.grid(True)
+        self.assi.xaxis_date()
+        (self.linea,) = self.assi.plot([], [], color=colore)
+        self.canvas = FigureCanvasTkAgg(self.figura, master=master)
+        self.widget = self.canvas.get_tk_widget()
+
+        self._x = self._y = None
+        self._versione = None
+        self._cache = OrderedDict()  # (versione, larghezza, altezza) -> (x, y, limiti, immagine)
+        self._attesa = None
+        self.widget.bind("<Configure>", self._ridimensionato, add="+")
+        self.widget.bind("<Destroy>", self._distrutto, add="+")
+
+    def _dimensione(self):
+        larghezza, altezza = self.figura.get_size_inches() * self.figura.dpi
+        return int(larghezza), int(altezza)
+
+    def mostra(self, date, valori, versione=None):
+        """Disegna la serie (date, valori). versione identifica i dati: se non data si calcola dal contenuto."""
+        x = giorni_matplotlib(date)
+        y = np.asarray(valori, dtype=np.float64)
+        if versione is None:
+            versione = hash((x.tobytes(), y.tobytes()))
+        self._x, self._y, self._versione = x, y, versione
+        self._disegna()
+
+    def _disegna(self):
+        if self._x is None:
+            return
+        larghezza, altezza = self._dimensione()
+        chiave = (self._versione, larghezza, altezza)
+        voce = self._cache.get(chiave)
+        if voce is not None:
+            self._cache.move_to_end(chiave)
+            x, y, limiti, immagine = voce
+            self.linea.set_data(x, y)
+            self.assi.set_xlim(limiti[0])
+            self.assi.set_ylim(limiti[1])
+            if immagine is not None:
+                try:
+                    # disegno già pronto: si copia l'immagine invece di ridisegnare
+                    self.canvas.restore_region(immagine)
+                    self.canvas.blit(self.figura.bbox)
+                    return
+                except Exception:
+                    pass
+            self.canvas.draw()
+            return
+
+        indici = riduci(self._x, self._y, max(3, int(larghezza * PUNTI_PER_PIXEL)), self.metodo)
+        x, y = self._x[indici], self._y[indici]
+        self.linea.set_data(x, y)
+        self.assi.relim()
+        self.assi.autoscale_view()
+        self.figura.autofmt_xdate()
+        self.canvas.draw()
+        try:
+            immagine = self.canvas.copy_from_bbox(self.figura.bbox)
+        except Exception:
+            immagine = None
+        self._cache[chiave] = (x, y, (self.assi.get_xlim(), self.assi.get_ylim()), immagine)
+        while len(self._cache) > MAX_CACHE:
+            self._cache.popitem(last=False)
+
+    def _ridimensionato(self, event):
+        # FigureCanvasTkAgg ridimensiona la figura da solo; qui si ricalcola la riduzione a fine trascinamento
+        if self._attesa is not None:
+            self.widget.after_cancel(self._attesa)
+        self._attesa = self.widget.after(ATTESA_RESIZE, self._dopo_resize)
+
+    def _dopo_resize(self):
+        self._attesa = None
+        self._disegna()
+
+    def _distrutto(self, event):
+        if event.widget is not self.widget:
+            return
+        # libera subito immagini in cache e artisti, senza aspettare il garbage collector
+        self._cache.clear()
+        self._x = self._y = None
+        self.figura.clear()
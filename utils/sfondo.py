@@ -1,7 +1,21 @@
+import hashlib
 import os
 import random
+import threading
 from PIL import Image, ImageTk
 
+CARTELLA_CACHE = "data/cache_sfondi"
+PASSO_DIMENSIONE = 50  # le dimensioni si arrotondano per eccesso: meno varianti da preparare e salvare
+MAX_IN_MEMORIA = 8
+
+# trasparenza al 50% come tabella: point() con una lista non richiama python per ogni pixel
+ALPHA_LUT = [p // 2 for p in range(256)]
+
+_lock = threading.Lock()
+_hash_sorgenti = {}  # percorso -> ((mtime_ns, size), hash del contenuto)
+_in_memoria = {}     # (hash, dimensione) -> Image, in ordine d'uso
+
+
 def scegli_sfondo_casuale(cartella_sfondi: str):
     immagini = [f for f in os.listdir(cartella_sfondi) if f.lower().endswith((".png", ".jpg", ".jpeg"))]
     if not immagini:
@@ -9,13 +23,73 @@ def scegli_sfondo_casuale(cartella_sfondi: str):
     return os.path.join(cartella_sfondi, random.choice(immagini))
 
 
-def ridimensiona_sfondo(percorso, dimensione):
+def dimensione_cache(dimensione):
+    def arrotonda(n):
+        return max(PASSO_DIMENSIONE, -(-n // PASSO_DIMENSIONE) * PASSO_DIMENSIONE)
+    larghezza, altezza = dimensione
+    return arrotonda(larghezza), arrotonda(altezza)
+
+
+def _hash_sorgente(percorso):
+    stat = os.stat(percorso)
+    firma = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        noto = _hash_sorgenti.get(percorso)
+    if noto and noto[0] == firma:
+        return noto[1]
+    h = hashlib.sha1()
+    with open(percorso, "rb") as f:
+        for blocco in iter(lambda: f.read(1 << 16), b""):
+            h.update(blocco)
+    with _lock:
+        _hash_sorgenti[percorso] = (firma, h.hexdigest())
+    return h.hexdigest()
+
+
+def _scala(percorso, dimensione):
     img = Image.open(percorso).convert("RGBA")
     img = img.resize(dimensione, Image.Resampling.LANCZOS)
 
     # Applica trasparenza al 50%
-    alpha = img.getchannel("A")
-    alpha = alpha.point(lambda p: int(p * 0.5))
-    img.putalpha(alpha)
+    img.putalpha(img.getchannel("A").point(ALPHA_LUT))
+    return img
+
+
+def prepara_sfondo(percorso, dimensione):
+    """Sfondo scalato e semitrasparente, da memoria o da disco se già preparato.
+
+    solo PIL, niente Tk: può girare in un thread di lavoro. La chiave è (hash del file, dimensione),
+    quindi sostituire un'immagine in sfondi/ invalida da sola le sue varianti.
+    """
+    dimensione = dimensione_cache(dimensione)
+    chiave = (_hash_sorgente(percorso), dimensione)
+    with _lock:
+        img = _in_memoria.pop(chiave, None)
+        if img is not None:
+            _in_memoria[chiave] = img
+            return img
 
-    return ImageTk.PhotoImage(img)
+    file_cache = os.path.join(CARTELLA_CACHE, f"{chiave[0]}_{dimensione[0]}x{dimensione[1]}.png")
+    try:
+        with Image.open(file_cache) as salvata:
+            img = salvata.copy()
+    except OSError:  # non ancora in cache (o file illeggibile): si rifà
+        img = _scala(percorso, dimensione)
+        try:
+            os.makedirs(CARTELLA_CACHE, exist_ok=True)
+            tmp = f"{file_cache}.{threading.get_ident()}.tmp"
+            img.save(tmp, format="PNG")
+            os.replace(tmp, file_cache)
+        except OSError as e:
+            print(f"Impossibile salvare lo sfondo in cache: {e}")
+
+    with _lock:
+        _in_memoria[chiave] = img
+        while len(_in_memoria) > MAX_IN_MEMORIA:
+            del _in_memoria[next(iter(_in_memoria))]
+    return img
+
+
+def ridimensiona_sfondo(percorso, dimensione):
+    # la PhotoImage va creata sul thread di Tk
+    return ImageTk.PhotoImage(prepara_sfondo(percorso, dimensione))